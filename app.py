@@ -1,96 +1,496 @@
 from quart import Quart, request, jsonify, Response
-from scripts.categorizing.llama3_classification import categorize
+from scripts.categorizing.fast_classifier import FastClassifier
+from scripts.categorizing.llama3_classification import categorize, category_index, embedding_executor
+from scripts.categorizing.llm_classifier import LlmClassifier
+from scripts.categorizing.ollama_client import OllamaClient
+from scripts.categorizing.url_type import UrlRuleEngine
+from scripts.common import metrics
+from scripts.common.log import get_logger, setup_logging
+from scripts.common.urls import normalize_url
+from scripts.common.metrics import collect_timings, span
+from scripts.scraping.browser_pool import BrowserPool
+from scripts.scraping.check_domain_country import CountryResolver, get_domain_country
+from scripts.scraping.http_fetcher import HttpFetcher
+from scripts.scraping.language_detector import make_detector
+from scripts.scraping.readiness import PageReadiness
 from scripts.scraping.scrape import scrape_all_websites
+from scripts.server.concurrency import AdaptiveConcurrency, HostLimiter
+from scripts.server.jobs import BatchJobManager
+from scripts.server.pipeline import staged
+from scripts.server.scheduler import JobScheduler, QueueFullError, coerce_priority
+from scripts.server.singleflight import SingleFlight
+from scripts.server.workers import WorkerPool
+from scripts.storage.content_store import ContentStore, coerce_record_id
+from scripts.storage.result_store import ResultStore, content_hash
 import asyncio
+import config
 import json
-import os
+
+setup_logging(config.LOG_LEVEL)
+log = get_logger(__name__)
 
 app = Quart(__name__)
+# Batch job uploads can be far larger and slower than Quart's defaults allow
+app.config["MAX_CONTENT_LENGTH"] = config.MAX_UPLOAD_BYTES
+app.config["BODY_TIMEOUT"] = config.UPLOAD_TIMEOUT
+
+scheduler = JobScheduler(
+    capacity=config.MAX_TABS,
+    max_active_jobs=config.MAX_ACTIVE_JOBS,
+    max_queued_jobs=config.MAX_QUEUED_JOBS,
+)
+
+# Sites of one registrable domain scraped at once, across all requests
+host_limiter = HostLimiter(config.PER_DOMAIN_TABS) if config.PER_DOMAIN_TABS else None
+
+browser_pool = BrowserPool(
+    size=config.BROWSER_POOL_SIZE,
+    max_pages_per_browser=config.BROWSER_MAX_PAGES,
+    max_rss_mb=config.BROWSER_MAX_RSS_MB,
+)
+
+# Tabs follow page latency, failures, memory and CPU between the configured bounds
+tab_controller = AdaptiveConcurrency(
+    scheduler,
+    min_tabs=config.MIN_TABS,
+    max_tabs=config.TABS_LIMIT,
+    interval=config.TABS_INTERVAL,
+    target_seconds=config.TABS_TARGET_SECONDS,
+    max_error_rate=config.TABS_MAX_ERROR_RATE,
+    # Chromium of the server and of every worker process
+    rss_mb=browser_pool.rss_mb,
+    max_rss_mb=config.TABS_MAX_RSS_MB,
+    max_cpu_percent=config.TABS_MAX_CPU_PERCENT,
+    max_memory_percent=config.TABS_MAX_MEMORY_PERCENT,
+) if config.ADAPTIVE_TABS else None
+
+# When a page rendered in Chromium is read, and which failures are retried
+page_readiness = PageReadiness(
+    deadline=config.PAGE_DEADLINE,
+    min_chars=config.PAGE_READY_CHARS,
+    stable_for=config.PAGE_STABLE_SECONDS,
+    max_attempts=config.PAGE_MAX_ATTEMPTS,
+    backoff=config.PAGE_RETRY_BACKOFF,
+)
+
+http_fetcher = HttpFetcher(
+    max_connections=config.HTTP_MAX_CONNECTIONS,
+    timeout=config.HTTP_TIMEOUT,
+    min_text_chars=config.HTTP_MIN_TEXT_CHARS,
+)
+
+ollama_client = OllamaClient(
+    config.OLLAMA_URL,
+    max_in_flight=config.OLLAMA_MAX_IN_FLIGHT,
+    keep_alive=config.OLLAMA_KEEP_ALIVE,
+)
+
+# Short pages from concurrent requests share one generation
+llm_classifier = LlmClassifier(
+    ollama_client,
+    batch_size=config.LLM_BATCH_SIZE,
+    max_item_tokens=config.LLM_BATCH_ITEM_TOKENS,
+    max_delay=config.LLM_BATCH_DELAY,
+    num_ctx=config.OLLAMA_NUM_CTX,
+)
+
+# Rules categorizing sites from their URL alone, reloaded when the file changes
+url_rules = UrlRuleEngine(config.URL_RULES_PATH)
+
+# Embedding classifier answering confident pages without the LLM
+fast_classifier = FastClassifier(
+    min_score=config.FAST_PATH_MIN_SCORE,
+    min_margin=config.FAST_PATH_MIN_MARGIN,
+    executor=embedding_executor,
+) if config.FAST_PATH else None
+
+country_resolver = CountryResolver(
+    max_workers=config.WHOIS_WORKERS,
+    cache_path=config.WHOIS_CACHE_PATH,
+    ttl=config.WHOIS_CACHE_TTL,
+    whois_server=config.WHOIS_SERVER,
+)
+
+content_store = ContentStore(config.CONTENT_STORE_DIR)
 
-request_queue = asyncio.Queue()
+language_detector = make_detector(config.LANGUAGE_DETECTOR)
+
+# Scrape worker processes, each building its own browsers, fetcher, resolver and detector
+worker_pool = WorkerPool(config.WORKER_PROCESSES, {
+    "log_level": config.LOG_LEVEL,
+    "browser_pool": {
+        "size": config.BROWSER_POOL_SIZE,
+        "max_pages_per_browser": config.BROWSER_MAX_PAGES,
+        "max_rss_mb": config.BROWSER_MAX_RSS_MB,
+    },
+    "http_fetcher": {
+        "max_connections": config.HTTP_MAX_CONNECTIONS,
+        "timeout": config.HTTP_TIMEOUT,
+        "min_text_chars": config.HTTP_MIN_TEXT_CHARS,
+    } if config.HTTP_FIRST else None,
+    "country_resolver": {
+        "max_workers": config.WHOIS_WORKERS,
+        "cache_path": config.WHOIS_CACHE_PATH,
+        "ttl": config.WHOIS_CACHE_TTL,
+        "whois_server": config.WHOIS_SERVER,
+    },
+    "language_detector": config.LANGUAGE_DETECTOR,
+    "readiness": {
+        "deadline": config.PAGE_DEADLINE,
+        "min_chars": config.PAGE_READY_CHARS,
+        "stable_for": config.PAGE_STABLE_SECONDS,
+        "max_attempts": config.PAGE_MAX_ATTEMPTS,
+        "backoff": config.PAGE_RETRY_BACKOFF,
+    },
+}) if config.WORKER_PROCESSES else None
+
+# Duplicate sites in flight, in any request, share one scrape and one label
+scrape_flights = SingleFlight() if config.DEDUP else None
+classify_flights = SingleFlight(remember=config.DEDUP_REMEMBER) if config.DEDUP else None
+
+result_store = ResultStore(
+    config.RESULT_CACHE_PATH,
+    content_ttl=config.RESULT_CONTENT_TTL,
+    country_ttl=config.RESULT_COUNTRY_TTL,
+)
+
+# Gauges read from the live objects whenever /metrics is scraped
+metrics.gauge("scraper_active_jobs", "Requests and batch chunks being processed").set_function(
+    lambda: len(scheduler.active))
+metrics.gauge("scraper_queued_jobs", "Requests and batch chunks waiting for a job slot").set_function(
+    lambda: len(scheduler.pending))
+metrics.gauge("scraper_tabs_in_use", "Scheduler tab slots in use").set_function(lambda: scheduler.in_use)
+metrics.gauge("scraper_tabs_capacity", "Scheduler tab slots available").set_function(lambda: scheduler.capacity)
+metrics.gauge("scraper_browser_open_pages", "Open Chromium pages").set_function(lambda: browser_pool.open_pages)
+metrics.gauge("scraper_browser_rss_mb", "Chromium memory at the last check, in MB").set_function(
+    lambda: browser_pool.last_rss_mb)
+metrics.gauge("scraper_ollama_in_flight", "Generations sent to Ollama and not yet answered").set_function(
+    lambda: ollama_client.in_flight)
+metrics.gauge("scraper_content_store_pending", "Content records queued for writing").set_function(
+    lambda: content_store.pending)
+if worker_pool:
+    metrics.gauge("scraper_worker_in_flight", "Sites sent to scrape workers and not yet answered").set_function(
+        lambda: worker_pool.in_flight)
 
 @app.before_serving
 async def startup():
-    """ Start the request processor when the app starts. """
-    asyncio.create_task(process_requests())
+    """ Launch the shared browsers and LLM connections before accepting requests. """
+    if worker_pool:
+        # Each worker starts its own browsers and loads its own language model
+        await worker_pool.start()
+    else:
+        await browser_pool.start()
+        await http_fetcher.start()
+        await asyncio.get_running_loop().run_in_executor(None, language_detector.load)
+    await ollama_client.start()
+    await content_store.start()
+    # Map the category embeddings now, building them only if the categories changed
+    await asyncio.get_running_loop().run_in_executor(None, category_index.load)
+    if fast_classifier:
+        await asyncio.get_running_loop().run_in_executor(None, fast_classifier.load)
+    url_rules.load()
+    if tab_controller:
+        await tab_controller.start()
+    # Resume batch jobs interrupted by the last shutdown
+    await job_manager.start()
 
-async def process_requests():
-    """ Process requests sequentially from the queue. """
-    while True:
-        request_data, response_future = await request_queue.get()
-        response_generator = await handle_request(request_data)
-        response_future.set_result(response_generator)  # Send generator back to waiting request
-        request_queue.task_done()
+@app.after_serving
+async def shutdown():
+    await job_manager.close()
+    if tab_controller:
+        await tab_controller.close()
+    if worker_pool:
+        await worker_pool.close()
+    else:
+        await browser_pool.close()
+        await http_fetcher.close()
+    await ollama_client.close()
+    country_resolver.close()
+    result_store.close()
+    # Write out everything still queued before exiting
+    await content_store.close()
 
 async def save_content(record_id, content):
-    """ Saves the scraped content in the appropriate directory. """
-    base_dir = "data"
-    
-    # Determine folder paths based on record_id
-    folder_100k = os.path.join(base_dir, str((record_id // 100000) * 100000))
-    folder_10k = os.path.join(folder_100k, str((record_id // 10000) * 10000))
-    folder_1k = os.path.join(folder_10k, str((record_id // 1000) * 1000))
-    
-    # Ensure folders exist
-    os.makedirs(folder_1k, exist_ok=True)
-    
-    # Save content in file
-    file_path = os.path.join(folder_1k, f"{record_id}.txt")
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(content)
-
-async def handle_request(request_data):
-    """ Processes the request and returns a response generator. """
-    domains_dict = request_data["domains"]
+    """ Queues the scraped content for the packed content store. """
+    with span("save_content"):
+        await content_store.put(record_id, content)
+
+async def process_sites(domains_dict, job, refresh=False, timings=False):
+    """ Scrapes and categorizes the sites of `domains_dict` (site -> record_id) within a
+    scheduler job, yielding one response dict per site as it completes.
+
+    With `refresh` stored results are ignored and everything is scraped and
+    classified again. With `timings` each scraped result carries the seconds
+    spent per stage.
+    """
     domain_list = list(domains_dict.keys())
+    stored = {}
 
-    async def generate_results():
-        async for result in scrape_all_websites(domain_list, max_tabs=10):
-            record_id = domains_dict.get(result["site"])
-
-            if result['content']:
-                categorized_data = categorize(result['site'], result['content'])
-                response_data = {
-                    "site": result['site'],
-                    "final_url": result['final_url'],
-                    "language": result['language'],
-                    "country": result['country'],
-                    "sub_domain": result['sub_domain'],
-                    "domain": result['domain'],
-                    "categorized": categorized_data
-                }
-
-                # Save content in appropriate directory
-                await save_content(record_id, result['content'])
+    async def serve_stored(site):
+        """ Answer a site from the result store without scraping it. """
+        record = stored[site]
+        response_data = {**record["response"], "site": site}
+        if not record["country_fresh"]:
+            response_data["country"] = await get_domain_country(site, country_resolver)
+            await result_store.update_country(site, response_data["country"])
 
+        content = await result_store.get_content(site)
+        await save_content(domains_dict.get(site), content)
+        response_data["cache"] = "hit"
+        return response_data
+
+    async def classify_result(result):
+        """ Second pipeline stage: categorize and store one scraped page. """
+        if result is None:
+            return None
+        record_id = domains_dict.get(result["site"])
+        with collect_timings() as classify_timings:
+            response_data = await build_response(result, record_id)
+        if timings:
+            response_data["timings"] = {**result.get("timings", {}), **classify_timings}
+        return response_data
+
+    async def build_response(result, record_id):
+        if result['content']:
+            previous = stored.get(result['site'])
+            if (previous and previous["content_hash"] == content_hash(result['content'])
+                    and not previous["response"].get("llm_failed")):
+                # Same page as last time, so the category can't have changed
+                cache_status = "content_match"
+                categorized_data = previous["response"]["categorized"]
+                details = {"classified_by": previous["response"].get("classified_by")}
+                shared = {}
             else:
-                response_data = {
-                    "site": result['site'],
-                    "message": f"Unable to scrape URL: {result['site']}"
-                }
+                cache_status = "miss"
+                with span("categorize"):
+                    categorized_data, details = await categorize(
+                        result['site'],
+                        result['content'],
+                        ollama_client,
+                        page=result,
+                        token_budget=config.PROMPT_TOKEN_BUDGET,
+                        fast_path=fast_classifier,
+                        url_rules=url_rules,
+                        llm=llm_classifier,
+                        flights=classify_flights,
+                        # Parked domains redirect to a few landing pages, or serve the same one
+                        flight_keys=[("final_url", normalize_url(result['final_url'])),
+                                     ("content", content_hash(result['content']))],
+                        fresh=refresh,
+                    )
+            # Whose label was reused is news for this response, not part of the stored result
+            shared = {key: details.pop(key) for key in ("shared", "shared_with") if key in details}
+            response_data = {
+                "site": result['site'],
+                "final_url": result['final_url'],
+                "language": result['language'],
+                "language_confidence": result['language_confidence'],
+                "country": result['country'],
+                "sub_domain": result['sub_domain'],
+                "domain": result['domain'],
+                "tier": result['tier'],
+                "categorized": categorized_data,
+                **details
+            }
+
+            # Save content in appropriate directory
+            await save_content(record_id, result['content'])
+            with span("result_store"):
+                await result_store.put(result['site'], response_data, result['content'])
+            response_data["cache"] = cache_status
+            response_data.update(shared)
 
-            yield f"{json.dumps({'data': response_data})}\n\n"
+        else:
+            response_data = {
+                "site": result['site'],
+                "message": f"Unable to scrape URL: {result['site']}",
+                "failure_reason": result.get('failure_reason'),
+                "cache": "miss"
+            }
+
+        # A site scraped as a duplicate shared everything with the one actually scraped
+        if result.get('shared'):
+            response_data.update(shared=result['shared'], shared_with=result['shared_with'])
+        return response_data
+
+    if config.RESULT_CACHE and not refresh:
+        stored.update(await result_store.get_many(domain_list))
+
+    # Sites with a fresh stored result are answered straight away
+    to_scrape = []
+    for site in domain_list:
+        if site in stored and stored[site]["content_fresh"]:
+            yield await serve_stored(site)
+        else:
+            to_scrape.append(site)
+
+    scraped = scrape_all_websites(
+        to_scrape,
+        # The scheduler's slots bound the tabs; the window only has to stay above them
+        max_tabs=config.TABS_LIMIT if tab_controller else config.MAX_TABS,
+        slot=job.slot,
+        pool=browser_pool,
+        resolver=country_resolver,
+        fetcher=http_fetcher if config.HTTP_FIRST else None,
+        detector=language_detector,
+        workers=worker_pool,
+        host_limiter=host_limiter,
+        controller=tab_controller,
+        readiness=page_readiness,
+        flights=scrape_flights,
+    )
+    classified = staged(
+        scraped,
+        classify_result,
+        concurrency=config.CLASSIFY_CONCURRENCY,
+        queue_size=config.PIPELINE_QUEUE_SIZE,
+    )
+    try:
+        async for response_data in classified:
+            if response_data is not None:
+                yield response_data
+    finally:
+        await classified.aclose()
+
+job_manager = BatchJobManager(
+    config.JOBS_DIR,
+    process_sites,
+    scheduler,
+    chunk_size=config.JOB_CHUNK_SIZE,
+    max_running=config.MAX_RUNNING_BATCH_JOBS,
+)
+
+async def handle_request(request_data, job):
+    """ Processes the request and returns a response generator. """
+    domains_dict = request_data["domains"]
+    # "refresh": true ignores stored results and scrapes and classifies everything again
+    refresh = bool(request_data.get("refresh"))
+    # "timings": true adds the seconds spent per stage to every scraped result
+    timings = bool(request_data.get("timings"))
+
+    async def generate_results():
+        try:
+            async for response_data in process_sites(domains_dict, job, refresh, timings):
+                yield f"{json.dumps({'data': response_data})}\n\n"
+        except Exception as e:
+            # Tell the client the stream is cut short instead of just ending it
+            log.exception("request failed")
+            yield f"{json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Runs when the stream completes and when the SSE client disconnects
+            scheduler.finish(job)
 
     return generate_results
 
 @app.route("/scrape-categorize", methods=['POST'])
 async def enqueue_request():
-    """ Add request to queue and wait for the response generator. """
+    """ Admit the request to the scheduler and stream its results. """
     try:
         data = await request.get_json()
 
         if 'domains' not in data or not isinstance(data['domains'], dict):
             return jsonify({"error": "Invalid input, 'domains' should be a dictionary"}), 400
+        # Record ids name content store records; a bad one is refused here rather than failing a shared write
+        domains = {}
+        for site, record_id in data['domains'].items():
+            try:
+                domains[site] = coerce_record_id(record_id)
+            except ValueError as e:
+                return jsonify({"error": f"Invalid input for {site!r}: {e}"}), 400
+        data['domains'] = domains
+
+        try:
+            priority = coerce_priority(data.get("priority", 1))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid input: {e}"}), 400
+
+        try:
+            job = scheduler.submit(priority=priority)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 429
 
-        response_future = asyncio.Future()
-        await request_queue.put((data, response_future))
+        try:
+            # Wait for a free job slot before starting the stream
+            await scheduler.wait_admitted(job)
+            response_generator = await handle_request(data, job)
+        except BaseException:
+            scheduler.finish(job)
+            raise
 
-        # Wait for response generator
-        response_generator = await response_future
         return Response(response_generator(), mimetype="text/event-stream")
 
     except Exception as e:
+        log.exception("scrape request failed")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/metrics", methods=['GET'])
+async def get_metrics():
+    """ Metrics in the Prometheus text exposition format. """
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+async def read_upload(upload, chunk_size=64 * 1024):
+    """ Yields an uploaded file in chunks. """
+    while True:
+        chunk = upload.stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+@app.route("/jobs", methods=['POST'])
+async def create_job():
+    """ Start a batch job from an NDJSON domain list sent as the body or as a "file" upload. """
+    try:
+        try:
+            priority = coerce_priority(request.args.get("priority", 1))
+        except ValueError as e:
+            return jsonify({"error": f"Invalid input: {e}"}), 400
+        refresh = request.args.get("refresh", "false").lower() in ("1", "true")
+
+        if request.mimetype == "multipart/form-data":
+            files = await request.files
+            if "file" not in files:
+                return jsonify({"error": "Invalid input, expected an NDJSON 'file' upload"}), 400
+            chunks = read_upload(files["file"])
+        else:
+            # Written to disk as it arrives rather than buffered in memory
+            chunks = request.body
+
+        job_status = await job_manager.create(chunks, priority=priority, refresh=refresh)
+        return jsonify(job_status), 202
+
+    except Exception as e:
+        log.exception("batch job creation failed")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+async def get_job(job_id):
+    job_status = await job_manager.status(job_id)
+    if job_status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status)
+
+@app.route("/jobs/<job_id>/results", methods=['GET'])
+async def get_job_results(job_id):
+    """ A page of a batch job's results, available while the job is still running. """
+    job_status = await job_manager.status(job_id)
+    if job_status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 1000, type=int), 1), 10000)
+    results = await job_manager.results(job_id, offset, limit)
+    return jsonify({
+        "status": job_status["status"],
+        "offset": offset,
+        "next_offset": offset + len(results),
+        "results": results,
+    })
+
+@app.route("/jobs/<job_id>", methods=['DELETE'])
+async def cancel_job(job_id):
+    job_status = await job_manager.cancel(job_id)
+    if job_status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,138 @@
+""" Server settings, each overridable through an environment variable. """
+import os
+
+# Number of browser tabs shared by all running requests
+MAX_TABS = int(os.environ.get("SCRAPER_MAX_TABS", 10))
+
+# Requests processed at the same time, and requests allowed to wait behind them
+MAX_ACTIVE_JOBS = int(os.environ.get("SCRAPER_MAX_ACTIVE_JOBS", 4))
+MAX_QUEUED_JOBS = int(os.environ.get("SCRAPER_MAX_QUEUED_JOBS", 32))
+
+# Long-lived Chromium browsers shared by all requests, recycled after a number
+# of pages or when their combined memory goes over the limit
+BROWSER_POOL_SIZE = int(os.environ.get("SCRAPER_BROWSER_POOL_SIZE", 2))
+BROWSER_MAX_PAGES = int(os.environ.get("SCRAPER_BROWSER_MAX_PAGES", 500))
+BROWSER_MAX_RSS_MB = int(os.environ.get("SCRAPER_BROWSER_MAX_RSS_MB", 4096))
+
+# Scrape in this many worker processes, each with its own BROWSER_POOL_SIZE
+# browsers, HTTP fetcher and WHOIS lookups; 0 scrapes in the server process
+WORKER_PROCESSES = int(os.environ.get("SCRAPER_WORKERS", 0))
+
+# Adaptive tabs: starting from SCRAPER_MAX_TABS, the number of tabs is cut
+# every SCRAPER_TABS_INTERVAL seconds when the p90 page time goes over
+# SCRAPER_TABS_TARGET_SECONDS, more than SCRAPER_TABS_MAX_ERROR_RATE of the
+# rendered sites fail transiently, or Chromium memory, system memory or CPU go over their limits,
+# and raised by one while sites wait for a tab, within SCRAPER_MIN_TABS and
+# SCRAPER_TABS_LIMIT. At most SCRAPER_PER_DOMAIN_TABS sites of one
+# registrable domain are scraped at once (0 for no limit).
+ADAPTIVE_TABS = os.environ.get("SCRAPER_ADAPTIVE_TABS", "1") == "1"
+MIN_TABS = int(os.environ.get("SCRAPER_MIN_TABS", 2))
+TABS_LIMIT = int(os.environ.get("SCRAPER_TABS_LIMIT", max(MAX_TABS, 4 * (os.cpu_count() or 1))))
+TABS_INTERVAL = float(os.environ.get("SCRAPER_TABS_INTERVAL", 10))
+TABS_TARGET_SECONDS = float(os.environ.get("SCRAPER_TABS_TARGET_SECONDS", 10))
+TABS_MAX_ERROR_RATE = float(os.environ.get("SCRAPER_TABS_MAX_ERROR_RATE", 0.5))
+TABS_MAX_RSS_MB = int(os.environ.get("SCRAPER_TABS_MAX_RSS_MB",
+                                     0.8 * BROWSER_MAX_RSS_MB * max(1, WORKER_PROCESSES)))
+TABS_MAX_CPU_PERCENT = float(os.environ.get("SCRAPER_TABS_MAX_CPU_PERCENT", 90))
+TABS_MAX_MEMORY_PERCENT = float(os.environ.get("SCRAPER_TABS_MAX_MEMORY_PERCENT", 90))
+PER_DOMAIN_TABS = int(os.environ.get("SCRAPER_PER_DOMAIN_TABS", 2))
+
+# Ollama endpoint, the number of generations allowed in flight at once and how
+# long Ollama keeps the model loaded after a request
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", 4))
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Pages whose compressed prompt is at most LLM_BATCH_ITEM_TOKENS tokens are
+# classified up to LLM_BATCH_SIZE per generation, waiting at most
+# LLM_BATCH_DELAY seconds for company. LLM_BATCH_SIZE=1 sends one per page.
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", 8))
+LLM_BATCH_ITEM_TOKENS = int(os.environ.get("LLM_BATCH_ITEM_TOKENS", 384))
+LLM_BATCH_DELAY = float(os.environ.get("LLM_BATCH_DELAY", 0.05))
+
+# Context window, in tokens, asked of Ollama for every generation. It has to
+# hold a whole batch: LLM_BATCH_SIZE pages of LLM_BATCH_ITEM_TOKENS, or one
+# page of PROMPT_TOKEN_BUDGET, plus the instructions.
+OLLAMA_NUM_CTX = int(os.environ.get("OLLAMA_NUM_CTX", 8192))
+
+# Scrape -> classify pipeline: classification workers per request and the
+# size of the bounded queues between the stages
+CLASSIFY_CONCURRENCY = int(os.environ.get("SCRAPER_CLASSIFY_CONCURRENCY", 4))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("SCRAPER_PIPELINE_QUEUE_SIZE", 32))
+
+# WHOIS country lookups: worker threads, on-disk cache and its lifetime in
+# seconds. WHOIS_SERVER ("host:port") sends every query to one server instead
+# of the registry's, e.g. a local stand-in.
+WHOIS_WORKERS = int(os.environ.get("WHOIS_WORKERS", 8))
+WHOIS_CACHE_PATH = os.environ.get("WHOIS_CACHE_PATH", "cache/whois.sqlite3")
+WHOIS_CACHE_TTL = int(os.environ.get("WHOIS_CACHE_TTL", 30 * 86400))
+WHOIS_SERVER = os.environ.get("WHOIS_SERVER") or None
+
+# Plain HTTP fetch tried before rendering a site in Chromium. Pages with less
+# extracted text than HTTP_MIN_TEXT_CHARS, or that look like JavaScript apps,
+# are escalated to the browser; sites it can't reach at all (unknown host,
+# refused connection, TLS errors) are reported failed without one.
+HTTP_FIRST = os.environ.get("SCRAPER_HTTP_FIRST", "1") == "1"
+HTTP_MAX_CONNECTIONS = int(os.environ.get("SCRAPER_HTTP_MAX_CONNECTIONS", 100))
+HTTP_TIMEOUT = float(os.environ.get("SCRAPER_HTTP_TIMEOUT", 10))
+HTTP_MIN_TEXT_CHARS = int(os.environ.get("SCRAPER_HTTP_MIN_TEXT_CHARS", 500))
+
+# Pages rendered in Chromium: a site gets SCRAPER_PAGE_DEADLINE seconds in all
+# and is read once it shows SCRAPER_PAGE_READY_CHARS characters of text or its
+# text stopped changing for SCRAPER_PAGE_STABLE_SECONDS. Transient failures
+# (timeouts, resets, HTTP 5xx) get up to SCRAPER_PAGE_MAX_ATTEMPTS attempts
+# with a backoff starting at SCRAPER_PAGE_RETRY_BACKOFF seconds.
+PAGE_DEADLINE = float(os.environ.get("SCRAPER_PAGE_DEADLINE", 30))
+PAGE_READY_CHARS = int(os.environ.get("SCRAPER_PAGE_READY_CHARS", 2000))
+PAGE_STABLE_SECONDS = float(os.environ.get("SCRAPER_PAGE_STABLE_SECONDS", 1.0))
+PAGE_MAX_ATTEMPTS = int(os.environ.get("SCRAPER_PAGE_MAX_ATTEMPTS", 2))
+PAGE_RETRY_BACKOFF = float(os.environ.get("SCRAPER_PAGE_RETRY_BACKOFF", 1.0))
+
+# Duplicate work: sites with the same normalized URL being scraped at once
+# share one scrape, and pages with the same final URL or content share one
+# label. The labels of the last SCRAPER_DEDUP_REMEMBER pages stay shared
+# after they are classified.
+DEDUP = os.environ.get("SCRAPER_DEDUP", "1") == "1"
+DEDUP_REMEMBER = int(os.environ.get("SCRAPER_DEDUP_REMEMBER", 1024))
+
+# Approximate number of tokens of page content sent to the LLM per site
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 1024))
+
+# JSON rules that categorize a site from its URL alone; edits are picked up
+# without a restart
+URL_RULES_PATH = os.environ.get("URL_RULES_PATH", "scripts/categorizing/url_rules.json")
+
+# Embedding fast path: pages whose best category scores at least
+# FAST_PATH_MIN_SCORE and leads the runner-up by FAST_PATH_MIN_MARGIN are
+# classified without the LLM
+FAST_PATH = os.environ.get("FAST_PATH", "1") == "1"
+FAST_PATH_MIN_SCORE = float(os.environ.get("FAST_PATH_MIN_SCORE", 0.45))
+FAST_PATH_MIN_MARGIN = float(os.environ.get("FAST_PATH_MIN_MARGIN", 0.08))
+
+# Stored results per domain. A repeated domain is answered from the store
+# while its content is younger than RESULT_CONTENT_TTL seconds; its country
+# is looked up again once older than RESULT_COUNTRY_TTL.
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "1") == "1"
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", "cache/results.sqlite3")
+RESULT_CONTENT_TTL = int(os.environ.get("RESULT_CONTENT_TTL", 7 * 86400))
+RESULT_COUNTRY_TTL = int(os.environ.get("RESULT_COUNTRY_TTL", 90 * 86400))
+
+# Packed, append-only store for scraped page content
+CONTENT_STORE_DIR = os.environ.get("CONTENT_STORE_DIR", "data/store")
+
+# Language identification backend: "fasttext" (sampled text, batched) or
+# "langdetect" (the previous detector)
+LANGUAGE_DETECTOR = os.environ.get("LANGUAGE_DETECTOR", "fasttext")
+
+# Batch jobs submitted to /jobs as NDJSON domain lists. Each job is processed
+# JOB_CHUNK_SIZE lines at a time with a checkpoint after every chunk, and at
+# most MAX_RUNNING_BATCH_JOBS run at once. Uploads larger than
+# MAX_UPLOAD_BYTES or slower than UPLOAD_TIMEOUT seconds are rejected.
+JOBS_DIR = os.environ.get("JOBS_DIR", "jobs")
+JOB_CHUNK_SIZE = int(os.environ.get("JOB_CHUNK_SIZE", 500))
+MAX_RUNNING_BATCH_JOBS = int(os.environ.get("MAX_RUNNING_BATCH_JOBS", 2))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 1024 * 1024 * 1024))
+UPLOAD_TIMEOUT = int(os.environ.get("UPLOAD_TIMEOUT", 600))
+
+# Lowest level of the key=value log lines written to stderr
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
@@ -0,0 +1,110 @@
+""" Compare the packed content store with the old one-file-per-record layout.
+
+Usage:
+    python -m scripts.benchmarks.content_store_benchmark [--records N] [--reads N] [--size BYTES]
+
+Writes the same synthetic records with both layouts in a temporary
+directory, then measures random-read latency for each.
+"""
+from scripts.storage.content_store import ContentStore
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+WORDS = "news shop travel sports music health finance games education software cloud hosting".split()
+
+
+def make_content(size, rng):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def write_files(base_dir, records):
+    """ The previous save_content layout: one .txt file per record. """
+    for record_id, content in records:
+        folder_100k = os.path.join(base_dir, str((record_id // 100000) * 100000))
+        folder_10k = os.path.join(folder_100k, str((record_id // 10000) * 10000))
+        folder_1k = os.path.join(folder_10k, str((record_id // 1000) * 1000))
+        os.makedirs(folder_1k, exist_ok=True)
+        with open(os.path.join(folder_1k, f"{record_id}.txt"), "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+def read_file(base_dir, record_id):
+    folder_100k = os.path.join(base_dir, str((record_id // 100000) * 100000))
+    folder_10k = os.path.join(folder_100k, str((record_id // 10000) * 10000))
+    folder_1k = os.path.join(folder_10k, str((record_id // 1000) * 1000))
+    with open(os.path.join(folder_1k, f"{record_id}.txt"), "r", encoding="utf-8") as file:
+        return file.read()
+
+
+async def write_packed(store, records):
+    for record_id, content in records:
+        await store.put(record_id, content)
+    await store.flush()
+
+
+def read_latencies(read, ids):
+    latencies = []
+    for record_id in ids:
+        start = time.perf_counter()
+        read(record_id)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=4000, help="approximate bytes per record")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = [(record_id, make_content(args.size, rng)) for record_id in range(args.records)]
+    read_ids = [rng.randrange(args.records) for _ in range(args.reads)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir = os.path.join(tmp, "files")
+        start = time.perf_counter()
+        write_files(files_dir, records)
+        files_write = time.perf_counter() - start
+        files_p50, files_p99 = read_latencies(lambda record_id: read_file(files_dir, record_id), read_ids)
+
+        store = ContentStore(os.path.join(tmp, "packed"))
+
+        async def run_packed():
+            start = time.perf_counter()
+            await write_packed(store, records)
+            elapsed = time.perf_counter() - start
+            await store.close()
+            return elapsed
+
+        packed_write = asyncio.run(run_packed())
+        reader = ContentStore(os.path.join(tmp, "packed"))
+        packed_p50, packed_p99 = read_latencies(reader.get, read_ids)
+
+        print(f"{args.records} records of ~{args.size} bytes, {args.reads} random reads\n")
+        print(f"{'layout':<16} {'writes/s':>10} {'read p50 us':>12} {'read p99 us':>12} {'files':>8}")
+        print(f"{'file per record':<16} {args.records / files_write:>10.0f} {files_p50 * 1e6:>12.1f} "
+              f"{files_p99 * 1e6:>12.1f} {count_files(files_dir):>8}")
+        print(f"{'packed':<16} {args.records / packed_write:>10.0f} {packed_p50 * 1e6:>12.1f} "
+              f"{packed_p99 * 1e6:>12.1f} {count_files(os.path.join(tmp, 'packed')):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+""" Measure how dispatcher memory grows with the number of domains.
+
+Usage:
+    python -m scripts.benchmarks.dispatch_benchmark [--sizes 1000,1000000] [--window N] [--eager-max N]
+
+Feeds an async stream of synthetic domains through the bounded-window
+dispatcher used by scrape_all_websites, with a stand-in scrape that only
+sleeps, and reports the peak traced memory for each input size. Sizes up to
+--eager-max are also run through the previous dispatcher, which created a
+task per domain up front, for comparison.
+"""
+from scripts.server.pipeline import windowed
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+
+async def domain_stream(count):
+    for i in range(count):
+        yield f"site-{i}.example.com"
+
+
+async def fake_scrape(site):
+    await asyncio.sleep(0)
+    return {"site": site, "content": None}
+
+
+async def run_windowed(count, window):
+    finished = 0
+    async for _ in windowed(domain_stream(count), fake_scrape, window):
+        finished += 1
+    return finished
+
+
+async def run_eager(count, window):
+    """ The previous dispatcher: a task for every domain, throttled by a semaphore. """
+    semaphore = asyncio.Semaphore(window)
+
+    async def scrape_with_semaphore(site):
+        async with semaphore:
+            return await fake_scrape(site)
+
+    tasks = [asyncio.create_task(scrape_with_semaphore(site)) async for site in domain_stream(count)]
+    finished = 0
+    for result in asyncio.as_completed(tasks):
+        await result
+        finished += 1
+    return finished
+
+
+def measure(run, count, window):
+    tracemalloc.start()
+    start = time.perf_counter()
+    finished = asyncio.run(run(count, window))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert finished == count
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,1000000", help="comma-separated numbers of domains")
+    parser.add_argument("--window", type=int, default=10, help="sites in flight, like SCRAPER_MAX_TABS")
+    parser.add_argument("--eager-max", type=int, default=100000, help="largest size run with the old dispatcher")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print(f"{'dispatcher':<10} {'domains':>10} {'peak memory':>12} {'time':>8} {'sites/s':>10}")
+    peaks = {}
+    for name, run in (("windowed", run_windowed), ("eager", run_eager)):
+        for count in sizes:
+            if name == "eager" and count > args.eager_max:
+                continue
+            peak, elapsed = measure(run, count, args.window)
+            peaks[name, count] = peak
+            print(f"{name:<10} {count:>10} {peak / 1024:>10.1f}KB {elapsed:>7.2f}s {count / elapsed:>10.0f}")
+
+    smallest, largest = min(sizes), max(sizes)
+    if smallest != largest:
+        growth = peaks["windowed", largest] / peaks["windowed", smallest]
+        print(f"\nWindowed peak memory at {largest} domains is {growth:.2f}x the peak at {smallest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+""" End-to-end throughput of /scrape-categorize against local stand-ins for the web, Ollama and WHOIS.
+
+Usage:
+    python -m scripts.benchmarks.e2e_benchmark [--sites 200] [--concurrency 5,10,20] [--requests 4]
+                                               [--baselines PATH] [--update-baselines] [--tolerance 0.2]
+
+Starts scripts.benchmarks.synthetic_sites, fake_ollama and fake_whois
+in-process, points the app at them through its settings and drives it with
+the Quart test client. At each concurrency level (browser tabs and dispatch
+window) `--sites` fresh synthetic sites are split over `--requests`
+concurrent requests asking for per-site timings. Reports sites per second,
+p50/p99 of every stage and the peak RSS of the process and its browsers.
+
+Levels slower than their stored baseline, or using more memory, by more than
+`--tolerance` fail the run with exit code 1, as do levels without a
+baseline; without a baselines file at all the run exits with 2.
+`--update-baselines` records the current numbers instead. Chromium, the embedding model and the fastText
+model must already be installed or cached; stores and caches go to a
+temporary directory.
+"""
+from scripts.benchmarks import fake_ollama, fake_whois, synthetic_sites
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import psutil
+import shutil
+import sys
+import tempfile
+import time
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "e2e_baselines.json")
+
+# Seconds a stage percentile may grow beyond the tolerance, so tiny stages don't fail on noise
+STAGE_SLACK = 0.05
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class RssSampler:
+    """ Peak resident memory of this process and all its children, sampled in the background. """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._task = None
+
+    def sample(self):
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        self.peak_mb = max(self.peak_mb, total / (1024 * 1024))
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_mb = 0.0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+        return self.peak_mb
+
+
+async def post_sites(client, domains):
+    response = await client.post("/scrape-categorize", json={"domains": domains, "timings": True})
+    body = await response.get_data(as_text=True)
+    if response.status_code != 200:
+        raise RuntimeError(f"Request failed with status {response.status_code}: {body[:200]}")
+    return [json.loads(line)["data"] for line in body.splitlines() if line.strip()]
+
+
+async def run_level(server, client, level, sites, requests, first_record_id):
+    server.scheduler.set_capacity(level)
+    server.config.MAX_TABS = level
+    records = [(site, first_record_id + i) for i, site in enumerate(sites)]
+    groups = [dict(records[i::requests]) for i in range(requests) if records[i::requests]]
+    sampler = RssSampler()
+
+    sampler.start()
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(post_sites(client, group) for group in groups))
+    elapsed = time.perf_counter() - start
+    peak_mb = await sampler.stop()
+
+    results = [result for response in responses for result in response]
+    stages = {}
+    for result in results:
+        for stage, seconds in result.get("timings", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "sites": len(results),
+        "failed": sum("message" in result for result in results),
+        "seconds": round(elapsed, 2),
+        "sites_per_sec": round(len(results) / elapsed, 2),
+        "peak_rss_mb": round(peak_mb),
+        "stages": {stage: {"p50": round(percentile(values, 0.5), 4), "p99": round(percentile(values, 0.99), 4)}
+                   for stage, values in sorted(stages.items())},
+    }
+
+
+def regressions(current, baselines, tolerance):
+    """ Descriptions of every number of `current` that is worse than its baseline beyond the tolerance. """
+    found = []
+    for level, numbers in current.items():
+        baseline = baselines.get(level)
+        if not baseline:
+            found.append(f"concurrency {level}: no baseline")
+            continue
+        if numbers["sites_per_sec"] < baseline["sites_per_sec"] * (1 - tolerance):
+            found.append(f"concurrency {level}: {numbers['sites_per_sec']} sites/s, "
+                         f"baseline {baseline['sites_per_sec']}")
+        if numbers["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+            found.append(f"concurrency {level}: peak RSS {numbers['peak_rss_mb']} MB, "
+                         f"baseline {baseline['peak_rss_mb']} MB")
+        for stage, expected in baseline["stages"].items():
+            measured = numbers["stages"].get(stage)
+            for key in ("p50", "p99") if measured else ():
+                if measured[key] > expected[key] * (1 + tolerance) + STAGE_SLACK:
+                    found.append(f"concurrency {level}: {stage} {key} {measured[key]}s, baseline {expected[key]}s")
+    return found
+
+
+def print_level(level, numbers):
+    print(f"concurrency {level}: {numbers['sites']} sites ({numbers['failed']} failed) in {numbers['seconds']}s, "
+          f"{numbers['sites_per_sec']} sites/s, peak RSS {numbers['peak_rss_mb']} MB")
+    print(f"  {'stage':<14} {'p50':>8} {'p99':>8}")
+    for stage, quantiles in numbers["stages"].items():
+        print(f"  {stage:<14} {quantiles['p50']:>8.3f} {quantiles['p99']:>8.3f}")
+    print()
+
+
+async def main(args, work_dir):
+    levels = [int(level) for level in args.concurrency.split(",")]
+    sites = synthetic_sites.SyntheticSites(args.slow_delay, huge_mb=args.huge_mb)
+    sites_runner, sites_port = await synthetic_sites.serve(sites)
+    ollama_runner, ollama_url = await fake_ollama.serve(
+        fake_ollama.FakeOllama(args.llm_latency, args.llm_token_latency, args.llm_parallel))
+    whois_server, whois_address = await fake_whois.serve(fake_whois.FakeWhois(args.whois_latency))
+
+    # The app reads its settings on import, so they are set before it is loaded
+    os.environ.update({
+        "OLLAMA_URL": ollama_url,
+        "WHOIS_SERVER": whois_address,
+        "SCRAPER_MAX_TABS": str(max(levels)),
+        # Each level runs at a fixed number of tabs
+        "SCRAPER_ADAPTIVE_TABS": "0",
+        "SCRAPER_MAX_ACTIVE_JOBS": str(args.requests),
+        "RESULT_CACHE": "0",
+        "RESULT_CACHE_PATH": os.path.join(work_dir, "results.sqlite3"),
+        "WHOIS_CACHE_PATH": os.path.join(work_dir, "whois.sqlite3"),
+        "CONTENT_STORE_DIR": os.path.join(work_dir, "store"),
+        "JOBS_DIR": os.path.join(work_dir, "jobs"),
+        "LOG_LEVEL": args.log_level,
+    })
+    server = importlib.import_module("app")
+    server.browser_pool.launch_args.append(synthetic_sites.host_resolver_rules(sites_port))
+    server.http_fetcher.resolver = synthetic_sites.LocalResolver(sites_port)
+    server.app.config["RESPONSE_TIMEOUT"] = None
+
+    current = {}
+    try:
+        async with server.app.test_app() as test_app:
+            client = test_app.test_client()
+            for number, level in enumerate(levels):
+                # Fresh domains at every level so nothing is answered from a warm cache
+                start = number * args.sites
+                level_sites = synthetic_sites.corpus(args.sites, start=start)
+                current[str(level)] = await run_level(server, client, level, level_sites, args.requests, start)
+                print_level(level, current[str(level)])
+    finally:
+        await sites_runner.cleanup()
+        await ollama_runner.cleanup()
+        whois_server.close()
+    return current
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=200, help="synthetic sites per concurrency level")
+    parser.add_argument("--concurrency", default="5,10,20", help="browser tabs of each run")
+    parser.add_argument("--requests", type=int, default=4, help="concurrent requests the sites are split over")
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--huge-mb", type=float, default=6)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-token-latency", type=float, default=0.01)
+    parser.add_argument("--llm-parallel", type=int, default=1)
+    parser.add_argument("--whois-latency", type=float, default=0.05)
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="e2e-benchmark-")
+    try:
+        current = asyncio.run(main(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.update_baselines:
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baselines written to {args.baselines}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baselines):
+        # Passing would let a gate without anything to compare against look green
+        print(f"No baselines at {args.baselines}; record them with --update-baselines", file=sys.stderr)
+        sys.exit(2)
+    with open(args.baselines, "r", encoding="utf-8") as f:
+        found = regressions(current, json.load(f), args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    print("Regressions found" if found else "No regressions against the baselines")
+    sys.exit(1 if found else 0)
@@ -0,0 +1,87 @@
+""" Compare the single-pass text extractor with the old BeautifulSoup find_all approach.
+
+Usage:
+    python -m scripts.benchmarks.extract_benchmark [CORPUS_DIR] [--repeat N]
+
+CORPUS_DIR holds saved pages (*.html, searched recursively). Without it a
+synthetic corpus of div-heavy pages with increasing nesting depth is used.
+"""
+from bs4 import BeautifulSoup
+from scripts.scraping.text_extractor import extract_text
+import argparse
+import glob
+import os
+import time
+
+
+def legacy_extract(html):
+    """ The extractor previously used in scrape.py. """
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content = soup.find_all(["article", "section", "main", "div"])
+    text_content = " ".join([element.get_text(separator=" ", strip=True) for element in main_content])
+    return ' '.join(text_content.split())
+
+
+def load_corpus(directory):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.htm*"), recursive=True)):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            pages[os.path.relpath(path, directory)] = f.read()
+    return pages
+
+
+def synthetic_corpus():
+    pages = {}
+    for depth in (1, 5, 10, 20, 40):
+        block = "<p>Product description paragraph with a few words of text.</p>" * 5
+        for _ in range(depth):
+            block = f"<div class='wrapper'>{block}</div>"
+        body = block * 20
+        pages[f"nested-depth-{depth}"] = (
+            "<html><head><title>Shop</title><script>var tracking = 1;</script></head>"
+            f"<body><nav>Home About Contact</nav>{body}"
+            "<div id='cookie-consent'>We use cookies. Accept all</div></body></html>"
+        )
+    return pages
+
+
+def measure(extractor, pages, repeat):
+    per_page = {}
+    for name, html in pages.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            text = extractor(html)
+        per_page[name] = ((time.perf_counter() - start) / repeat, len(text))
+    return per_page
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not pages:
+        raise SystemExit(f"No .html files found in {args.corpus}")
+
+    legacy = measure(legacy_extract, pages, args.repeat)
+    single_pass = measure(extract_text, pages, args.repeat)
+
+    print(f"{'page':<40} {'legacy ms':>10} {'new ms':>10} {'speedup':>8} {'legacy chars':>13} {'new chars':>10}")
+    for name in pages:
+        old_time, old_chars = legacy[name]
+        new_time, new_chars = single_pass[name]
+        print(f"{name[:40]:<40} {old_time * 1000:>10.2f} {new_time * 1000:>10.2f} "
+              f"{old_time / new_time:>7.1f}x {old_chars:>13} {new_chars:>10}")
+
+    old_total = sum(t for t, _ in legacy.values())
+    new_total = sum(t for t, _ in single_pass.values())
+    old_chars = sum(c for _, c in legacy.values())
+    new_chars = sum(c for _, c in single_pass.values())
+    print(f"\n{len(pages)} pages: legacy {old_total * 1000:.1f} ms, single-pass {new_total * 1000:.1f} ms "
+          f"({old_total / new_total:.1f}x faster), text sent to the LLM {old_chars} -> {new_chars} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+""" A local stand-in for Ollama's /api/generate, for tests and benchmarks without a GPU.
+
+Usage:
+    python -m scripts.benchmarks.fake_ollama [--port 11435] [--latency 0.3] [--token-latency 0.01]
+                                             [--parallel 1] [--invalid-rate 0.0]
+
+Point the server at it with OLLAMA_URL=http://localhost:11435/api/generate.
+Answers follow the request's "format" schema: a batch prompt (schema with
+"results") gets one label per "### Site:" section, any other prompt a single
+label. Labels are picked deterministically from the site (the first line of
+a single-site prompt), so both modes agree and runs are comparable. Each
+generation holds one of `--parallel` slots for `--latency` seconds plus
+`--token-latency` per generated label, like a GPU serving a single model.
+`--invalid-rate` is the chance that an answer, or one site of a batch
+answer, comes back unusable.
+"""
+from aiohttp import web
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+
+CATEGORIES = ["News", "Shopping", "Technology", "Travel", "Health", "Finance", "Education", "Sport"]
+
+SITE_HEADING = re.compile(r"^### Site: (\S+)$", re.MULTILINE)
+
+
+def expected_category(key):
+    """ The category the fake model gives for a site. """
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return CATEGORIES[digest[0] % len(CATEGORIES)]
+
+
+class FakeOllama:
+    def __init__(self, latency=0.3, token_latency=0.01, parallel=1, invalid_rate=0.0, seed=0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.invalid_rate = invalid_rate
+        self.requests = 0
+        self.labels = 0
+        self._slots = asyncio.Semaphore(parallel)
+        self._random = random.Random(seed)
+
+    def invalid(self):
+        return self._random.random() < self.invalid_rate
+
+    def label(self, key):
+        return {"Category": expected_category(key), "Alternate Category": ""}
+
+    async def generate(self, request):
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        schema = body.get("format")
+        self.requests += 1
+
+        if isinstance(schema, dict) and "results" in schema.get("properties", {}):
+            results = [{"site": site, **self.label(site)} for site in SITE_HEADING.findall(prompt)
+                       if not self.invalid()]
+            answer = json.dumps({"results": results})
+            generated = len(results)
+        else:
+            site = prompt.split("\n", 1)[0].strip().rstrip(",")
+            answer = "Category: unknown" if self.invalid() else json.dumps(self.label(site))
+            generated = 1
+
+        async with self._slots:
+            await asyncio.sleep(self.latency + self.token_latency * generated)
+        self.labels += generated
+        return web.json_response({"model": body.get("model"), "response": answer, "done": True})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        return app
+
+
+async def serve(fake, host="127.0.0.1", port=0):
+    """ Start `fake` in the running loop; returns the runner and the generate URL. """
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}/api/generate"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per generation")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="extra seconds per generated label")
+    parser.add_argument("--parallel", type=int, default=1, help="generations served at the same time")
+    parser.add_argument("--invalid-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.latency, args.token_latency, args.parallel, args.invalid_rate)
+    web.run_app(fake.app(), host=args.host, port=args.port)
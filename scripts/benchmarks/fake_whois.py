@@ -0,0 +1,53 @@
+""" A local stand-in WHOIS server (RFC 3912), for benchmarks without the internet.
+
+Usage:
+    python -m scripts.benchmarks.fake_whois [--port 4343] [--latency 0.05]
+
+Point the server at it with WHOIS_SERVER=localhost:4343. Every query is
+answered after `--latency` seconds with a registrant country picked
+deterministically from the domain.
+"""
+import argparse
+import asyncio
+import hashlib
+
+COUNTRIES = ["US", "DE", "FR", "GB", "NL", "IN", "JP", "BR"]
+
+
+class FakeWhois:
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.queries = 0
+
+    async def handle(self, reader, writer):
+        try:
+            domain = (await reader.readline()).decode("idna", "replace").strip().lower()
+            self.queries += 1
+            await asyncio.sleep(self.latency)
+            country = COUNTRIES[hashlib.sha1(domain.encode("utf-8")).digest()[0] % len(COUNTRIES)]
+            writer.write(f"Domain Name: {domain.upper()}\r\nRegistrant Country: {country}\r\n".encode("ascii"))
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(fake, host="127.0.0.1", port=0):
+    """ Start `fake` in the running loop; returns the server and its "host:port". """
+    server = await asyncio.start_server(fake.handle, host, port)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"{host}:{port}"
+
+
+async def main(args):
+    server, address = await serve(FakeWhois(args.latency), args.host, args.port)
+    print(f"Fake WHOIS listening on {address}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4343)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per query")
+    asyncio.run(main(parser.parse_args()))
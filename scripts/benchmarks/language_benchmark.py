@@ -0,0 +1,83 @@
+""" Compare the fastText and langdetect language identification backends.
+
+Usage:
+    python -m scripts.benchmarks.language_benchmark [CORPUS_DIR] [--repeat N] [--batch-size N]
+
+CORPUS_DIR holds saved pages (*.html, searched recursively) whose text is
+extracted first. Without it a synthetic corpus of pages in several languages
+and of increasing length is used. Reports per-page latency of each backend,
+one page at a time and batched, and how often the two agree.
+"""
+from scripts.benchmarks.extract_benchmark import load_corpus
+from scripts.scraping.language_detector import FastTextDetector, LangdetectDetector
+from scripts.scraping.text_extractor import extract_text
+import argparse
+import statistics
+import time
+
+SENTENCES = {
+    "en": "The new store sells hand made furniture and ships across the country within a week.",
+    "de": "Der neue Laden verkauft handgefertigte Möbel und liefert innerhalb einer Woche im ganzen Land.",
+    "fr": "La nouvelle boutique vend des meubles faits main et livre partout dans le pays en une semaine.",
+    "es": "La nueva tienda vende muebles hechos a mano y envía a todo el país en una semana.",
+    "it": "Il nuovo negozio vende mobili fatti a mano e spedisce in tutto il paese entro una settimana.",
+}
+
+
+def synthetic_corpus():
+    texts = {}
+    for language, sentence in SENTENCES.items():
+        for repeat in (5, 50, 500):
+            texts[f"{language}-{len(sentence) * repeat}-chars"] = " ".join([sentence] * repeat)
+    return texts
+
+
+def per_page_latencies(detector, texts, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            detector.detect_many([text])
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def batched_latency(detector, texts, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        detector.detect_many(texts[offset:offset + batch_size])
+    return (time.perf_counter() - start) / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.corpus:
+        texts = [extract_text(html) for html in load_corpus(args.corpus).values()]
+    else:
+        texts = list(synthetic_corpus().values())
+    texts = [text for text in texts if text]
+    print(f"{len(texts)} pages, {statistics.mean(len(text) for text in texts):.0f} characters on average\n")
+
+    detectors = [FastTextDetector(), LangdetectDetector()]
+    predictions = {}
+    print(f"{'backend':<11} {'p50 page':>10} {'p99 page':>10} {'batched page':>13}")
+    for detector in detectors:
+        detector.load()
+        latencies = sorted(per_page_latencies(detector, texts, args.repeat))
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        batched = batched_latency(detector, texts, args.batch_size)
+        predictions[detector.name] = [language for language, _ in detector.detect_many(texts)]
+        print(f"{detector.name:<11} {p50 * 1000:>8.2f}ms {p99 * 1000:>8.2f}ms {batched * 1000:>11.3f}ms")
+
+    agree = sum(a == b for a, b in zip(predictions["fasttext"], predictions["langdetect"]))
+    print(f"\nBackends agree on {agree / len(texts):.1%} of pages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+""" Compare per-site and batched LLM classification against the fake Ollama server.
+
+Usage:
+    python -m scripts.benchmarks.llm_batch_benchmark [--sites N] [--batch-sizes 1,4,8] [--invalid-rate R]
+                                                     [--latency S] [--token-latency S] [--concurrency N]
+
+Starts scripts.benchmarks.fake_ollama in-process and classifies the same
+synthetic short pages through LlmClassifier at each batch size. Reports
+sites per second, generations, fallbacks to single-site requests and how
+many labels match the fake model's expected answer.
+"""
+from scripts.benchmarks.fake_ollama import FakeOllama, expected_category, serve
+from scripts.categorizing.llm_classifier import LlmClassifier
+from scripts.categorizing.ollama_client import OllamaClient
+import argparse
+import asyncio
+import time
+
+
+async def run(batch_size, sites, args):
+    fake = FakeOllama(args.latency, args.token_latency, parallel=1, invalid_rate=args.invalid_rate)
+    runner, url = await serve(fake)
+    client = OllamaClient(url, max_in_flight=args.concurrency)
+    llm = LlmClassifier(client, batch_size=batch_size, max_delay=0.02)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def classify(site):
+        async with semaphore:
+            content = f"{site}\nTitle: Example page\nA short page about {site}."
+            return await llm.classify(site, content, tokens=40)
+
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(classify(site) for site in sites))
+        elapsed = time.perf_counter() - start
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+    correct = sum(label is not None and label["Category"] == expected_category(site)
+                  for site, (label, _) in zip(sites, results))
+    return elapsed, correct, llm.stats
+
+
+async def main(args):
+    sites = [f"site-{i}.example.com" for i in range(args.sites)]
+    print(f"{args.sites} sites, {args.latency}s per generation, invalid rate {args.invalid_rate:.0%}\n")
+    print(f"{'batch':>5} {'sites/s':>9} {'generations':>12} {'fallbacks':>10} {'correct':>8}")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        elapsed, correct, stats = await run(batch_size, sites, args)
+        print(f"{batch_size:>5} {len(sites) / elapsed:>9.1f} {stats['generations']:>12} "
+              f"{stats['fallbacks']:>10} {correct / len(sites):>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--invalid-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
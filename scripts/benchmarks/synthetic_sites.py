@@ -0,0 +1,186 @@
+""" A local server for a generated corpus of synthetic websites, for benchmarks without the internet.
+
+Usage:
+    python -m scripts.benchmarks.synthetic_sites [--port 8081] [--sites 200]
+
+Every site is a made-up domain such as "bench-static-12.com" served from
+this one server, which picks the page from the Host header. The kind of
+page is part of the name:
+
+    static    server-rendered article, read by the plain HTTP tier
+    js        app shell whose text is rendered by a script, needs the browser
+    redirect  two redirects before a static article
+    slow      static article sent after `slow_delay` seconds
+    timeout   never answers within the scraper's timeouts
+    huge      article of `huge_mb` MB, over the HTTP tier's size limit
+    beacon    short article sending an analytics beacon every 400 ms, so
+              the network never goes idle
+    missing   HTTP 404, a permanent failure
+    flaky     HTTP 503, a transient failure
+    nxdomain  a domain under .invalid that never resolves
+
+Scrapers reach the sites by resolving the bench domains to this server:
+`LocalResolver` for aiohttp and `host_resolver_rules()` for Chromium.
+Pages are generated from a seeded vocabulary, so every run serves the
+same corpus.
+"""
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+import argparse
+import asyncio
+import random
+import re
+import socket
+
+KINDS = ("static", "js", "redirect", "slow", "timeout", "huge", "beacon", "missing", "flaky", "nxdomain")
+
+# Share of each kind in a generated corpus
+DEFAULT_MIX = {"static": 0.45, "js": 0.2, "redirect": 0.1, "slow": 0.08, "timeout": 0.02, "huge": 0.05,
+               "beacon": 0.05, "missing": 0.02, "flaky": 0.02, "nxdomain": 0.01}
+
+BENCH_HOST = re.compile(r"^bench-(?P<kind>[a-z]+)-(?P<index>\d+)\.com$")
+
+# Milliseconds between two beacons of a "beacon" page, under Playwright's 500 ms of network idle
+BEACON_INTERVAL = 400
+
+WORDS = (
+    "market garden travel river mountain coffee software museum recipe city school health football "
+    "library energy weather camera journey music theatre bicycle island science history festival "
+    "kitchen doctor planet ocean language student village harbour forest engine painting winter "
+    "summer account delivery customer product review price season family research community"
+).split()
+
+
+def site_name(kind, index):
+    # .invalid is reserved, so neither the local resolvers nor any DNS server will answer it
+    return f"bench-{kind}-{index}.{'invalid' if kind == 'nxdomain' else 'com'}"
+
+
+def corpus(count, mix=None, start=0, seed=0):
+    """ `count` site URLs with kinds drawn from `mix`, numbered from `start`. """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed + start)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [f"http://{site_name(kind, start + i)}/" for i, kind in enumerate(kinds)]
+
+
+def paragraphs(seed, count):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 80))).capitalize() + "."
+            for _ in range(count)]
+
+
+def article(host, count=8):
+    body = "".join(f"<p>{text}</p>" for text in paragraphs(host, count))
+    return (f"<!doctype html><html><head><title>{host}</title>"
+            f'<meta name="description" content="Synthetic page {host}"></head>'
+            f"<body><nav><a href='/'>Home</a></nav><h1>{host}</h1><article>{body}</article>"
+            f"<footer>Cookies help us deliver our services.</footer></body></html>")
+
+
+def beacon_page(host):
+    return article(host, 3).replace(
+        "</body>", f"<script>setInterval(function () {{ fetch('/beacon', {{method: 'POST'}}); }}, "
+                   f"{BEACON_INTERVAL});</script></body>")
+
+
+def app_shell(host):
+    texts = paragraphs(host, 8)
+    return (f"<!doctype html><html><head><title>{host}</title></head><body><div id=\"root\"></div>"
+            f"<script>setTimeout(function () {{"
+            f"  var root = document.getElementById('root');"
+            f"  {texts!r}.forEach(function (text) {{"
+            f"    var p = document.createElement('p'); p.textContent = text; root.appendChild(p);"
+            f"  }});"
+            f"}}, 200);</script></body></html>")
+
+
+class SyntheticSites:
+    def __init__(self, slow_delay=3.0, timeout_delay=120.0, huge_mb=6):
+        self.slow_delay = slow_delay
+        self.timeout_delay = timeout_delay
+        self.huge_paragraphs = max(1, int(huge_mb * 1024 * 1024 / 400))
+        self.requests = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        host = request.host.split(":", 1)[0].lower()
+        match = BENCH_HOST.match(host)
+        if not match:
+            raise web.HTTPNotFound()
+        kind = match["kind"]
+
+        if kind == "redirect":
+            steps = {"/": "/moved", "/moved": "/article"}
+            if request.path in steps:
+                raise web.HTTPFound(steps[request.path])
+            return web.Response(text=article(host), content_type="text/html")
+        if kind == "js":
+            return web.Response(text=app_shell(host), content_type="text/html")
+        if kind == "beacon":
+            if request.path == "/beacon":
+                return web.Response(status=204)
+            return web.Response(text=beacon_page(host), content_type="text/html")
+        if kind == "missing":
+            raise web.HTTPNotFound()
+        if kind == "flaky":
+            raise web.HTTPServiceUnavailable()
+        if kind == "slow":
+            await asyncio.sleep(self.slow_delay)
+        elif kind == "timeout":
+            await asyncio.sleep(self.timeout_delay)
+        elif kind == "huge":
+            return web.Response(text=article(host, self.huge_paragraphs), content_type="text/html")
+        return web.Response(text=article(host), content_type="text/html")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        return app
+
+
+class LocalResolver(AbstractResolver):
+    """ aiohttp resolver sending bench domains to the local server and everything else to the system. """
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.port = port
+        self.host = host
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        if BENCH_HOST.match(host.lower()):
+            return [{"hostname": host, "host": self.host, "port": self.port,
+                     "family": socket.AF_INET, "proto": 0, "flags": socket.AI_NUMERICHOST}]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM)
+        return [{"hostname": host, "host": address[0], "port": address[1],
+                 "family": info_family, "proto": proto, "flags": socket.AI_NUMERICHOST}
+                for info_family, _, proto, _, address in infos]
+
+    async def close(self):
+        pass
+
+
+def host_resolver_rules(port, host="127.0.0.1"):
+    """ Chromium argument sending bench domains to the local server. """
+    return f"--host-resolver-rules=MAP bench-*.com {host}:{port}"
+
+
+async def serve(sites, host="127.0.0.1", port=0):
+    """ Start `sites` in the running loop; returns the runner and the port. """
+    runner = web.AppRunner(sites.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, runner.addresses[0][1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sites", type=int, default=200, help="number of site URLs to print")
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--huge-mb", type=float, default=6)
+    args = parser.parse_args()
+
+    for url in corpus(args.sites):
+        print(url)
+    web.run_app(SyntheticSites(args.slow_delay, huge_mb=args.huge_mb).app(), host=args.host, port=args.port)
@@ -0,0 +1,125 @@
+""" Sentence embeddings of the predefined categories, built once and memory-mapped.
+
+Run `python -m scripts.categorizing.category_index` to build the index ahead of
+time; otherwise it is built on first use. It is rebuilt whenever the categories
+file, the embedding model or INDEX_VERSION changes.
+"""
+from collections import OrderedDict
+from scripts.common.log import get_logger
+import glob
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+CATEGORIES_PATH = "scripts/categorizing/cleaned_predefined_categories.json"
+INDEX_DIR = "cache/category_index"
+INDEX_VERSION = 1
+
+log = get_logger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """ The embedding model, loaded on first use rather than at import time. """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def encode(texts):
+    return get_model().encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def load_embedding_index(name, labels, index_dir=INDEX_DIR):
+    """ Embeddings of `labels` as a read-only memory-mapped matrix.
+
+    The artifact file name carries a hash of the labels, the model and the
+    index version, so a stale artifact is never loaded and older versions of
+    the same index are removed when a new one is written.
+    """
+    fingerprint = hashlib.sha256(
+        json.dumps([INDEX_VERSION, MODEL_NAME, labels], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+    path = os.path.join(index_dir, f"{name}-v{INDEX_VERSION}-{fingerprint}.npy")
+
+    if not os.path.exists(path):
+        log.info("building embedding index", path=path, labels=len(labels))
+        os.makedirs(index_dir, exist_ok=True)
+        embeddings = encode(labels)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, embeddings)
+        os.replace(temp_path, path)
+        for old_path in glob.glob(os.path.join(index_dir, f"{name}-v*.npy")):
+            if old_path != path:
+                os.remove(old_path)
+
+    return np.load(path, mmap_mode="r")
+
+
+class CategoryIndex:
+    """ Maps free-form labels to the closest predefined category.
+
+    Matches are cached in a bounded LRU, and labels missing from the cache
+    are encoded together in a single batch.
+    """
+
+    def __init__(self, categories_path=CATEGORIES_PATH, index_dir=INDEX_DIR, cache_size=4096, threshold=0.5):
+        self.categories_path = categories_path
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+        self.threshold = threshold
+        self.category_names = None
+        self._embeddings = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Read the categories and map their embedding matrix, building it if needed. """
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    with open(self.categories_path, "r", encoding="utf-8") as f:
+                        predefined_categories = json.load(f)
+                    self.category_names = list(predefined_categories.keys())
+                    self._embeddings = load_embedding_index("categories", self.category_names, self.index_dir)
+        return self._embeddings
+
+    def match_labels(self, labels):
+        """ Best predefined category for each label, or "Uncategorized" below the threshold. """
+        embeddings = self.load()
+        results = {}
+        with self._lock:
+            for label in labels:
+                if label in self._cache:
+                    self._cache.move_to_end(label)
+                    results[label] = self._cache[label]
+        missing = list(dict.fromkeys(label for label in labels if label not in results))
+
+        if missing:
+            # Cosine similarity of every missing label with all categories at once
+            similarities = encode(missing) @ embeddings.T
+            best = similarities.argmax(axis=1)
+            with self._lock:
+                for row, label in enumerate(missing):
+                    score = similarities[row, best[row]]
+                    match = self.category_names[best[row]] if score > self.threshold else "Uncategorized"
+                    results[label] = self._cache[label] = match
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [results[label] for label in labels]
+
+
+if __name__ == "__main__":
+    index = CategoryIndex()
+    print(f"Category index ready: {index.load().shape}")
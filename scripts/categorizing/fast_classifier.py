@@ -0,0 +1,151 @@
+""" Embedding-based fast path that classifies pages without the LLM when it is confident.
+
+Offline evaluation against LLM labels:
+    python -m scripts.categorizing.fast_classifier SAMPLE.jsonl [--batch-size N]
+
+Each line of SAMPLE.jsonl is a JSON object with "site", "content" and the
+LLM's "label" (optionally "title", "description" and "headings"). The report
+shows, for a grid of thresholds, how many pages the fast path would answer
+and how often it agrees with the LLM, plus the embedding throughput.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from scripts.categorizing.category_index import CATEGORIES_PATH, INDEX_DIR, encode, load_embedding_index
+from scripts.categorizing.prompt_builder import build_prompt_content
+from scripts.common.batcher import MicroBatcher
+import argparse
+import json
+import threading
+import time
+import numpy as np
+
+# Tokens of page content embedded per page; MiniLM reads at most 256 word pieces
+EMBED_TOKEN_BUDGET = 200
+
+
+def page_summary(url, page):
+    """ The title, description, headings and key sentences of a page, short enough to embed. """
+    content, _ = build_prompt_content(url, page, EMBED_TOKEN_BUDGET)
+    return content
+
+
+class FastClassifier:
+    """ Scores pages against every category and subcategory name.
+
+    A page's score for a category is its best cosine similarity with the
+    category name or any of its subcategories. The result is confident when
+    the top score reaches `min_score` and leads the runner-up by at least
+    `min_margin`. Concurrent calls are embedded together in batches.
+    """
+
+    def __init__(self, categories_path=CATEGORIES_PATH, index_dir=INDEX_DIR, min_score=0.45, min_margin=0.08,
+                 top_k=3, batch_size=32, max_delay=0.01, executor=None):
+        self.categories_path = categories_path
+        self.index_dir = index_dir
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.top_k = top_k
+        self.category_names = None
+        self._embeddings = None
+        self._starts = None
+        self._lock = threading.Lock()
+        self._batcher = MicroBatcher(
+            self.classify_texts,
+            batch_size=batch_size,
+            max_delay=max_delay,
+            executor=executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="fast-path"),
+        )
+
+    def load(self):
+        """ Map the subcategory embedding matrix, building it if the categories changed. """
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    with open(self.categories_path, "r", encoding="utf-8") as f:
+                        predefined_categories = json.load(f)
+
+                    # Labels are grouped by category so scores can be max-pooled with reduceat
+                    labels, starts = [], []
+                    for category, subcategories in predefined_categories.items():
+                        starts.append(len(labels))
+                        labels.append(category)
+                        labels.extend(sub for sub in dict.fromkeys(subcategories) if sub and sub != "None")
+
+                    self.category_names = list(predefined_categories.keys())
+                    self._starts = np.array(starts)
+                    self._embeddings = load_embedding_index("subcategories", labels, self.index_dir)
+        return self._embeddings
+
+    def classify_embeddings(self, page_embeddings):
+        embeddings = self.load()
+        label_scores = np.asarray(page_embeddings, dtype=np.float32) @ embeddings.T
+        category_scores = np.maximum.reduceat(label_scores, self._starts, axis=1)
+
+        k = min(self.top_k, category_scores.shape[1])
+        top = np.argpartition(-category_scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(category_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = []
+        for indices, scores in zip(top, top_scores):
+            score = float(scores[0])
+            margin = float(scores[0] - scores[1]) if len(scores) > 1 else score
+            alternate = self.category_names[indices[1]] if len(scores) > 1 and scores[1] >= self.min_score else ""
+            results.append({
+                "Category": self.category_names[indices[0]],
+                "Alternate Category": alternate,
+                "score": round(score, 4),
+                "margin": round(margin, 4),
+                "confident": score >= self.min_score and margin >= self.min_margin,
+            })
+        return results
+
+    def classify_texts(self, texts):
+        return self.classify_embeddings(encode(texts))
+
+    async def classify(self, text):
+        """ Classify one page summary, batched with other concurrent calls. """
+        return await self._batcher.submit(text)
+
+
+def evaluate(sample_path, batch_size=64):
+    """ Compare fast-path labels with LLM labels over a labeled sample. """
+    texts, labels = [], []
+    with open(sample_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            page = {**record, "text": record.get("content", "")}
+            texts.append(page_summary(record.get("site", ""), page))
+            labels.append(record.get("label") or record.get("Category"))
+
+    classifier = FastClassifier()
+    classifier.load()
+    start = time.perf_counter()
+    results = []
+    for offset in range(0, len(texts), batch_size):
+        results.extend(classifier.classify_texts(texts[offset:offset + batch_size]))
+    elapsed = time.perf_counter() - start
+
+    total = len(results)
+    agree = sum(result["Category"] == label for result, label in zip(results, labels))
+    print(f"{total} pages embedded and scored in {elapsed:.2f}s ({total / elapsed:.1f} pages/s)")
+    print(f"Top-1 agreement with the LLM on all pages: {agree / total:.1%}\n")
+
+    print(f"{'min_score':>9} {'min_margin':>10} {'fast path':>10} {'agreement':>10}")
+    for min_score in (0.35, 0.4, 0.45, 0.5, 0.55, 0.6):
+        for min_margin in (0.0, 0.04, 0.08, 0.12):
+            chosen = [(result, label) for result, label in zip(results, labels)
+                      if result["score"] >= min_score and result["margin"] >= min_margin]
+            agreement = sum(result["Category"] == label for result, label in chosen) / len(chosen) if chosen else 0
+            print(f"{min_score:>9.2f} {min_margin:>10.2f} {len(chosen) / total:>10.1%} {agreement:>10.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", help="JSONL file of pages labeled by the LLM")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    evaluate(args.sample, args.batch_size)
@@ -1,50 +1,47 @@
-import requests
+import asyncio
 import json
-from scripts.categorizing.url_type import check_url
-from sentence_transformers import SentenceTransformer
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scripts.categorizing.llm_classifier import LABEL_SCHEMA, LlmClassifier, parse_label, single_prompt
+from scripts.categorizing.ollama_client import OllamaClient
+from scripts.categorizing.prompt_builder import build_prompt_content
+from scripts.categorizing.url_type import default_engine
+from scripts.categorizing.category_index import CategoryIndex
+from scripts.categorizing.fast_classifier import page_summary
+from scripts.common.log import get_logger
+from scripts.common.metrics import span
 
-# Load embedding model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+log = get_logger(__name__)
 
-# Load predefined categories
-with open("scripts/categorizing/cleaned_predefined_categories.json", "r", encoding="utf-8") as f:
-    predefined_categories = json.load(f)
+# Predefined categories and their embeddings, memory-mapped on first use
+category_index = CategoryIndex()
 
-# Convert predefined categories to embeddings
-category_names = list(predefined_categories.keys())
-category_embeddings = model.encode(category_names, normalize_embeddings=True)
+# Embedding runs on its own thread so it never blocks the event loop
+embedding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
 
 def get_best_semantic_match(input_text):
     """Find the best category match based on semantic similarity."""
-    input_embedding = model.encode([input_text], normalize_embeddings=True)
-    # Compute cosine similarity with all predefined categories
-    similarities = np.dot(category_embeddings, input_embedding.T).flatten()
-    best_index = np.argmax(similarities)
-    best_category = category_names[best_index]
-    best_score = similarities[best_index]
-    return best_category if best_score > 0.5 else "Uncategorized"
+    return category_index.match_labels([input_text])[0]
 
 def process_llama_response(llama_response):
     """Normalize LLaMA response categories using semantic similarity."""
-    try:
-        # Attempt to parse the response as JSON.
-        response = json.loads(llama_response.replace("'", "\""))
-    except json.JSONDecodeError as e:
-        print(f"JSON Decode Error: {e}")
+    label = parse_label(llama_response)
+    if label is None:
+        log.warning("invalid llm response", response=llama_response[:200])
         return {"error": "Invalid JSON response from LLaMA"}
-    
-    original_category = response.get("Category")
-    original_alt_category = response.get("Alternate Category")
+    return normalize_label(label)
+
+def normalize_label(label):
+    """Map a validated LLM label onto the predefined categories."""
+    original_category = label.get("Category")
+    original_alt_category = label.get("Alternate Category")
 
     if not original_category or original_category.lower() == "null":
         original_category = "Uncategorized"
     if not original_alt_category or original_alt_category.lower() == "null":
         original_alt_category = "Uncategorized"
     
-    # Use semantic matching to refine the category
-    category = get_best_semantic_match(original_category.strip())
-    alt_category = get_best_semantic_match(original_alt_category.strip())
+    # Use semantic matching to refine both categories in one batch
+    category, alt_category = category_index.match_labels([original_category.strip(), original_alt_category.strip()])
     if alt_category == category:
         alt_category = ""
     
@@ -56,57 +53,112 @@ def process_llama_response(llama_response):
 # Define the API URL for Ollama
 model_url = "http://localhost:11434/api/generate"
 
-def ask_llama(payload):
-    with requests.post(model_url, json=payload, stream=True) as response:
-        if response.status_code == 200:
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    data = json.loads(line.decode('utf-8'))
-                    full_response += data.get("response", "")
-                    if data.get("done", False):
-                        return full_response
-            return full_response
-        else:
-            print(f"Request failed with status code {response.status_code}")
-    return None
+default_client = OllamaClient(model_url)
+
+# One generation per site unless the caller passes a batching LlmClassifier
+default_llm = LlmClassifier(default_client, batch_size=1)
+
+# Approximate number of tokens of page content sent to the model per site
+DEFAULT_TOKEN_BUDGET = 1024
+
+async def ask_llama(payload, client=None):
+    return await (client or default_client).generate(payload)
 
 def generate_payload(content, prompt_type):
-    example_format = '{"Category": "Category Name", "Alternate Category": "if exists here"}'
     if prompt_type == "category":
-        return {
-            "model": "my-llama3",
-            "prompt": (f"{content}, \n\n"
-                       f"This is content from a website. Ignore useless information like cookies, login forms, etc. "
-                       f"Understand the context carefully and tell What is the most probable category of this website? "
-                       f"Respond with a JSON object in this format: {example_format}. "
-                       "NO NEED TO EXPLAIN ANYTHING, JUST TELL CATEGORY.")
-        }
+        return {"model": "my-llama3", "prompt": single_prompt(content), "format": LABEL_SCHEMA}
     return {}
 
-def categorize(url: str, content: str):
+async def categorize(url: str, content: str, client=None, page=None, token_budget=DEFAULT_TOKEN_BUDGET, fast_path=None,
+                     url_rules=None, llm=None, flights=None, flight_keys=(), fresh=False):
+    """ Categorize a site, returning the category and a dict of details about how it was done.
+
+    `page` may carry the scraped "title", "description" and "headings",
+    which are kept in the prompt ahead of the page text. The text is
+    compressed to about `token_budget` tokens and the details record the
+    original and compressed token counts. When a FastClassifier is passed
+    as `fast_path`, pages it classifies confidently never reach the LLM.
+    URLs matched by `url_rules`, a UrlRuleEngine, are categorized without
+    reading the page at all. Pages left to the LLM go through `llm`, an
+    LlmClassifier that may answer several of them in one generation, or
+    one request per page through `client` without it. Details say which
+    path produced the label in "classified_by", and which rule in
+    "url_rule". With `flights`, a SingleFlight, a page not matched by a URL
+    rule takes the label of a page classified under one of `flight_keys`,
+    and the details then say which key in "shared" and whose label in
+    "shared_with"; with `fresh`, only from a page being classified right now.
+    A page the LLM gave no usable label is Uncategorized with "llm_failed"
+    in its details, and that label is never passed on to later pages.
+    """
+    details = {}
     try:
-        print(f"Categorizing URL: {url}")
-        # If check_url returns a result, use that directly.
-        result = check_url(url)
-        if result:
-            return result 
-        
-        # Generate payload and ask the model
-        payload = generate_payload(f"{url.strip()} {content.strip()}", "category")
-        response = ask_llama(payload)
-        if response:
-            print(f"response is {response}")
-            normalized_response = process_llama_response(response)
-            return json.dumps(normalized_response, indent=4)
-        else:
-            return json.dumps({
-                "Category": "Uncategorized",
-                "Alternate Category": ""
-            }, indent=4)
+        log.debug("categorizing", url=url)
+        # If a URL rule matches, use that directly.
+        with span("url_rules"):
+            match = (url_rules or default_engine).match(url)
+        if match:
+            log.debug("categorized by url rule", url=url, category=match[0], rule=match[1])
+            details["classified_by"] = "url_rule"
+            details["url_rule"] = match[1]
+            return match[0], details
+
+        if not flights:
+            return await classify_page(url, content, client, page, token_budget, fast_path, llm, details)
+
+        async def classify():
+            return url, *await classify_page(url, content, client, page, token_budget, fast_path, llm, {})
+
+        (classified_url, category, page_details), key = await flights.do(
+            flight_keys, classify, fresh=fresh, keep=lambda result: not result[2].get("llm_failed"))
+        details.update(page_details)
+        if key:
+            log.debug("label shared", url=url, shared_with=classified_url, key=key[0])
+            details["shared"] = key[0]
+            details["shared_with"] = classified_url
+        return category, details
     except Exception as e:
-        print(f"Exception occurred: {e}")
+        log.error("categorization failed", url=url, error=e)
+        details["llm_failed"] = True
         return json.dumps({
                 "Category": "Uncategorized",
                 "Alternate Category": ""
-            }, indent=4)
+            }, indent=4), details
+
+async def classify_page(url, content, client, page, token_budget, fast_path, llm, details):
+    """ Categorize a page from its content with the fast path or the LLM, filling `details`. """
+    loop = asyncio.get_running_loop()
+    page = {**(page or {}), "text": content}
+    if fast_path:
+        with span("fast_path"):
+            summary = await loop.run_in_executor(None, page_summary, url, page)
+            fast_result = await fast_path.classify(summary)
+        details["fast_path"] = {"score": fast_result["score"], "margin": fast_result["margin"]}
+        if fast_result["confident"]:
+            details["classified_by"] = "embedding"
+            return json.dumps({
+                "Category": fast_result["Category"],
+                "Alternate Category": fast_result["Alternate Category"]
+            }, indent=4), details
+
+    # Compress the page to the token budget, then generate payload and ask the model
+    with span("compress"):
+        prompt_content, token_counts = await loop.run_in_executor(None, build_prompt_content, url, page,
+                                                                  token_budget)
+    details["classified_by"] = "llm"
+    details["prompt_tokens"] = token_counts
+    if llm is None:
+        llm = LlmClassifier(client, batch_size=1) if client else default_llm
+    with span("llm"):
+        label, llm_details = await llm.classify(url, prompt_content, token_counts["compressed"])
+    details.update(llm_details)
+    if label:
+        log.debug("llm label", url=url, label=label)
+        with span("normalize"):
+            normalized_response = await loop.run_in_executor(embedding_executor, normalize_label, label)
+        return json.dumps(normalized_response, indent=4), details
+    else:
+        details["llm_failed"] = True
+        return json.dumps({
+            "Category": "Uncategorized",
+            "Alternate Category": ""
+        }, indent=4), details
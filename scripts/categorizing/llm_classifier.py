@@ -0,0 +1,194 @@
+""" LLM classification through Ollama with schema-constrained JSON output.
+
+Short pages are packed several to a prompt and answered together as an array
+of labels keyed by site; any site missing or invalid in that answer is asked
+again on its own, and an invalid single-site answer is retried once.
+"""
+from collections import Counter
+from scripts.common.batcher import MicroBatcher
+from scripts.common.log import get_logger
+from scripts.common.urls import normalize_url
+import asyncio
+import json
+
+MODEL = "my-llama3"
+
+log = get_logger(__name__)
+
+EXAMPLE_FORMAT = '{"Category": "Category Name", "Alternate Category": "if exists here"}'
+
+# Replaces the Modelfile's system prompt, which asks for a single label, in batched generations
+BATCH_SYSTEM = (
+    "You are an AI that categorizes website content. "
+    "ALWAYS return a JSON object ONLY. No extra text, explanations, or formatting. "
+    'Strictly follow this structure, with one entry per website: '
+    '{"results": [{"site": "site as given", "Category": "Category Name", "Alternate Category": "if exists here"}]}'
+)
+
+LABEL_PROPERTIES = {
+    "Category": {"type": "string"},
+    "Alternate Category": {"type": "string"},
+}
+
+# Ollama constrains generation to these JSON schemas through the "format" field
+LABEL_SCHEMA = {
+    "type": "object",
+    "properties": LABEL_PROPERTIES,
+    "required": ["Category", "Alternate Category"],
+}
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"site": {"type": "string"}, **LABEL_PROPERTIES},
+                "required": ["site", "Category", "Alternate Category"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+
+def single_prompt(content):
+    return (f"{content}, \n\n"
+            f"This is content from a website. Ignore useless information like cookies, login forms, etc. "
+            f"Understand the context carefully and tell What is the most probable category of this website? "
+            f"Respond with a JSON object in this format: {EXAMPLE_FORMAT}. "
+            "NO NEED TO EXPLAIN ANYTHING, JUST TELL CATEGORY.")
+
+
+def batch_prompt(items):
+    sections = "\n\n".join(f"### Site: {site}\n{content}" for site, content in items)
+    return (f"{sections}\n\n"
+            f"Above is content from {len(items)} websites, each under its own '### Site:' heading. "
+            f"Ignore useless information like cookies, login forms, etc. Understand the context of each website "
+            f"carefully and tell the most probable category of every one of them. "
+            f'Respond with a JSON object {{"results": [...]}} holding one object per website in this format: '
+            f'{{"site": "the site exactly as in its heading", "Category": "Category Name", '
+            f'"Alternate Category": "if exists here"}}. '
+            "NO NEED TO EXPLAIN ANYTHING, JUST TELL CATEGORIES.")
+
+
+def validate_label(label):
+    """ The label with its fields stripped, or None unless it has a usable "Category". """
+    if not isinstance(label, dict):
+        return None
+    category = label.get("Category")
+    alternate = label.get("Alternate Category") or ""
+    if not isinstance(category, str) or not category.strip() or not isinstance(alternate, str):
+        return None
+    return {"Category": category.strip(), "Alternate Category": alternate.strip()}
+
+
+def parse_label(text):
+    try:
+        return validate_label(json.loads(text))
+    except (TypeError, ValueError):
+        return None
+
+
+def _site_key(site):
+    try:
+        return normalize_url(str(site))
+    except ValueError:
+        return None
+
+
+def parse_batch(text, sites):
+    """ Valid labels of a batch answer by requested site; sites missing from it are left out. """
+    try:
+        results = json.loads(text).get("results")
+    except (AttributeError, TypeError, ValueError):
+        return {}
+    if not isinstance(results, list):
+        return {}
+
+    by_key = {key: site for site in sites if (key := _site_key(site))}
+    labels = {}
+    for item in results:
+        label = validate_label(item)
+        # The site comes from the model, so a malformed one only loses its own label
+        site = by_key.get(_site_key(item.get("site", ""))) if label else None
+        if site and site not in labels:
+            labels[site] = label
+    return labels
+
+
+class LlmClassifier:
+    """ Asks the LLM for a category label, batching short pages from concurrent calls.
+
+    Pages whose compressed prompt is at most `max_item_tokens` tokens wait up
+    to `max_delay` seconds for others and are sent together, up to
+    `batch_size` per generation. Longer pages, and every page when
+    `batch_size` is 1, get a generation of their own. Every generation asks
+    Ollama for a context of `num_ctx` tokens, which has to hold a full batch.
+    `stats` counts generations, batched sites, fallbacks and invalid answers.
+    """
+
+    def __init__(self, client, model=MODEL, batch_size=8, max_item_tokens=384, max_delay=0.05, retries=1,
+                 num_ctx=8192):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_item_tokens = max_item_tokens
+        self.retries = retries
+        self.num_ctx = num_ctx
+        self.stats = Counter()
+        self._batcher = MicroBatcher(self._classify_batch, batch_size=batch_size, max_delay=max_delay) \
+            if batch_size > 1 else None
+
+    def payload(self, prompt, schema, system=None):
+        payload = {"model": self.model, "prompt": prompt, "format": schema, "options": {"num_ctx": self.num_ctx}}
+        if system:
+            payload["system"] = system
+        return payload
+
+    async def classify(self, site, content, tokens):
+        """ (label, details) for a page's compressed content of about `tokens` tokens; the label is None on failure. """
+        if self._batcher and tokens <= self.max_item_tokens:
+            return await self._batcher.submit((site, content))
+        return await self._classify_single(site, content)
+
+    async def _classify_single(self, site, content):
+        for attempt in range(1 + self.retries):
+            response = await self.client.generate(self.payload(single_prompt(content), LABEL_SCHEMA))
+            self.stats["generations"] += 1
+            if response is None:
+                break
+            label = parse_label(response)
+            if label:
+                return label, {"llm_batch": 1}
+            self.stats["invalid"] += 1
+            log.warning("invalid llm answer", site=site, attempt=attempt + 1, response=response[:200])
+        return None, {"llm_batch": 1}
+
+    async def _classify_batch(self, items):
+        if len(items) == 1:
+            return [await self._classify_single(*items[0])]
+
+        sites = list(dict.fromkeys(site for site, _ in items))
+        response = await self.client.generate(self.payload(batch_prompt(items), BATCH_SCHEMA, BATCH_SYSTEM))
+        self.stats["generations"] += 1
+        self.stats["batched_sites"] += len(items)
+        labels = parse_batch(response, sites) if response else {}
+
+        # Only the sites the batch answer got wrong are asked again on their own
+        missing = [(site, content) for site, content in items if site not in labels]
+        if missing:
+            self.stats["fallbacks"] += len(missing)
+            log.info("batch answer incomplete, asking sites one by one", batch=len(items), missing=len(missing))
+        retried = await asyncio.gather(*(self._classify_single(site, content) for site, content in missing))
+        fallback_results = {site: result for (site, _), result in zip(missing, retried)}
+
+        results = []
+        for site, _ in items:
+            if site in labels:
+                results.append((labels[site], {"llm_batch": len(items)}))
+            else:
+                label, _ = fallback_results[site]
+                results.append((label, {"llm_batch": len(items), "llm_fallback": True}))
+        return results
@@ -0,0 +1,65 @@
+from scripts.common import metrics
+from scripts.common.log import get_logger
+import aiohttp
+import asyncio
+import time
+
+OLLAMA_SECONDS = metrics.histogram("scraper_ollama_request_seconds", "Duration of Ollama generate requests",
+                                   ["outcome"])
+
+log = get_logger(__name__)
+
+
+class OllamaClient:
+    """ Async client for Ollama's /api/generate with a pooled keep-alive session.
+
+    At most `max_in_flight` generations are sent to Ollama at once; further
+    callers wait their turn instead of piling onto the GPU. Every request
+    asks Ollama to keep the model loaded for `keep_alive`, so it is not
+    unloaded between bursts of requests.
+    """
+
+    def __init__(self, url="http://localhost:11434/api/generate", max_in_flight=4, timeout=300, keep_alive="30m"):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._session = None
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def generate(self, payload):
+        """ Send a generate request and return the full response text, or None on failure. """
+        await self.start()
+        async with self._semaphore:
+            self.in_flight += 1
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                request = {"keep_alive": self.keep_alive, **payload, "stream": False}
+                async with self._session.post(self.url, json=request) as response:
+                    if response.status != 200:
+                        log.error("ollama request failed", status=response.status)
+                        return None
+                    data = await response.json()
+                    outcome = "ok"
+                    return data.get("response", "")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.error("ollama request failed", error=e)
+                return None
+            finally:
+                self.in_flight -= 1
+                OLLAMA_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
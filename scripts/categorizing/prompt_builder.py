@@ -0,0 +1,141 @@
+import math
+import re
+from collections import Counter
+
+# Scripts written without spaces between words (CJK, Thai, Lao, Khmer, Myanmar),
+# whose characters are counted one by one
+UNSPACED = ("\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30ff"
+            "\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff")
+
+# Words, unspaced characters and punctuation marks; close enough to the model's tokenizer for budgeting
+TOKEN_PATTERN = re.compile(rf"[{UNSPACED}]|(?:(?![{UNSPACED}])\w)+|[^\w\s]")
+WORD_PATTERN = re.compile(rf"[{UNSPACED}]|(?:(?![{UNSPACED}])[^\W\d_]){{2,}}")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])\s*")
+
+# Phrases that say nothing about what a site is about
+BOILERPLATE = re.compile(
+    r"cookie|privacy policy|terms of (use|service)|all rights reserved|copyright|©"
+    r"|sign in|log ?in|sign up|subscribe|newsletter|javascript",
+    re.IGNORECASE,
+)
+
+MAX_SENTENCE_WORDS = 40
+MAX_SENTENCE_TOKENS = 60
+MAX_INPUT_CHARS = 200_000
+
+# Share of the budget the title, description and headings may take
+HEADER_SHARE = 0.4
+
+# Hard cap on the prompt content, in characters per token of budget, in case
+# the token estimate is far off for some script
+MAX_CHARS_PER_TOKEN = 8
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def _truncate(text, budget):
+    """ Cut `text` to roughly `budget` tokens. """
+    if budget <= 0:
+        return ""
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        tokens += 1
+        if tokens > budget:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def _split_sentences(text):
+    """ Sentences of `text`, with run-on stretches such as menus cut into short chunks. """
+    for sentence in SENTENCE_END.split(text):
+        words = sentence.split()
+        for start in range(0, len(words), MAX_SENTENCE_WORDS):
+            chunk = " ".join(words[start:start + MAX_SENTENCE_WORDS])
+            tokens = list(TOKEN_PATTERN.finditer(chunk))
+            # Text without spaces is one "word" however long it is, so it is cut by tokens too
+            for first in range(0, len(tokens), MAX_SENTENCE_TOKENS):
+                last = tokens[min(first + MAX_SENTENCE_TOKENS, len(tokens)) - 1]
+                yield chunk[tokens[first].start():last.end()]
+
+
+def _normalize(text):
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def select_sentences(text: str, budget: int) -> str:
+    """ The most informative, non-repeated sentences of `text` that fit in `budget` tokens.
+
+    Sentences are scored by how rare their words are within the page, so
+    text repeated across a page (menus, footers, product grids) ranks low.
+    Selected sentences keep their original order.
+    """
+    if budget <= 0 or not text:
+        return ""
+
+    sentences = []
+    seen = set()
+    for sentence in _split_sentences(text[:MAX_INPUT_CHARS]):
+        key = _normalize(sentence)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        sentences.append((sentence, key.split()))
+
+    document_frequency = Counter(word for _, words in sentences for word in set(words))
+    total = len(sentences)
+
+    scored = []
+    for index, (sentence, key_words) in enumerate(sentences):
+        words = set(key_words)
+        # Unspaced text counts its characters as words
+        length = max(len(sentence.split()), len(key_words))
+        information = sum(math.log(1 + total / document_frequency[word]) for word in words)
+        # Favour varied sentences over repeated runs like "Home About Cart Home About Cart"
+        score = information / math.sqrt(length) * (len(words) / length)
+        if len(words) < 3:
+            score *= 0.5
+        if BOILERPLATE.search(sentence):
+            score *= 0.2
+        scored.append((score, index, sentence))
+
+    chosen = []
+    used = 0
+    for score, index, sentence in sorted(scored, reverse=True):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            continue
+        chosen.append((index, sentence))
+        used += tokens
+        if used >= budget:
+            break
+
+    return " ".join(sentence for _, sentence in sorted(chosen))
+
+
+def build_prompt_content(url: str, page: dict, budget: int) -> tuple:
+    """ Page content for the LLM prompt, compressed to about `budget` tokens.
+
+    `page` has the "title", "description", "headings" and "text" of a
+    scraped site. The title, description and unique headings come first,
+    then the highest-information sentences of the text. Returns the content
+    and its original and compressed token counts.
+    """
+    text = page.get("text") or ""
+    original_tokens = count_tokens(f"{url} {text}")
+
+    header = [url.strip()]
+    if page.get("title"):
+        header.append(f"Title: {page['title']}")
+    if page.get("description"):
+        header.append(f"Description: {page['description']}")
+    headings = list(dict.fromkeys(h for h in page.get("headings") or [] if h))
+    if headings:
+        header.append("Headings: " + " | ".join(headings))
+    header = _truncate("\n".join(header), int(budget * HEADER_SHARE))
+
+    body = select_sentences(text, budget - count_tokens(header))
+    content = f"{header}\n{body}" if body else header
+    content = content[:budget * MAX_CHARS_PER_TOKEN]
+    return content, {"original": original_tokens, "compressed": count_tokens(content)}
@@ -1,34 +1,234 @@
-def check_url(url):
-    url_lower = url.lower()
-    result = None
-
-    if 'cdn' in url_lower:
-        result = "Content delivery"
-    elif '.gov' in url_lower:
-        result = "Government"
-    elif '.ac' in url_lower or '.edu' in url_lower:
-        result = "Education"
-    elif 'blog' in url_lower or 'forum' in url_lower:
-        result = "Blogs & forums"
-    elif 'vpn' in url_lower:
-        result = "Anonymizers"
-    elif 'mail' in url_lower:
-        result = "Web e-mail"
-    elif 'news' in url_lower:
-        result = "News"
-    elif '.mil' in url_lower:
-        result = "Military"
-    elif '.int' in url_lower:
-        result = "International organization"
-    elif 'adult' in url_lower or 'porn' in url_lower:
-        result = "Sexually explicit"
-    elif 'torrent' in url_lower or 'p2p' in url_lower:
-        result = "Peer-to-peer & torrents"
-    elif 'fitness' in url_lower:
-        result = "Hobbies"
+""" Data-driven URL rules that categorize a site before it reaches the LLM.
+
+Rules are read from a JSON file (url_rules.json by default) with three parts:
+
+    "allow"  exact host or registrable domain -> category, checked first
+    "deny"   hosts or registrable domains the rules must never categorize
+    "rules"  list of {"name", "category", ...patterns}, the first match wins
+
+Patterns match parsed parts of the host, never the path:
+
+    "suffix"              public suffix, "gov" also matching "gov.uk" and
+                          "ac.*" meaning "ac" followed by a second-level label
+    "domain"              whole tokens of the registrable domain label
+    "subdomain"           whole tokens of the subdomain
+    "domain_contains"     substrings of the registrable domain label
+    "subdomain_contains"  substrings of the subdomain
+
+Tokens are split on dots, dashes and underscores, so "mail" matches
+"mail.example.com" but not "mailchimp.com". The file is reloaded when it
+changes on disk.
+
+Hit rates over a list of URLs, one per line:
+    python -m scripts.categorizing.url_type URLS.txt
+"""
+from collections import Counter
+from scripts.common import metrics
+from scripts.common.aho_corasick import AhoCorasick
+from scripts.common.log import get_logger
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import tldextract
+
+RULES_PATH = "scripts/categorizing/url_rules.json"
+
+TOKEN_SEPARATORS = re.compile(r"[._-]+")
+
+URLS_CHECKED = metrics.counter("scraper_url_rule_checks_total", "URLs checked against the URL rules")
+
+RULE_HITS = metrics.counter("scraper_url_rule_hits_total", "URLs categorized by a URL rule, by rule", ["rule"])
+
+log = get_logger(__name__)
+
+
+def tokens(label):
+    return [token for token in TOKEN_SEPARATORS.split(label) if token]
+
+
+def suffix_keys(suffix):
+    """ Keys a suffix pattern can have to match `suffix`: "gov.uk" gives "gov", "gov.uk" and "gov.*". """
+    labels = suffix.split(".")
+    keys = []
+    for end in range(1, len(labels) + 1):
+        keys.append(".".join(labels[:end]))
+        if end > 1:
+            keys.append(".".join(labels[:end - 1] + ["*"]))
+    return keys
+
+
+class CompiledRules:
+    """ A rules file compiled into lookup tables and substring automatons. """
+
+    def __init__(self, config):
+        self.allow = {host.lower(): category for host, category in config.get("allow", {}).items()}
+        self.deny = {host.lower() for host in config.get("deny", [])}
+        self.rules = []
+        self.suffixes = {}
+        self.domain_tokens = {}
+        self.subdomain_tokens = {}
+        domain_substrings, subdomain_substrings = [], []
+
+        for position, rule in enumerate(config.get("rules", [])):
+            if not rule.get("name") or not rule.get("category"):
+                raise ValueError(f"Rule {position} needs a name and a category")
+            self.rules.append((rule["name"], rule["category"]))
+            # A pattern listed by several rules belongs to the first of them
+            for pattern in rule.get("suffix", []):
+                self.suffixes.setdefault(pattern.lower().strip("."), position)
+            for pattern in rule.get("domain", []):
+                self.domain_tokens.setdefault(pattern.lower(), position)
+            for pattern in rule.get("subdomain", []):
+                self.subdomain_tokens.setdefault(pattern.lower(), position)
+            domain_substrings += [(pattern.lower(), position) for pattern in rule.get("domain_contains", [])]
+            subdomain_substrings += [(pattern.lower(), position) for pattern in rule.get("subdomain_contains", [])]
+
+        self.domain_matcher = AhoCorasick(domain_substrings)
+        self.subdomain_matcher = AhoCorasick(subdomain_substrings)
+
+    def match(self, url):
+        """ (category, rule name) for a URL, or None when no rule applies. """
+        parts = tldextract.extract(url.lower())
+        host = ".".join(part for part in (parts.subdomain, parts.domain, parts.suffix) if part)
+        if host.startswith("www."):
+            host = host[4:]
+        registrable = f"{parts.domain}.{parts.suffix}" if parts.suffix else parts.domain
+
+        for key in (host, registrable):
+            if key in self.allow:
+                return self.allow[key], f"allow:{key}"
+        if host in self.deny or registrable in self.deny:
+            return None
 
+        positions = []
+        if parts.suffix:
+            positions += [self.suffixes[key] for key in suffix_keys(parts.suffix) if key in self.suffixes]
+        positions += [self.domain_tokens[token] for token in tokens(parts.domain) if token in self.domain_tokens]
+        positions += [self.subdomain_tokens[token] for token in tokens(parts.subdomain) if token in self.subdomain_tokens]
+        if self.domain_matcher:
+            positions += self.domain_matcher.search(parts.domain)
+        if self.subdomain_matcher and parts.subdomain:
+            positions += self.subdomain_matcher.search(parts.subdomain)
+        if not positions:
+            return None
+        name, category = self.rules[min(positions)]
+        return category, name
+
+
+class UrlRuleEngine:
+    """ Matches URLs against a rules file and counts how often each rule fires.
+
+    The counts are exported on /metrics as well, summed over all engines.
+
+    The file's modification time is checked at most every
+    `reload_interval` seconds; a changed file is compiled again, and a
+    file that fails to load leaves the previous rules in place.
+    """
+
+    def __init__(self, path=RULES_PATH, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.checked = 0
+        self.hits = Counter()
+        self._rules = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                rules = CompiledRules(json.load(f))
+            self._rules, self._mtime = rules, mtime
+            self._checked_at = time.monotonic()
+        return rules
+
+    def rules(self):
+        """ The compiled rules, reloaded first if the file changed. """
+        if self._rules is None:
+            return self.load()
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    log.info("reloading url rules", path=self.path)
+                    return self.load()
+            except (OSError, ValueError) as e:
+                log.error("url rules failed to load, keeping the previous ones", path=self.path, error=e)
+        return self._rules
+
+    def match(self, url):
+        match = self.rules().match(url)
+        self.checked += 1
+        URLS_CHECKED.inc()
+        if match:
+            self.hits[match[1]] += 1
+            RULE_HITS.inc(rule=match[1])
+        return match
+
+    def check_url(self, url):
+        match = self.match(url)
+        return match[0] if match else None
+
+    def check_urls(self, urls):
+        """ Category or None for each URL, in order. """
+        rules = self.rules()
+        results = []
+        for url in urls:
+            match = rules.match(url)
+            if match:
+                self.hits[match[1]] += 1
+                RULE_HITS.inc(rule=match[1])
+            results.append(match[0] if match else None)
+        self.checked += len(results)
+        URLS_CHECKED.inc(len(results))
+        return results
+
+    def stats(self):
+        """ Hits and hit rate of every rule that fired, most frequent first. """
+        return {
+            "checked": self.checked,
+            "rules": [
+                {"rule": name, "hits": hits, "hit_rate": round(hits / self.checked, 4)}
+                for name, hits in self.hits.most_common()
+            ],
+        }
+
+
+default_engine = UrlRuleEngine()
+
+
+def check_url(url):
+    result = default_engine.check_url(url)
     if result:
-        print(f'Final Response: URL: {url} Category: {result}\n')
-        return result
-    
-    return None
+        log.info("categorized by url rule", url=url, category=result)
+    return result
+
+
+def check_urls(urls):
+    return default_engine.check_urls(urls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", help="file with one URL or domain per line")
+    parser.add_argument("--rules", default=RULES_PATH)
+    args = parser.parse_args()
+
+    engine = UrlRuleEngine(args.rules)
+    with open(args.urls, "r", encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    results = engine.check_urls(urls)
+    elapsed = time.perf_counter() - start
+
+    resolved = sum(result is not None for result in results)
+    print(f"{resolved} of {len(urls)} URLs ({resolved / len(urls):.1%}) categorized by rules "
+          f"in {elapsed:.2f}s ({len(urls) / elapsed:.0f} URLs/s)\n")
+    for rule in engine.stats()["rules"]:
+        print(f"{rule['rule']:<40} {rule['hits']:>8} {rule['hit_rate']:>8.2%}")
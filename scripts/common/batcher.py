@@ -0,0 +1,56 @@
+import asyncio
+
+
+class MicroBatcher:
+    """ Groups concurrent single-item calls into batched calls of `fn`.
+
+    `fn` takes a list of items and returns a list of results in the same
+    order. It runs on `executor` once `batch_size` items are waiting or
+    `max_delay` seconds after the first one arrived, whichever comes first.
+    A coroutine function is awaited on the event loop instead.
+    """
+
+    def __init__(self, fn, batch_size=32, max_delay=0.01, executor=None):
+        self.fn = fn
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.executor = executor
+        self._pending = []
+        self._timer = None
+        self._running = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            if asyncio.iscoroutinefunction(self.fn):
+                results = await self.fn(items)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(self.executor, self.fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
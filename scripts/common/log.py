@@ -0,0 +1,52 @@
+""" Leveled logging with key=value fields.
+
+    log = get_logger(__name__)
+    log.info("page scraped", site=site, tier="http")
+
+renders as
+
+    2025-03-01T12:00:00 INFO scripts.scraping.scrape page scraped site=example.com tier=http
+"""
+import logging
+
+_RESERVED = {"exc_info", "stack_info", "stacklevel", "extra"}
+
+
+def _format_field(value):
+    text = str(value)
+    if not text or any(char in text for char in " \"=\n"):
+        return '"' + text.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") + '"'
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s", "%Y-%m-%dT%H:%M:%S")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={_format_field(value)}" for key, value in fields.items())
+        return line
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """ Passes keyword arguments other than the logging ones on as fields of the record. """
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in _RESERVED}
+        kwargs.setdefault("extra", {})["fields"] = fields
+        return msg, kwargs
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def setup_logging(level="INFO"):
+    handler = logging.StreamHandler()
+    handler.setFormatter(KeyValueFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
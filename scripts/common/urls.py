@@ -0,0 +1,44 @@
+from urllib.parse import urlsplit
+import tldextract
+
+
+def normalize_url(site: str) -> str:
+    """ Canonical key for a site: scheme, "www." and default ports dropped, host lowercased.
+
+    "http://www.Example.com/", "https://example.com" and "example.com" all
+    map to "example.com"; a path other than "/" is kept.
+    """
+    site = site.strip()
+    try:
+        parts = urlsplit(site if "://" in site else f"http://{site}")
+    except ValueError:
+        # Unbalanced IPv6 brackets: not fetchable, but still a key of its own
+        return site.lower()
+    host = (parts.hostname or "").rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        # A port that isn't a number is kept as written, so the site still has a key
+        port = None
+        host = parts.netloc.rpartition("@")[2].lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/")
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return f"{host}{path}"
+
+
+def domain_key(site: str) -> str:
+    """ The registrable domain of a site, "example.co.uk" for "https://shop.example.co.uk/",
+    or its host when it has none (IP addresses, localhost).
+    """
+    site = site.strip()
+    try:
+        host = urlsplit(site if "://" in site else f"http://{site}").hostname or site
+    except ValueError:
+        host = site
+    host = host.lower().rstrip(".")
+    return tldextract.extract(host).registered_domain or host
@@ -0,0 +1,191 @@
+from playwright.async_api import async_playwright, Error as PlaywrightError
+from scripts.common.log import get_logger
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import psutil
+import re
+
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-gpu']
+
+# Text is read from DOM text nodes, so none of these affect what we extract
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "texttrack", "manifest"}
+
+TRACKER_HOSTS = re.compile(
+    r"^https?://([^/]+\.)?("
+    r"google-analytics\.com|googletagmanager\.com|doubleclick\.net|googlesyndication\.com"
+    r"|facebook\.net|hotjar\.com|segment\.io|scorecardresearch\.com|clarity\.ms"
+    r"|adnxs\.com|criteo\.com|taboola\.com|outbrain\.com"
+    r")[:/]"
+)
+
+log = get_logger(__name__)
+
+
+class PooledBrowser:
+    """ A launched Chromium instance with the context shared by its pages. """
+
+    def __init__(self, browser, context):
+        self.browser = browser
+        self.context = context
+        self.pages_served = 0
+        self.in_use = 0
+        self.crashed = False
+        self.retiring = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, _browser):
+        self.crashed = True
+
+    async def close(self):
+        try:
+            await self.context.close()
+            await self.browser.close()
+        except PlaywrightError:
+            pass  # Already gone
+
+
+class BrowserPool:
+    """ Long-lived Chromium browsers shared by every request.
+
+    Each of the `size` slots owns one browser and context that are reused
+    across jobs. A browser is replaced after serving `max_pages_per_browser`
+    pages, when the combined Chromium RSS goes over `max_rss_mb`, or when it
+    crashes. Replaced browsers are closed once their last open page is done.
+    Requests for `blocked_resource_types` and known trackers are aborted.
+    Chromium is started with `launch_args`.
+    """
+
+    def __init__(self, size=1, max_pages_per_browser=500, max_rss_mb=4096, rss_check_interval=30,
+                 blocked_resource_types=BLOCKED_RESOURCE_TYPES, launch_args=LAUNCH_ARGS):
+        self.size = size
+        self.launch_args = list(launch_args)
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.max_pages_per_browser = max_pages_per_browser
+        self.max_rss_mb = max_rss_mb
+        self.rss_check_interval = rss_check_interval
+        # Chromium memory measured by the last check of the memory watcher
+        self.last_rss_mb = 0.0
+        self._playwright = None
+        self._slots = [None] * size
+        self._locks = [asyncio.Lock() for _ in range(size)]
+        self._retired = set()
+        self._monitor = None
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        for index in range(self.size):
+            self._slots[index] = await self._launch()
+        self._monitor = asyncio.create_task(self._watch_memory())
+
+    async def close(self):
+        if self._monitor:
+            self._monitor.cancel()
+        for browser in [*self._slots, *self._retired]:
+            if browser:
+                await browser.close()
+        self._slots = [None] * self.size
+        self._retired.clear()
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def open_pages(self):
+        return sum(browser.in_use for browser in [*self._slots, *self._retired] if browser)
+
+    @asynccontextmanager
+    async def page(self):
+        """ Open a fresh page on the least busy healthy browser. """
+        browser = await self._acquire()
+        browser.in_use += 1
+        browser.pages_served += 1
+        page = None
+        try:
+            try:
+                page = await browser.context.new_page()
+            except PlaywrightError:
+                if not browser.browser.is_connected():
+                    browser.crashed = True
+                raise
+            yield page
+        finally:
+            if page and not page.is_closed():
+                try:
+                    await page.close()
+                except PlaywrightError:
+                    pass
+            browser.in_use -= 1
+            if browser.pages_served >= self.max_pages_per_browser:
+                browser.retiring = True
+            if browser in self._retired and browser.in_use == 0:
+                self._retired.discard(browser)
+                await browser.close()
+
+    def rss_mb(self):
+        """ Resident memory of all Chromium processes started by this server. """
+        total = 0
+        for child in psutil.Process(os.getpid()).children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+    async def _launch(self):
+        browser = await self._playwright.chromium.launch(headless=True, args=self.launch_args)
+        context = await browser.new_context()
+        await context.route("**/*", self._block_unneeded)
+        return PooledBrowser(browser, context)
+
+    async def _block_unneeded(self, route):
+        request = route.request
+        try:
+            if request.resource_type in self.blocked_resource_types or TRACKER_HOSTS.match(request.url):
+                await route.abort()
+            else:
+                await route.continue_()
+        except PlaywrightError:
+            pass  # Page closed while the request was in flight
+
+    async def _acquire(self):
+        index = min(range(self.size), key=lambda i: self._slots[i].in_use if self._slots[i] else 0)
+        browser = self._slots[index]
+        if browser is None or browser.crashed or browser.retiring:
+            async with self._locks[index]:
+                browser = self._slots[index]
+                if browser is None or browser.crashed or browser.retiring:
+                    browser = await self._replace(index)
+        return browser
+
+    async def _replace(self, index):
+        old = self._slots[index]
+        if old:
+            log.info("recycling browser", index=index, pages_served=old.pages_served, crashed=old.crashed)
+            if old.in_use and not old.crashed:
+                self._retired.add(old)
+            else:
+                await old.close()
+        self._slots[index] = await self._launch()
+        return self._slots[index]
+
+    async def _watch_memory(self):
+        """ Retire the busiest browser whenever Chromium memory goes over the limit. """
+        while True:
+            await asyncio.sleep(self.rss_check_interval)
+            try:
+                rss = await asyncio.get_running_loop().run_in_executor(None, self.rss_mb)
+            except psutil.Error:
+                continue
+            self.last_rss_mb = rss
+            live = [browser for browser in self._slots if browser and not browser.retiring]
+            if rss > self.max_rss_mb and live:
+                log.warning("chromium memory over limit", rss_mb=round(rss), max_rss_mb=self.max_rss_mb)
+                max(live, key=lambda browser: browser.pages_served).retiring = True
@@ -1,11 +1,193 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import tldextract
 import whois
+from scripts.common.log import get_logger
 
-def get_domain_country(domain):
-    try:
-        # Perform WHOIS Lookup
-        domain_info = whois.whois(domain)
-        whois_country = domain_info.get('country', 'N/A')
-    except Exception as e:
-        whois_country = f"N/A"
-    
-    return whois_country
+log = get_logger(__name__)
+
+# Country-code TLDs sold to everyone, so they say nothing about the owner's country
+GENERIC_CCTLDS = {
+    "ac", "ai", "am", "as", "cc", "cd", "cf", "co", "eu", "fm", "ga", "gg", "gq",
+    "io", "la", "ly", "me", "ml", "nu", "sh", "so", "st", "su", "tk", "to", "tv",
+    "vc", "ws",
+}
+
+# ccTLDs that differ from the ISO 3166 code returned by WHOIS
+CCTLD_COUNTRIES = {"uk": "GB"}
+
+COUNTRY_LINE = re.compile(r"^\s*(registrant\s+country|country)\s*:\s*(\S.*?)\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def registrable_domain(site):
+    """ The domain a registrar sells, e.g. "example.co.uk" for "https://www.example.co.uk/". """
+    return tldextract.extract(site).registered_domain.lower()
+
+
+def country_from_tld(domain):
+    """ Country implied by a country-code TLD, or None when the TLD is not conclusive. """
+    label = domain.rsplit(".", 1)[-1]
+    if len(label) != 2 or not label.isalpha() or label in GENERIC_CCTLDS:
+        return None
+    return CCTLD_COUNTRIES.get(label, label.upper())
+
+
+def query_whois_server(domain, host, port=43, timeout=10):
+    """ Plain WHOIS query (RFC 3912) against a specific server. """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(f"{domain}\r\n".encode("idna"))
+        chunks = []
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            chunks.append(data)
+    return b"".join(chunks).decode("utf-8", errors="replace")
+
+
+def parse_whois_country(text):
+    """ Registrant country from a raw WHOIS response, falling back to any country field. """
+    matches = COUNTRY_LINE.findall(text)
+    for field, value in matches:
+        if field.lower().startswith("registrant"):
+            return value
+    return matches[0][1] if matches else "N/A"
+
+
+class _DiskCache:
+    """ WHOIS answers kept in SQLite so they survive restarts. """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS whois_country "
+            "(domain TEXT PRIMARY KEY, country TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, domain):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT country FROM whois_country WHERE domain = ? AND expires_at > ?",
+                (domain, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, domain, country, ttl):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO whois_country VALUES (?, ?, ?)",
+                (domain, country, time.time() + ttl),
+            )
+            self._db.commit()
+
+
+class CountryResolver:
+    """ Non-blocking, cached WHOIS country lookups.
+
+    Lookups are keyed on the registrable domain and answered, in order, from
+    the ccTLD, an in-memory LRU, the on-disk cache, and finally a WHOIS query
+    on a bounded thread pool. Concurrent lookups of the same domain share one
+    query. Set `whois_server` to "host:port" to query one server directly,
+    e.g. a local stand-in during tests.
+    """
+
+    def __init__(self, max_workers=8, cache_size=10000, cache_path="cache/whois.sqlite3",
+                 ttl=30 * 86400, failure_ttl=86400, whois_server=None, timeout=10):
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.whois_server = whois_server
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="whois")
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._disk = None
+        self._disk_lock = threading.Lock()
+
+    async def resolve(self, site):
+        domain = registrable_domain(site)
+        if not domain:
+            return "N/A"
+
+        country = country_from_tld(domain)
+        if country:
+            return country
+
+        if domain in self._memory:
+            self._memory.move_to_end(domain)
+            return self._memory[domain]
+
+        task = self._inflight.get(domain)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve_uncached(domain))
+            self._inflight[domain] = task
+            task.add_done_callback(lambda _: self._inflight.pop(domain, None))
+        # Shield the shared lookup so one cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _resolve_uncached(self, domain):
+        loop = asyncio.get_running_loop()
+        country = await loop.run_in_executor(self._executor, self._lookup, domain)
+        self._memory[domain] = country
+        if len(self._memory) > self.cache_size:
+            self._memory.popitem(last=False)
+        return country
+
+    def _lookup(self, domain):
+        """ Disk cache, then WHOIS. Runs on the thread pool. """
+        disk = self._get_disk()
+        if disk:
+            country = disk.get(domain)
+            if country is not None:
+                return country
+
+        country = self._query(domain)
+        if disk:
+            disk.put(domain, country, self.ttl if country != "N/A" else self.failure_ttl)
+        return country
+
+    def _query(self, domain):
+        try:
+            if self.whois_server:
+                host, _, port = self.whois_server.partition(":")
+                text = query_whois_server(domain, host, int(port or 43), self.timeout)
+                country = parse_whois_country(text)
+            else:
+                country = whois.whois(domain).get('country')
+        except Exception as e:
+            log.warning("whois lookup failed", domain=domain, error=e)
+            return "N/A"
+
+        if isinstance(country, list):
+            country = country[0] if country else None
+        return str(country).strip().upper() if country else "N/A"
+
+    def _get_disk(self):
+        if self.cache_path and self._disk is None:
+            with self._disk_lock:
+                if self._disk is None:
+                    self._disk = _DiskCache(self.cache_path)
+        return self._disk
+
+
+default_resolver = CountryResolver()
+
+
+async def get_domain_country(domain, resolver=None):
+    return await (resolver or default_resolver).resolve(domain)
@@ -0,0 +1,162 @@
+import aiohttp
+import asyncio
+import errno
+import re
+import socket
+from scripts.common.log import get_logger
+from scripts.common.metrics import span
+from scripts.scraping.readiness import PageFailure
+from scripts.scraping.text_extractor import extract_page
+
+log = get_logger(__name__)
+
+HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# Signs that the static HTML is an app shell whose content is rendered by JavaScript.
+# A "please enable JavaScript" notice is not one: server-rendered pages carry it
+# in <noscript> too, and a real shell showing it has too little text anyway.
+SPA_MARKERS = re.compile(
+    r"<div[^>]+id=[\"'](?:root|app|__nuxt|svelte)[\"'][^>]*>\s*</div>"
+    r"|<app-root|ng-app|data-reactroot|window\.__NUXT__"
+    r"|<meta[^>]+http-equiv=[\"']?refresh",
+    re.IGNORECASE,
+)
+
+READ_CHUNK_BYTES = 64 * 1024
+
+# Resolver answers that only mean "not right now"
+TRANSIENT_DNS_ERRORS = {socket.EAI_AGAIN}
+
+
+def classify_fetch_error(error):
+    """ The PageFailure a failed plain HTTP fetch amounts to; permanent ones would fail in Chromium too.
+
+    HTTP error statuses are never permanent here: bot protection answers
+    plain clients with 4xx pages that a browser gets past.
+    """
+    if isinstance(error, aiohttp.ClientSSLError):
+        return PageFailure("tls", True, str(error))
+    if isinstance(error, aiohttp.TooManyRedirects):
+        return PageFailure("too_many_redirects", True)
+    if isinstance(error, aiohttp.InvalidURL):
+        return PageFailure("invalid_url", True, str(error))
+    if isinstance(error, aiohttp.ClientConnectorError):
+        cause = error.os_error
+        if isinstance(cause, socket.gaierror) or isinstance(error, getattr(aiohttp, "ClientConnectorDNSError", ())):
+            return PageFailure("dns", cause.errno not in TRANSIENT_DNS_ERRORS, str(error))
+        if isinstance(cause, ConnectionRefusedError):
+            return PageFailure("connection_refused", True, str(error))
+        if cause.errno == errno.EHOSTUNREACH:
+            return PageFailure("unreachable", True, str(error))
+    if isinstance(error, asyncio.TimeoutError):
+        return PageFailure("timeout", False)
+    return PageFailure("network", False, str(error))
+
+
+async def read_body(content, max_bytes):
+    """ The body of a response, cut at `max_bytes`, read from its StreamReader `content`.
+
+    `content.read(n)` returns whatever is buffered, often a single chunk, so
+    the body is read chunk by chunk until it ends or reaches the cap.
+    """
+    chunks, size = [], 0
+    async for chunk in content.iter_chunked(READ_CHUNK_BYTES):
+        chunk = chunk[:max_bytes - size]
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    return b"".join(chunks)
+
+
+class HttpFetcher:
+    """ Cheap first tier: a plain pooled HTTP GET instead of a browser render.
+
+    `fetch_page` returns None whenever the page should be escalated to
+    Playwright: the request failed, the response isn't HTML, the static
+    text is shorter than `min_text_chars`, or the markup looks like a
+    JavaScript app shell. A request that failed in a way a browser could
+    not get past either, such as an unknown host or a refused connection,
+    raises a permanent PageFailure instead.
+    """
+
+    def __init__(self, max_connections=100, timeout=10, max_bytes=5 * 1024 * 1024, min_text_chars=500, resolver=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.min_text_chars = min_text_chars
+        # An aiohttp resolver used instead of the system one
+        self.resolver = resolver
+        self._session = None
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300,
+                                             resolver=self.resolver)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def fetch(self, site):
+        """ GET `site` following redirects. Returns (final_url, html), or None if it isn't usable HTML.
+
+        Raises a permanent PageFailure when the site can't be reached at all.
+        """
+        await self.start()
+        url = site if "://" in site else f"http://{site}"
+        try:
+            async with self._session.get(url, allow_redirects=True, max_redirects=10) as response:
+                if response.status >= 400 or "html" not in response.headers.get("Content-Type", "html"):
+                    return None
+                body = await read_body(response.content, self.max_bytes)
+                encoding = response.charset or "utf-8"
+                try:
+                    html = body.decode(encoding, errors="replace")
+                except LookupError:
+                    html = body.decode("utf-8", errors="replace")
+                return str(response.url), html
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            failure = classify_fetch_error(e)
+            log.info("http fetch failed", site=site, reason=failure.reason, permanent=failure.permanent, error=e)
+            if failure.permanent:
+                raise failure from e
+            return None
+
+    def needs_browser(self, html, text):
+        return len(text) < self.min_text_chars or bool(SPA_MARKERS.search(html))
+
+    async def fetch_page(self, site):
+        """ Returns (final_url, extracted page) when static HTML is enough, otherwise None.
+
+        Raises a permanent PageFailure when the site can't be reached at all.
+        """
+        with span("http_fetch"):
+            fetched = await self.fetch(site)
+        if fetched is None:
+            return None
+        final_url, html = fetched
+        # Parsing a large page takes long enough to be worth moving off the event loop
+        with span("extract"):
+            page = await asyncio.get_running_loop().run_in_executor(None, extract_page, html)
+        if self.needs_browser(html, page["text"]):
+            return None
+        return final_url, page
@@ -1,14 +1,148 @@
-from langdetect import detect, DetectorFactory
-from langdetect.lang_detect_exception import LangDetectException
+""" Language identification of scraped pages.
 
-# To get consistent results (optional)
-DetectorFactory.seed = 0
+Two backends return (language code, confidence):
 
-def detect_language(text: str) -> str:
+    fasttext    the fastText LID model over a bounded sample of the page,
+                batched on an executor (default)
+    langdetect  the previous pure-Python detector, kept for comparison
+
+The fastText model is downloaded to LID_MODEL_PATH on first use.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from scripts.common.batcher import MicroBatcher
+from scripts.common.log import get_logger
+import asyncio
+import os
+import re
+import threading
+import urllib.request
+
+LID_MODEL_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz"
+LID_MODEL_PATH = "cache/lid.176.ftz"
+
+# Characters of page text the fastText backend looks at
+SAMPLE_CHARS = 2000
+
+WHITESPACE = re.compile(r"\s+")
+
+log = get_logger(__name__)
+
+
+def sample_text(text, max_chars=SAMPLE_CHARS):
+    """ A single-line sample of at most `max_chars` from the start and the middle of the text. """
+    if len(text) > max_chars:
+        # Page starts are often navigation in another language than the body
+        half = max_chars // 2
+        middle = len(text) // 2
+        text = f"{text[:half]} {text[middle:middle + half]}"
+    return WHITESPACE.sub(" ", text).strip()
+
+
+class FastTextDetector:
+    """ fastText language identification; concurrent pages are predicted together in batches. """
+
+    name = "fasttext"
+
+    def __init__(self, model_path=LID_MODEL_PATH, sample_chars=SAMPLE_CHARS, batch_size=64, max_delay=0.005,
+                 executor=None):
+        self.model_path = model_path
+        self.sample_chars = sample_chars
+        self._model = None
+        self._lock = threading.Lock()
+        self._batcher = MicroBatcher(
+            self.detect_many,
+            batch_size=batch_size,
+            max_delay=max_delay,
+            executor=executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="language"),
+        )
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import fasttext
+                    if not os.path.exists(self.model_path):
+                        log.info("downloading fastText language model", path=self.model_path)
+                        os.makedirs(os.path.dirname(self.model_path) or ".", exist_ok=True)
+                        temp_path = f"{self.model_path}.{os.getpid()}.tmp"
+                        urllib.request.urlretrieve(LID_MODEL_URL, temp_path)
+                        os.replace(temp_path, self.model_path)
+                    self._model = fasttext.load_model(self.model_path)
+        return self._model
+
+    def detect_many(self, texts):
+        model = self.load()
+        samples = [sample_text(text, self.sample_chars) for text in texts]
+        # A list is predicted in one native call; fastText requires each sample on a single line
+        labels, probabilities = model.predict(samples, k=1, on_unicode_error="replace")
+        results = []
+        for sample, label, probability in zip(samples, labels, probabilities):
+            if not sample or not label:
+                results.append(("Unknown", 0.0))
+            else:
+                results.append((label[0].replace("__label__", ""), round(min(float(probability[0]), 1.0), 4)))
+        return results
+
+    async def detect(self, text):
+        return await self._batcher.submit(text)
+
+
+class LangdetectDetector:
+    """ The previous langdetect backend over the full text, run off the event loop. """
+
+    name = "langdetect"
+
+    def __init__(self, executor=None):
+        self.executor = executor
+
+    def load(self):
+        from langdetect import DetectorFactory
+        # To get consistent results
+        DetectorFactory.seed = 0
+
+    def detect_many(self, texts):
+        from langdetect import detect_langs
+        from langdetect.lang_detect_exception import LangDetectException
+        self.load()
+        results = []
+        for text in texts:
+            try:
+                best = detect_langs(text)[0]
+                results.append((best.lang, round(best.prob, 4)))
+            except LangDetectException:
+                results.append(("Unknown", 0.0))
+        return results
+
+    async def detect(self, text):
+        results = await asyncio.get_running_loop().run_in_executor(self.executor, self.detect_many, [text])
+        return results[0]
+
+
+BACKENDS = {
+    FastTextDetector.name: FastTextDetector,
+    LangdetectDetector.name: LangdetectDetector,
+}
+
+
+def make_detector(backend="fasttext", **kwargs):
     try:
-        # Detect language of the provided text
-        language = detect(text)
-        return language
-    except LangDetectException:
+        return BACKENDS[backend](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown language detector {backend!r}, expected one of {sorted(BACKENDS)}") from None
+
+
+default_detector = FastTextDetector()
+
+
+async def identify_language(text, detector=None):
+    """ (language code, confidence) of a page's text, ("Unknown", 0.0) when it can't be told. """
+    if not text:
+        return "Unknown", 0.0
+    return await (detector or default_detector).detect(text)
+
+
+def detect_language(text: str) -> str:
+    """ Language code of the text using the default backend, for synchronous callers. """
+    if not text:
         return "Unknown"
-    
\ No newline at end of file
+    return default_detector.detect_many([text])[0][0]
@@ -0,0 +1,139 @@
+""" When a page rendered in Chromium is ready to read, and why a page could not be read.
+
+Waiting for `networkidle` costs the full timeout on every page with analytics
+beacons or long polling, so pages are loaded up to DOMContentLoaded and then
+watched: they are read as soon as enough text is present or the amount of
+text has stopped changing, within one deadline for the whole site.
+
+Failures carry a short reason reported with each result, and are split into
+permanent ones that retrying cannot fix (unknown host, TLS errors, HTTP 4xx)
+and transient ones worth another attempt (timeouts, resets, HTTP 5xx).
+"""
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+import asyncio
+import random
+import re
+
+# Length of the rendered text, the cheap signal polled while a page settles
+TEXT_LENGTH_JS = "() => document.body ? document.body.innerText.length : 0"
+
+NET_ERROR = re.compile(r"net::(ERR_[A-Z0-9_]+)")
+
+# Chromium network errors that another attempt at the same URL will not fix
+PERMANENT_NET_ERRORS = {
+    "ERR_NAME_NOT_RESOLVED": "dns",
+    "ERR_NAME_RESOLUTION_FAILED": "dns",
+    "ERR_CONNECTION_REFUSED": "connection_refused",
+    "ERR_ADDRESS_UNREACHABLE": "unreachable",
+    "ERR_ADDRESS_INVALID": "unreachable",
+    "ERR_TOO_MANY_REDIRECTS": "too_many_redirects",
+    "ERR_INVALID_URL": "invalid_url",
+    "ERR_UNSAFE_PORT": "invalid_url",
+    "ERR_INVALID_RESPONSE": "invalid_response",
+}
+
+TRANSIENT_NET_ERRORS = {
+    "ERR_TIMED_OUT": "timeout",
+    "ERR_CONNECTION_TIMED_OUT": "timeout",
+    "ERR_CONNECTION_RESET": "connection_reset",
+    "ERR_CONNECTION_CLOSED": "connection_reset",
+    "ERR_CONNECTION_ABORTED": "connection_reset",
+    "ERR_EMPTY_RESPONSE": "empty_response",
+    "ERR_NETWORK_CHANGED": "network",
+    "ERR_INTERNET_DISCONNECTED": "network",
+    "ERR_HTTP2_PROTOCOL_ERROR": "protocol_error",
+    "ERR_QUIC_PROTOCOL_ERROR": "protocol_error",
+}
+
+# Client errors that mean "not now" rather than "never"
+TRANSIENT_STATUSES = {408, 425, 429}
+
+
+class PageFailure(Exception):
+    """ A page that could not be read; `reason` is reported with the site's result. """
+
+    def __init__(self, reason, permanent, detail=""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.permanent = permanent
+
+
+def classify_error(error):
+    """ The PageFailure an exception raised while loading a page amounts to. """
+    if isinstance(error, PageFailure):
+        return error
+    message = str(error)
+    match = NET_ERROR.search(message)
+    if match:
+        code = match[1]
+        if code.startswith(("ERR_CERT_", "ERR_SSL_")) or code == "ERR_BAD_SSL_CLIENT_AUTH_CERT":
+            return PageFailure("tls", True, code)
+        if code in PERMANENT_NET_ERRORS:
+            return PageFailure(PERMANENT_NET_ERRORS[code], True, code)
+        return PageFailure(TRANSIENT_NET_ERRORS.get(code, "network"), False, code)
+    if isinstance(error, PlaywrightTimeoutError):
+        return PageFailure("timeout", False)
+    return PageFailure("browser_error", False, message.splitlines()[0][:200] if message else "")
+
+
+def check_response(response):
+    """ Raise a PageFailure when the main document came back with an HTTP error. """
+    if response is None or response.status < 400:
+        return
+    permanent = response.status < 500 and response.status not in TRANSIENT_STATUSES
+    raise PageFailure(f"http_{response.status}", permanent)
+
+
+class PageReadiness:
+    """ How long to wait for a page and how to retry it.
+
+    A site gets `deadline` seconds in all, navigations included. A loaded
+    page is read once it shows `min_chars` characters of text, or once its
+    text length has stayed the same for `stable_for` seconds, checking every
+    `poll_interval` seconds; a page still without any text is given
+    `empty_for` seconds before it is read as empty. Transient failures are tried again up to
+    `max_attempts` attempts in all, after a jittered exponential backoff
+    starting at `backoff` seconds.
+    """
+
+    def __init__(self, deadline=30, goto_timeout=15, min_chars=2000, stable_for=1.0, empty_for=5.0,
+                 poll_interval=0.25, max_attempts=2, backoff=1.0):
+        self.deadline = deadline
+        self.goto_timeout = goto_timeout
+        self.min_chars = min_chars
+        self.stable_for = stable_for
+        self.empty_for = empty_for
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def retry_delay(self, attempt):
+        """ Seconds to wait before attempt `attempt + 1`. """
+        return self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    async def wait(self, page, deadline):
+        """ Wait for the page to be ready, never past the loop time `deadline`.
+
+        Returns what ended the wait: "content", "stable" or "deadline".
+        """
+        loop = asyncio.get_running_loop()
+        length, changed_at = -1, loop.time()
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return "deadline"
+            try:
+                current = await asyncio.wait_for(page.evaluate(TEXT_LENGTH_JS), remaining)
+            except asyncio.TimeoutError:
+                return "deadline"
+            except PlaywrightError:
+                # A client-side redirect replaced the document; keep watching the new one
+                current = -1
+            now = loop.time()
+            if current >= self.min_chars:
+                return "content"
+            if current != length:
+                length, changed_at = current, now
+            elif now - changed_at >= (self.stable_for if current > 0 else self.empty_for):
+                return "stable"
+            await asyncio.sleep(min(self.poll_interval, max(0.0, deadline - now)))
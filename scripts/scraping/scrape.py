@@ -1,111 +1,251 @@
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-from scripts.scraping.language_detector import detect_language
+from playwright.async_api import Error as PlaywrightError
+from scripts.scraping.browser_pool import BrowserPool
+from scripts.scraping.language_detector import identify_language
 from scripts.scraping.check_domain_country import get_domain_country
 from scripts.scraping.check_subdomain import is_subdomain
-from bs4 import BeautifulSoup
+from scripts.scraping.http_fetcher import HttpFetcher
+from scripts.scraping.readiness import PageFailure, PageReadiness, check_response, classify_error
+from scripts.scraping.text_extractor import extract_page_from_browser
+from scripts.common import metrics
+from scripts.common.log import get_logger
+from scripts.common.metrics import collect_timings, span
+from scripts.common.urls import normalize_url
+from scripts.server.pipeline import windowed
+from contextlib import AsyncExitStack, nullcontext
 import asyncio
 
-# Function to extract text content from a webpage
-async def extract_text_content(page, site: str, error_log_path: str, max_retries=2) -> str:
-    print(f"Extracting content from site: {site}")
+SITES_SCRAPED = metrics.counter("scraper_sites_total", "Sites scraped, by tier and outcome", ["tier", "outcome"])
+
+PAGE_FAILURES = metrics.counter("scraper_page_failures_total", "Sites that could not be read, by reason", ["reason"])
+
+log = get_logger(__name__)
 
-    retries = 0
-    while retries < max_retries:
+default_readiness = PageReadiness()
+
+# Function to extract text content from a webpage
+async def extract_text_content(page, site: str, error_log_path: str, max_retries=None, detector=None,
+                               readiness=None):
+    """ Load `site` in `page` and read it, returning (final_url, extracted, language, failure).
+
+    The page is read as soon as `readiness` considers it ready. Transient
+    failures are retried with a jittered backoff while the site's deadline
+    allows, up to `max_retries` attempts (the readiness default without it).
+    On failure extracted and language are None and failure, a PageFailure, says why.
+    """
+    log.debug("extracting content", site=site)
+    readiness = readiness or default_readiness
+    max_attempts = max_retries or readiness.max_attempts
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + readiness.deadline
+
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            # Navigate to the site with a timeout for slow pages
-            response = await page.goto(site, timeout=15000)  # 15-second timeout
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Not worth retrying, but a sign of load rather than of a broken site
+                raise PageFailure("deadline", False)
+            # Only wait for the document itself; readiness decides when the content is there
+            with span("goto"):
+                response = await page.goto(site, wait_until="domcontentloaded",
+                                           timeout=min(readiness.goto_timeout, remaining) * 1000)
+            check_response(response)
 
             # Capture the final URL if redirected
             final_url = response.url if response else site
-            print(f"Redirected to: {final_url}")
+            log.debug("navigated", site=site, final_url=final_url)
 
-            # Wait for the page to load
-            await page.wait_for_selector('body', timeout=15000)
-            await page.wait_for_load_state('networkidle', timeout=15000)
+            with span("wait_load"):
+                ready = await readiness.wait(page, deadline)
 
-            # Extract HTML content
-            html_content = await page.content()
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            # Extract main content
-            main_content = soup.find_all(["article", "section", "main", "div"])
-            text_content = " ".join([element.get_text(separator=" ", strip=True) for element in main_content])
-
-            # Clean the content
-            cleaned_content = ' '.join(text_content.split())
-            if not cleaned_content:
-                raise ValueError("Content is empty or failed to load properly.")
+            # Extract visible text straight from the rendered DOM, skipping boilerplate
+            with span("extract"):
+                extracted = await extract_page_from_browser(page)
+            if not extracted["text"]:
+                # Readiness already gave the page all the time it was going to get
+                raise PageFailure("empty", True, f"ready={ready}")
 
             # Detect language
-            language = detect_language(cleaned_content)
-            language = language if language else 'Unknown'
-
-            return final_url, cleaned_content, language
-
-        except (PlaywrightTimeoutError, ValueError) as e:
-            print(f"Attempt {retries+1} failed for {site}: {e}")
-            retries += 1
-            await asyncio.sleep(2)  # Wait before retrying
-
-    # If all retries fail, return None
-    print(f"Failed to scrape {site} after {max_retries} attempts.")
-    return site, None, None
-
-
-async def scrape_website(page, site: str) -> tuple:
+            with span("language"):
+                language = await identify_language(extracted["text"], detector)
+
+            return final_url, extracted, language, None
+
+        except (PlaywrightError, PageFailure) as e:
+            failure = classify_error(e)
+            delay = readiness.retry_delay(attempt)
+            if failure.permanent or attempt >= max_attempts or loop.time() + delay >= deadline:
+                log.warning("giving up", site=site, reason=failure.reason, permanent=failure.permanent,
+                            attempts=attempt, error=failure)
+                return site, None, None, failure
+            log.info("attempt failed, retrying", site=site, reason=failure.reason, attempt=attempt,
+                     delay=round(delay, 2))
+            await asyncio.sleep(delay)
+
+
+async def scrape_website(pool, site: str, resolver=None, fetcher=None, detector=None, readiness=None,
+                         slot=None) -> dict:
+    """ Scrape one site, trying a plain HTTP fetch before rendering it in a browser tab.
+
+    `slot` is an optional callable returning an async context manager held
+    while the page is rendered, so only the browser tier waits for a tab.
+    """
     sub_domain, domain = is_subdomain(site)
-    print(sub_domain, domain)
-    country = get_domain_country(site)
-    print(country)
-    final_url, content, language = await extract_text_content(page, site, error_log_path=None)
-    print(f"language for {site} is : {language}")
-    if content:
-        return site, final_url, language, country, sub_domain, domain, content
-    else:
-        return site, None, None, None, sub_domain, domain, None
 
+    async def lookup_country():
+        with span("country"):
+            return await get_domain_country(site, resolver)
 
-# Main scraping function
-async def scrape_all_websites(domains: list, max_tabs: int):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-gpu']
+    # Resolve the country while the page loads
+    country_task = asyncio.ensure_future(lookup_country())
+    try:
+        failure = None
+        try:
+            fetched = await fetcher.fetch_page(site) if fetcher else None
+        except PageFailure as e:
+            fetched, failure = None, e
+        if fetched:
+            tier = "http"
+            final_url, extracted = fetched
+            with span("language"):
+                language = await identify_language(extracted["text"], detector)
+        elif failure:
+            # Chromium would fail the same way, so the site never waits for a tab
+            tier = "http"
+            final_url, extracted, language = site, None, None
+        else:
+            tier = "browser"
+            async with AsyncExitStack() as stack:
+                with span("slot_wait"):
+                    await stack.enter_async_context(slot() if slot else nullcontext())
+                with span("browser"):
+                    async with pool.page() as page:
+                        final_url, extracted, language, failure = await extract_text_content(
+                            page, site, error_log_path=None, detector=detector, readiness=readiness)
+        # Time spent waiting on WHOIS after the page was already read
+        with span("country_wait"):
+            country = await country_task
+    finally:
+        country_task.cancel()
+
+    log.info("site scraped", site=site, tier=tier, final_url=final_url, country=country,
+             language=language[0] if extracted else None, sub_domain=sub_domain, domain=domain,
+             failure_reason=failure.reason if failure else None)
+
+    result = {
+        'site': site,
+        'final_url': None,
+        'content': None,
+        'title': None,
+        'description': None,
+        'headings': None,
+        'language': None,
+        'language_confidence': None,
+        'country': None,
+        'sub_domain': sub_domain,
+        'domain': domain,
+        'tier': tier,
+        'failure_reason': failure.reason if failure else None,
+        'failure_permanent': bool(failure and failure.permanent),
+    }
+    if extracted:
+        result.update(
+            final_url=final_url,
+            content=extracted["text"],
+            title=extracted["title"],
+            description=extracted["description"],
+            headings=extracted["headings"],
+            language=language[0],
+            language_confidence=language[1],
+            country=country,
         )
+    return result
 
-        # Shared browser context
-        context = await browser.new_context()
-
-        semaphore = asyncio.Semaphore(max_tabs)
 
-        async def scrape_with_semaphore(site):
+# Main scraping function
+async def scrape_all_websites(domains, max_tabs: int, slot=None, pool=None, resolver=None, fetcher=None,
+                              detector=None, workers=None, host_limiter=None, controller=None, readiness=None,
+                              flights=None):
+    """ Scrape `domains`, a list or an async iterator read lazily, yielding results as they finish.
+
+    At most `max_tabs` sites are in progress. Each site is fetched over
+    plain HTTP with `fetcher` and only rendered in a page from `pool`, while
+    holding `slot()` when given, if that is not enough; with `workers`, a
+    WorkerPool, sites are scraped in its processes instead. Without either,
+    a browser and fetcher are started for this call. A site that could not
+    be scraped still yields a result, with a `failure_reason`. The other
+    arguments are the country `resolver`, language `detector`, HostLimiter,
+    AdaptiveConcurrency controller, PageReadiness and SingleFlight to use.
+    """
+    if pool is None and workers is None:
+        async with BrowserPool() as own_pool, HttpFetcher() as own_fetcher:
+            async for result in scrape_all_websites(domains, max_tabs, slot=slot, pool=own_pool,
+                                                    resolver=resolver, fetcher=own_fetcher, detector=detector,
+                                                    readiness=readiness, flights=flights):
+                yield result
+        return
+
+    async def scrape_in_slot(site):
+        with collect_timings() as timings:
             try:
-                async with semaphore:
-                    page = await context.new_page()  # Create a new page in the shared context
-                    site, final_url, language, country, sub_domain, domain, content = await scrape_website(page, site)
-                    return {
-                        'site': site,
-                        'final_url': final_url,
-                        'content': content,
-                        'language': language,
-                        'country': country,
-                        'sub_domain': sub_domain,
-                        'domain': domain
-                    }
+                async with AsyncExitStack() as stack:
+                    # The host is waited for before any tab, so a busy host never holds a tab idle
+                    with span("host_wait"):
+                        if host_limiter:
+                            await stack.enter_async_context(host_limiter.hold(site))
+                    with span("scrape"):
+                        if workers:
+                            result = await workers.scrape(site, slot)
+                        else:
+                            result = await scrape_website(pool, site, resolver, fetcher, detector, readiness,
+                                                          slot)
+                if result is None:
+                    raise RuntimeError("the scrape worker could not scrape the site")
             except Exception as e:
-                print(f"Error scraping {site}: {str(e)}")
-                return None
-            finally:
-                if not page.is_closed():
-                    await page.close()
-
+                SITES_SCRAPED.inc(tier="unknown", outcome="error")
+                PAGE_FAILURES.inc(reason="error")
+                if controller:
+                    controller.record(timings.get("scrape", 0), ok=False)
+                log.error("scrape error", site=site, error=e)
+                return {'site': site, 'content': None, 'failure_reason': "error", 'timings': timings}
+        SITES_SCRAPED.inc(tier=result["tier"], outcome="ok" if result["content"] else "empty")
+        if not result["content"]:
+            PAGE_FAILURES.inc(reason=result.get("failure_reason") or "empty")
+        # A worker's result already carries the timings of its own stages
+        for stage, seconds in result.get("timings", {}).items():
+            timings[stage] = round(timings.get(stage, 0) + seconds, 4)
+        result["timings"] = timings
+        if controller and result["tier"] == "browser":
+            # Only rendered pages use tabs; the time spent waiting for one says nothing of the page
+            controller.record(timings["scrape"] - timings.get("slot_wait", 0), ok=bool(result["content"]),
+                              permanent=result.get("failure_permanent", False))
+        return result
+
+    async def scrape_shared(site):
+        if not flights:
+            return await scrape_in_slot(site)
         try:
-            # Collect results in parallel but return them one by one
-            tasks = [scrape_with_semaphore(site) for site in domains]
-            for result in asyncio.as_completed(tasks):
-                yield await result  # Return each result sequentially for categorization
+            url_key = normalize_url(site)
         except Exception as e:
-            print(f"Error during scraping: {e}")
-        finally:
-            await context.close()
-            await browser.close()
+            # A site without a key is scraped on its own rather than failing the stream
+            log.warning("no dedup key for site", site=site, error=e)
+            return await scrape_in_slot(site)
+        result, key = await flights.do([("input", url_key)], scrape_in_slot, site)
+        if key is None:
+            return result
+        sub_domain, domain = is_subdomain(site)
+        return {**result, 'site': site, 'sub_domain': sub_domain, 'domain': domain, 'timings': {},
+                'shared': key[0], 'shared_with': result['site']}
+
+    results = windowed(domains, scrape_shared, max_tabs)
+    try:
+        async for result in results:
+            yield result  # Return each result sequentially for categorization
+    except Exception as e:
+        # Ending the stream quietly would leave the remaining sites without results
+        log.error("scrape dispatch failed", error=e)
+        raise
+    finally:
+        # Stop outstanding work if the consumer went away early
+        await results.aclose()
@@ -0,0 +1,216 @@
+from html.parser import HTMLParser
+import json
+import re
+
+# Elements whose whole subtree never holds readable page content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "nav", "object", "canvas"}
+
+# Containers dropped when their id or class marks them as a cookie/consent banner
+BOILERPLATE_CONTAINERS = {"div", "section", "aside", "form", "dialog", "header", "footer", "ul", "table"}
+BOILERPLATE_PATTERN = r"cookie|consent|gdpr|onetrust|cc-window"
+BOILERPLATE = re.compile(BOILERPLATE_PATTERN, re.IGNORECASE)
+
+HEADING_TAGS = {"h1", "h2", "h3"}
+MAX_HEADINGS = 50
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+# Start tags that close a still open <p> without its end tag
+P_CLOSERS = {
+    "address", "article", "aside", "blockquote", "details", "dialog", "div", "dl", "fieldset", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hgroup", "hr", "main", "menu",
+    "nav", "ol", "p", "pre", "section", "table", "ul",
+}
+
+# Elements whose end tag may be left out, with the start tags of siblings that close them
+IMPLIED_END = {
+    "p": P_CLOSERS,
+    "li": {"li"},
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+    "option": {"option", "optgroup"},
+    "optgroup": {"optgroup"},
+    "tr": {"tr", "tbody", "tfoot"},
+    "td": {"td", "th", "tr", "tbody", "tfoot"},
+    "th": {"td", "th", "tr", "tbody", "tfoot"},
+    "thead": {"tbody", "tfoot"},
+    "tbody": {"tbody", "tfoot"},
+    "caption": {"colgroup", "thead", "tbody", "tfoot", "tr"},
+}
+
+
+class _TextCollector(HTMLParser):
+    """ Streams through the document once, keeping every text node outside skipped subtrees. """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title_parts = []
+        self.description = ""
+        self.headings = []
+        self._heading_parts = None
+        self._in_title = False
+        self._skip_tag = None
+        # Elements opened inside the skipped one and not closed yet
+        self._skip_open = []
+        # Open elements outside skipped subtrees; the skipped one's ancestors are the first `_skip_depth`
+        self._open = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            self._read_meta(dict(attrs))
+        if tag in VOID_TAGS:
+            return
+        if self._skip_tag:
+            if tag in IMPLIED_END.get(self._skip_tag, ()) and (self._skip_tag == "p" or not self._skip_open):
+                # A sibling closed the skipped element the way the browser would
+                self._skip_tag = None
+            else:
+                self._skip_open.append(tag)
+                return
+        while self._open and tag in IMPLIED_END.get(self._open[-1], ()):
+            self._open.pop()
+        if tag in SKIP_TAGS or self._is_hidden(tag, dict(attrs)):
+            self._skip_tag = tag
+            self._skip_open = []
+            self._skip_depth = len(self._open)
+            return
+        self._open.append(tag)
+        if tag == "title":
+            self._in_title = True
+        elif tag in HEADING_TAGS:
+            self._heading_parts = []
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "meta":
+            self._read_meta(dict(attrs))
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag in self._skip_open:
+                # Closes an element inside the skipped one, and any left open within it
+                del self._skip_open[len(self._skip_open) - 1 - self._skip_open[::-1].index(tag):]
+                return
+            if tag == self._skip_tag:
+                self._skip_tag = None
+                return
+            if tag not in self._open[:self._skip_depth]:
+                # A stray end tag, ignored as the browser does
+                return
+            # Never let an unclosed element swallow the page: the end of an
+            # enclosing element ends the skipped one too
+            self._skip_tag = None
+        if tag in self._open:
+            del self._open[len(self._open) - 1 - self._open[::-1].index(tag):]
+        if tag == "title":
+            self._in_title = False
+        elif tag in HEADING_TAGS and self._heading_parts is not None:
+            heading = ' '.join(" ".join(self._heading_parts).split())
+            if heading and len(self.headings) < MAX_HEADINGS:
+                self.headings.append(heading)
+            self._heading_parts = None
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title_parts.append(data)
+        elif not self._skip_tag:
+            self.parts.append(data)
+            if self._heading_parts is not None:
+                self._heading_parts.append(data)
+
+    def _read_meta(self, attrs):
+        name = (attrs.get("name") or attrs.get("property") or "").lower()
+        if name in ("description", "og:description") and not self.description:
+            self.description = ' '.join((attrs.get("content") or "").split())
+
+    @staticmethod
+    def _is_hidden(tag, attrs):
+        if "hidden" in attrs or attrs.get("aria-hidden") == "true" or attrs.get("role") == "navigation":
+            return True
+        if tag in BOILERPLATE_CONTAINERS:
+            marker = f"{attrs.get('id') or ''} {attrs.get('class') or ''}"
+            return bool(BOILERPLATE.search(marker))
+        return False
+
+
+def extract_page(html: str) -> dict:
+    """ Title, meta description, h1-h3 headings and visible text of an HTML document.
+
+    The text has each text node emitted exactly once.
+    """
+    collector = _TextCollector()
+    collector.feed(html)
+    collector.close()
+    return {
+        "title": ' '.join(" ".join(collector.title_parts).split()),
+        "description": collector.description,
+        "headings": collector.headings,
+        "text": ' '.join(" ".join(collector.parts).split()),
+    }
+
+
+def extract_text(html: str) -> str:
+    """ Visible text of an HTML document with each text node emitted exactly once. """
+    return extract_page(html)["text"]
+
+
+# The same walk done inside the browser, so the rendered DOM is read directly
+# instead of serializing it with page.content() and parsing it again
+EXTRACT_TEXT_JS = """
+() => {
+    const SKIP = new Set(%s);
+    const CONTAINERS = new Set(%s);
+    const BOILERPLATE = new RegExp(%s, "i");
+    const root = document.body || document.documentElement;
+    if (!root) return "";
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT, {
+        acceptNode(node) {
+            if (node.nodeType === Node.TEXT_NODE) return NodeFilter.FILTER_ACCEPT;
+            const tag = node.localName;
+            if (SKIP.has(tag) || node.hidden || node.getAttribute("aria-hidden") === "true"
+                || node.getAttribute("role") === "navigation") {
+                return NodeFilter.FILTER_REJECT;
+            }
+            const marker = (node.id || "") + " " + (node.getAttribute("class") || "");
+            if (CONTAINERS.has(tag) && BOILERPLATE.test(marker)) return NodeFilter.FILTER_REJECT;
+            return NodeFilter.FILTER_SKIP;
+        }
+    });
+    const parts = [];
+    while (walker.nextNode()) parts.push(walker.currentNode.nodeValue);
+
+    const meta = document.querySelector('meta[name="description" i], meta[property="og:description"]');
+    const headings = Array.from(root.querySelectorAll(%s))
+        .filter(h => !h.closest("nav, [hidden], [aria-hidden=true]"))
+        .map(h => h.textContent)
+        .slice(0, %d);
+    return {
+        title: document.title || "",
+        description: meta ? meta.getAttribute("content") || "" : "",
+        headings: headings,
+        text: parts.join(" "),
+    };
+}
+""" % (
+    json.dumps(sorted(SKIP_TAGS)),
+    json.dumps(sorted(BOILERPLATE_CONTAINERS)),
+    json.dumps(BOILERPLATE_PATTERN),
+    json.dumps(", ".join(sorted(HEADING_TAGS))),
+    MAX_HEADINGS,
+)
+
+
+async def extract_page_from_browser(page) -> dict:
+    """ Same fields as extract_page, read from the page currently loaded in a Playwright tab. """
+    extracted = await page.evaluate(EXTRACT_TEXT_JS) or {}
+    headings = [' '.join(heading.split()) for heading in extracted.get("headings", [])]
+    return {
+        "title": ' '.join(extracted.get("title", "").split()),
+        "description": ' '.join(extracted.get("description", "").split()),
+        "headings": [heading for heading in headings if heading],
+        "text": ' '.join(extracted.get("text", "").split()),
+    }
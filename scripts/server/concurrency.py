@@ -0,0 +1,141 @@
+""" Runtime limits on how many sites are scraped at once: overall, and per registrable domain. """
+from collections import deque
+from contextlib import asynccontextmanager
+from scripts.common.log import get_logger
+from scripts.common.urls import domain_key
+import asyncio
+import math
+import psutil
+
+log = get_logger(__name__)
+
+
+class HostLimiter:
+    """ Lets at most `per_host` sites of the same registrable domain be scraped at once. """
+
+    def __init__(self, per_host=2):
+        self.per_host = per_host
+        # domain -> [semaphore, number of sites holding or waiting for it]
+        self._hosts = {}
+
+    @asynccontextmanager
+    async def hold(self, site):
+        key = domain_key(site)
+        entry = self._hosts.setdefault(key, [asyncio.Semaphore(self.per_host), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._hosts[key]
+
+
+class AdaptiveConcurrency:
+    """ Sets the scheduler's number of tabs AIMD-style from how scraping is going.
+
+    Every `interval` seconds the sites finished since the previous check are
+    looked at. The tabs are cut to `decrease` times as many when the 90th
+    percentile of successful pages took longer than `target_seconds`, when
+    more than `max_error_rate` of the sites failed transiently (timeouts,
+    resets, HTTP 5xx), or when Chromium memory
+    (read from `rss_mb`), system memory or CPU are over their limits.
+    Otherwise `increase` tabs are added if sites were kept waiting for one.
+    The number always stays between `min_tabs` and `max_tabs`; rates and
+    percentiles need at least `min_samples` sites. Permanent failures, such
+    as unknown hosts or HTTP 4xx, say nothing about the load and are left out.
+    """
+
+    def __init__(self, scheduler, min_tabs=2, max_tabs=32, interval=10, target_seconds=10, max_error_rate=0.5,
+                 rss_mb=None, max_rss_mb=None, max_cpu_percent=90, max_memory_percent=90, min_samples=10,
+                 increase=1, decrease=0.75):
+        self.scheduler = scheduler
+        self.min_tabs = min_tabs
+        self.max_tabs = max_tabs
+        self.interval = interval
+        self.target_seconds = target_seconds
+        self.max_error_rate = max_error_rate
+        self.rss_mb = rss_mb
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_percent = max_cpu_percent
+        self.max_memory_percent = max_memory_percent
+        self.min_samples = min_samples
+        self.increase = increase
+        self.decrease = decrease
+        self._latencies = deque(maxlen=10000)
+        self._finished = 0
+        self._failed = 0
+        self._busy = False
+        self._task = None
+
+    def record(self, seconds, ok, permanent=False):
+        """ Note one finished site: how long it took, whether it was scraped, and whether it failed for good. """
+        self._busy = self._busy or self.scheduler.stats()["waiting"] > 0
+        if not ok and permanent:
+            return
+        self._finished += 1
+        if ok:
+            self._latencies.append(seconds)
+        else:
+            self._failed += 1
+
+    async def start(self):
+        self.scheduler.set_capacity(min(max(self.scheduler.capacity, self.min_tabs), self.max_tabs))
+        # The first reading only sets the starting point of the CPU measurement
+        psutil.cpu_percent(interval=None)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def overload(self, rss_mb=None):
+        """ Why scraping should slow down, or None when it is keeping up. """
+        if self._finished >= self.min_samples:
+            if self._failed / self._finished > self.max_error_rate:
+                return f"error rate {self._failed / self._finished:.0%}"
+            if len(self._latencies) >= self.min_samples:
+                p90 = sorted(self._latencies)[math.ceil(0.9 * len(self._latencies)) - 1]
+                if p90 > self.target_seconds:
+                    return f"p90 page time {p90:.1f}s"
+        if rss_mb is not None and self.max_rss_mb and rss_mb > self.max_rss_mb:
+            return f"chromium memory {rss_mb:.0f} MB"
+        memory = psutil.virtual_memory().percent
+        if memory > self.max_memory_percent:
+            return f"system memory {memory:.0f}%"
+        cpu = psutil.cpu_percent(interval=None)
+        if cpu > self.max_cpu_percent:
+            return f"cpu {cpu:.0f}%"
+        return None
+
+    def adjust(self, rss_mb=None):
+        """ Apply one AIMD step and return the new number of tabs. """
+        current = self.scheduler.capacity
+        reason = self.overload(rss_mb)
+        if reason:
+            target = max(self.min_tabs, math.floor(current * self.decrease))
+        elif self._busy:
+            target = min(self.max_tabs, current + self.increase)
+        else:
+            target = current
+        if target != current:
+            self.scheduler.set_capacity(target)
+            log.info("tabs adjusted", tabs=target, previous=current, reason=reason or "sites waiting for tabs")
+
+        self._latencies.clear()
+        self._finished = self._failed = 0
+        self._busy = False
+        return target
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                rss_mb = await loop.run_in_executor(None, self.rss_mb) if self.rss_mb else None
+                self.adjust(rss_mb)
+            except psutil.Error as e:
+                log.warning("tab adjustment skipped", error=e)
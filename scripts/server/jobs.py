@@ -0,0 +1,396 @@
+from scripts.common.log import get_logger
+from scripts.server.scheduler import QueueFullError
+from scripts.storage.content_store import coerce_record_id
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import struct
+import time
+import uuid
+
+# Byte offset of each result line, so results can be read from any position
+RESULT_OFFSET = struct.Struct("<Q")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+log = get_logger(__name__)
+
+
+def parse_entry(line):
+    """ (site, record_id) from an input line: {"site": ..., "record_id": ...} or {site: record_id}. """
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        raise ValueError("expected a JSON object")
+    if "site" in entry:
+        site, record_id = entry["site"], entry.get("record_id")
+    elif len(entry) == 1:
+        site, record_id = next(iter(entry.items()))
+    else:
+        raise ValueError('expected {"site": ..., "record_id": ...}')
+    if not isinstance(site, str):
+        raise ValueError("site must be a string")
+    return site, coerce_record_id(record_id)
+
+
+class BatchJobManager:
+    """ Persistent batch jobs fed from an uploaded NDJSON domain list.
+
+    Each job lives in its own directory under `jobs_dir`:
+
+        input.ndjson    the uploaded domain list
+        state.json      status and the last checkpoint
+        results.ndjson  one {"line", "record_id", "data"} object per input line
+        results.idx     byte offset of every result line
+
+    The input is read `chunk_size` lines at a time and each chunk is passed
+    to `process(domains, scheduler_job, refresh)`, an async generator of
+    response dicts. A checkpoint is saved after each chunk. On restart,
+    unfinished jobs resume from their checkpoint and skip lines whose
+    results were already written, so memory stays bounded by the chunk
+    size whatever the length of the list. Job files are read and written
+    on a dedicated thread, never on the event loop.
+    """
+
+    def __init__(self, jobs_dir, process, scheduler, chunk_size=500, max_running=2):
+        self.jobs_dir = jobs_dir
+        self.process = process
+        self.scheduler = scheduler
+        self.chunk_size = chunk_size
+        self.max_running = max_running
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._running = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-jobs")
+
+    async def _io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self):
+        """ Start the job workers and queue up jobs left unfinished by the last run. """
+        unfinished = await self._io(self._unfinished)
+        for state in sorted(unfinished, key=lambda state: state["created_at"]):
+            log.info("resuming batch job", job_id=state["id"], line=state["checkpoint"]["line"])
+            self._queue.put_nowait(state["id"])
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_running)]
+
+    async def close(self):
+        # Running jobs keep their "running" status and resume on the next start
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=True)
+
+    async def create(self, chunks, priority=1, refresh=False):
+        """ Store an uploaded NDJSON domain list, read from the async iterator `chunks` of bytes, as a new job. """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        await self._io(os.makedirs, job_dir)
+
+        total = 0
+        last_byte = b"\n"
+        f = await self._io(open, os.path.join(job_dir, "input.ndjson"), "wb")
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    await self._io(f.write, chunk)
+                    total += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+            if last_byte != b"\n":
+                await self._io(f.write, b"\n")
+                total += 1
+        finally:
+            await self._io(f.close)
+        await self._io(self._create_results, job_id)
+
+        state = {
+            "id": job_id,
+            "status": "queued",
+            "priority": priority,
+            "refresh": refresh,
+            "total": total,
+            "created_at": time.time(),
+            "finished_at": None,
+            "error": None,
+            "checkpoint": {"line": 0, "offset": 0, "results": 0, "results_bytes": 0},
+        }
+        await self._io(self._save_state, state)
+        self._queue.put_nowait(job_id)
+        return await self.status(job_id)
+
+    async def status(self, job_id):
+        """ Job state with the number of input lines processed so far, or None for an unknown job. """
+        return await self._io(self._status, job_id)
+
+    def _status(self, job_id):
+        state = self._load_state(job_id)
+        if state is None:
+            return None
+        processed = os.path.getsize(self._path(job_id, "results.idx")) // RESULT_OFFSET.size
+        return {
+            "id": state["id"],
+            "status": state["status"],
+            "priority": state["priority"],
+            "total": state["total"],
+            "processed": processed,
+            "created_at": state["created_at"],
+            "finished_at": state["finished_at"],
+            "error": state["error"],
+        }
+
+    async def results(self, job_id, offset=0, limit=1000):
+        """ Up to `limit` results starting at result number `offset`. """
+        return await self._io(self._results, job_id, offset, limit)
+
+    def _results(self, job_id, offset, limit):
+        with open(self._path(job_id, "results.idx"), "rb") as index:
+            index.seek(offset * RESULT_OFFSET.size)
+            raw = index.read(limit * RESULT_OFFSET.size)
+        if not raw:
+            return []
+        start = RESULT_OFFSET.unpack_from(raw)[0]
+        count = len(raw) // RESULT_OFFSET.size
+        with open(self._path(job_id, "results.ndjson"), "rb") as results:
+            results.seek(start)
+            return [json.loads(results.readline()) for _ in range(count)]
+
+    async def cancel(self, job_id):
+        state = await self._io(self._cancel, job_id)
+        if state is None:
+            return None
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+        return await self.status(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            state = await self._io(self._load_state, job_id)
+            if not state or state["status"] not in ACTIVE_STATUSES:
+                continue
+
+            task = asyncio.create_task(self._run(state))
+            self._running[job_id] = task
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                self._running.pop(job_id, None)
+
+            if not task.cancelled() and task.exception():
+                log.error("batch job failed", job_id=job_id, error=task.exception())
+                state = await self._io(self._load_state, job_id)
+                state.update(status="failed", error=str(task.exception()), finished_at=time.time())
+                await self._io(self._save_progress, state)
+
+    async def _admit(self, priority):
+        """ Register with the scheduler, waiting while its queue is full. """
+        while True:
+            try:
+                job = self.scheduler.submit(priority)
+                break
+            except QueueFullError:
+                await asyncio.sleep(5)
+        try:
+            await self.scheduler.wait_admitted(job)
+        except BaseException:
+            self.scheduler.finish(job)
+            raise
+        return job
+
+    async def _run(self, state):
+        state["status"] = "running"
+        if not await self._io(self._save_progress, state):
+            return
+
+        done = await self._io(self._recover, state)
+        scheduler_job = await self._admit(state["priority"])
+        try:
+            files = await self._io(self._open_files, state)
+            source, results, index = files
+            try:
+                line_number = state["checkpoint"]["line"]
+
+                while True:
+                    chunk, line_number = await self._io(self._read_chunk, source, line_number)
+                    if not chunk:
+                        break
+
+                    domains, lines, invalid = {}, {}, []
+                    for number, line in chunk:
+                        if number in done or not line.strip():
+                            continue
+                        try:
+                            site, record_id = parse_entry(line)
+                        except ValueError as e:
+                            invalid.append({"line": number, "record_id": None, "error": str(e)})
+                            continue
+                        domains[site] = record_id
+                        lines[site] = number
+                    if invalid:
+                        await self._io(self._append, results, index, *invalid)
+
+                    if domains:
+                        responses = self.process(domains, scheduler_job, state["refresh"])
+                        try:
+                            async for response_data in responses:
+                                site = response_data["site"]
+                                if site in lines:
+                                    record = {"line": lines.pop(site), "record_id": domains[site], "data": response_data}
+                                    await self._io(self._append, results, index, record)
+                        finally:
+                            await responses.aclose()
+
+                    # Sites the pipeline dropped still get a result line
+                    dropped = [
+                        {"line": number, "record_id": domains[site],
+                         "data": {"site": site, "message": f"Unable to scrape URL: {site}"}}
+                        for site, number in lines.items()
+                    ]
+                    if dropped:
+                        await self._io(self._append, results, index, *dropped)
+
+                    state["checkpoint"] = await self._io(self._checkpoint, source, results, index, line_number)
+                    if not await self._io(self._save_progress, state):
+                        return
+            finally:
+                # Queued behind any write still running, without waiting here if the job was cancelled
+                for f in files:
+                    self._executor.submit(f.close)
+
+            state.update(status="completed", finished_at=time.time())
+            await self._io(self._save_progress, state)
+        finally:
+            self.scheduler.finish(scheduler_job)
+
+    # Everything below runs on the job file thread
+
+    def _unfinished(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        unfinished = []
+        for job_id in os.listdir(self.jobs_dir):
+            state = self._load_state(job_id)
+            if state and state["status"] in ACTIVE_STATUSES:
+                unfinished.append(state)
+        return unfinished
+
+    def _create_results(self, job_id):
+        open(self._path(job_id, "results.ndjson"), "wb").close()
+        open(self._path(job_id, "results.idx"), "wb").close()
+
+    def _open_files(self, state):
+        """ The job's input, positioned at the checkpoint, and its results and index opened for appending. """
+        job_id = state["id"]
+        source = open(self._path(job_id, "input.ndjson"), "rb")
+        source.seek(state["checkpoint"]["offset"])
+        results = open(self._path(job_id, "results.ndjson"), "ab")
+        index = open(self._path(job_id, "results.idx"), "ab")
+        return source, results, index
+
+    def _checkpoint(self, source, results, index, line_number):
+        return {
+            "line": line_number,
+            "offset": source.tell(),
+            "results": index.tell() // RESULT_OFFSET.size,
+            "results_bytes": results.tell(),
+        }
+
+    def _read_chunk(self, source, line_number):
+        """ Up to `chunk_size` (line number, line) pairs, ending early before a repeated site. """
+        chunk, sites = [], set()
+        while len(chunk) < self.chunk_size:
+            position = source.tell()
+            line = source.readline()
+            if not line:
+                break
+            try:
+                site = parse_entry(line)[0]
+            except ValueError:
+                site = None
+            if site is not None and site in sites:
+                # Each chunk maps sites to one record id, so a repeat starts the next chunk
+                source.seek(position)
+                break
+            sites.add(site)
+            chunk.append((line_number, line))
+            line_number += 1
+        return chunk, line_number
+
+    def _append(self, results, index, *records):
+        for record in records:
+            offset = results.tell()
+            results.write(json.dumps(record).encode("utf-8") + b"\n")
+            index.write(RESULT_OFFSET.pack(offset))
+        results.flush()
+        index.flush()
+
+    def _recover(self, state):
+        """ Line numbers already answered after the checkpoint; drops any half-written tail. """
+        checkpoint = state["checkpoint"]
+        results_path = self._path(state["id"], "results.ndjson")
+        index_path = self._path(state["id"], "results.idx")
+
+        with open(index_path, "rb") as index:
+            index.seek(checkpoint["results"] * RESULT_OFFSET.size)
+            raw = index.read()
+        offsets = [offset for (offset,) in RESULT_OFFSET.iter_unpack(raw[:len(raw) - len(raw) % RESULT_OFFSET.size])]
+
+        done = set()
+        valid_end = checkpoint["results_bytes"]
+        with open(results_path, "rb") as results:
+            for offset in offsets:
+                results.seek(offset)
+                line = results.readline()
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("truncated result")
+                    done.add(json.loads(line)["line"])
+                except (ValueError, KeyError):
+                    break
+                valid_end = results.tell()
+
+        with open(index_path, "r+b") as index:
+            index.truncate((checkpoint["results"] + len(done)) * RESULT_OFFSET.size)
+        with open(results_path, "r+b") as results:
+            results.truncate(valid_end)
+        return done
+
+    def _path(self, job_id, name):
+        return os.path.join(self.jobs_dir, job_id, name)
+
+    def _load_state(self, job_id):
+        try:
+            with open(self._path(job_id, "state.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            return None
+
+    def _cancel(self, job_id):
+        state = self._load_state(job_id)
+        if state and state["status"] in ACTIVE_STATUSES:
+            state.update(status="cancelled", finished_at=time.time())
+            self._save_state(state)
+        return state
+
+    def _save_progress(self, state):
+        """ Save the state of a job being run, unless it was cancelled meanwhile; returns whether it was saved.
+
+        The runner keeps its own copy of the state, so without this check
+        its next save would bring a cancelled job back.
+        """
+        saved = self._load_state(state["id"])
+        if saved and saved["status"] not in ACTIVE_STATUSES:
+            return False
+        self._save_state(state)
+        return True
+
+    def _save_state(self, state):
+        path = self._path(state["id"], "state.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
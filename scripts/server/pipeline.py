@@ -0,0 +1,106 @@
+import asyncio
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+async def staged(source, stage, concurrency=4, queue_size=32):
+    """ Run the coroutine `stage` over items of the async iterator `source`.
+
+    `concurrency` workers take items from a bounded queue and put their
+    results on another bounded queue, which this generator yields from in
+    completion order. When the consumer falls behind both queues fill up and
+    `source` stops being read, so backpressure reaches the producer.
+    """
+    inbox = asyncio.Queue(maxsize=queue_size)
+    outbox = asyncio.Queue(maxsize=queue_size)
+
+    async def feed():
+        try:
+            async for item in source:
+                await inbox.put(item)
+        except Exception as e:
+            await outbox.put(_Failure(e))
+        finally:
+            if hasattr(source, "aclose"):
+                await source.aclose()
+        for _ in range(concurrency):
+            await inbox.put(_DONE)
+
+    async def work():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                break
+            try:
+                await outbox.put(await stage(item))
+            except Exception as e:
+                await outbox.put(_Failure(e))
+        await outbox.put(_DONE)
+
+    tasks = [asyncio.create_task(feed())]
+    tasks += [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        finished = 0
+        while finished < concurrency:
+            result = await outbox.get()
+            if result is _DONE:
+                finished += 1
+            elif isinstance(result, _Failure):
+                raise result.error
+            else:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def windowed(source, fn, window):
+    """ Run the coroutine `fn` over items of `source` with at most `window` calls in flight.
+
+    `source` may be a plain or an async iterable. Results are yielded in
+    completion order. A new item is read only when a call finishes and
+    its result has been taken, so memory depends on `window` and not on
+    the length of `source`, and a slow consumer stops the input.
+    """
+    items = source.__aiter__() if hasattr(source, "__aiter__") else _iterate(source)
+    pending = set()
+    pull = None
+    try:
+        while True:
+            # Keep one read of the source outstanding while there is room in the window
+            if pull is None and items is not None and len(pending) < window:
+                pull = asyncio.ensure_future(items.__anext__())
+            if not pending and pull is None:
+                break
+
+            done, _ = await asyncio.wait(pending | {pull} if pull else pending,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if pull in done:
+                done.discard(pull)
+                try:
+                    pending.add(asyncio.create_task(fn(pull.result())))
+                except StopAsyncIteration:
+                    items = None
+                pull = None
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+    finally:
+        if pull is not None:
+            pull.cancel()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, *([pull] if pull else []), return_exceptions=True)
+        if items is not None and hasattr(items, "aclose"):
+            await items.aclose()
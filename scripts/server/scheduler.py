@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class QueueFullError(Exception):
+    """ Raised when the scheduler cannot take another job. """
+
+
+def coerce_priority(value):
+    """ `value` as a job priority: a positive integer, or a string of digits. Raises ValueError for anything else. """
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"priority must be a positive integer, got {value!r}")
+    return value
+
+
+class Job:
+    """ A client request competing for the shared worker budget. """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, scheduler, priority=1):
+        self.id = next(Job._ids)
+        self.scheduler = scheduler
+        self.weight = max(1, int(priority))
+        self.current_weight = 0
+        self.waiters = deque()
+        self.running = 0
+        self.cancelled = False
+        self.admitted = asyncio.Event()
+
+    def slot(self):
+        """ Async context manager holding one worker slot for this job. """
+        return self.scheduler.slot(self)
+
+
+class JobScheduler:
+    """ Shares a fixed number of worker slots between several running jobs.
+
+    Jobs beyond `max_active_jobs` wait for admission, and jobs beyond
+    `max_queued_jobs` are rejected with QueueFullError. Free slots are handed
+    out with smooth weighted round-robin over the jobs that are waiting, so a
+    large job cannot starve the ones submitted after it.
+    """
+
+    def __init__(self, capacity=10, max_active_jobs=4, max_queued_jobs=32):
+        self.capacity = capacity
+        self.max_active_jobs = max_active_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.in_use = 0
+        self.active = []
+        self.pending = deque()
+
+    def submit(self, priority=1):
+        """ Register a new job, admitting it right away if there is room. """
+        job = Job(self, priority)
+        if len(self.active) < self.max_active_jobs:
+            self._admit(job)
+        elif len(self.pending) >= self.max_queued_jobs:
+            raise QueueFullError("Too many queued requests, try again later")
+        else:
+            self.pending.append(job)
+        return job
+
+    async def wait_admitted(self, job):
+        """ Wait until the job is allowed to start. """
+        await job.admitted.wait()
+        if job.cancelled:
+            raise asyncio.CancelledError()
+
+    def finish(self, job):
+        """ Remove a job, cancelling any of its tasks still waiting for a slot. """
+        if job.cancelled:
+            return
+        job.cancelled = True
+        while job.waiters:
+            waiter = job.waiters.popleft()
+            if not waiter.done():
+                waiter.cancel()
+        if job in self.active:
+            self.active.remove(job)
+        elif job in self.pending:
+            self.pending.remove(job)
+        job.admitted.set()
+
+        while self.pending and len(self.active) < self.max_active_jobs:
+            self._admit(self.pending.popleft())
+        self._dispatch()
+
+    def set_capacity(self, capacity):
+        """ Change the number of worker slots shared by all jobs. """
+        self.capacity = max(1, int(capacity))
+        self._dispatch()
+
+    async def acquire(self, job):
+        """ Wait for a worker slot on behalf of `job`. """
+        if job.cancelled:
+            raise asyncio.CancelledError()
+        if self.in_use < self.capacity and not any(j.waiters for j in self.active):
+            self._grant(job)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        job.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we were cancelled, hand it back
+                self.release(job)
+            elif waiter in job.waiters:
+                job.waiters.remove(waiter)
+            raise
+
+    def release(self, job):
+        """ Return a worker slot and hand it to the next job in line. """
+        self.in_use -= 1
+        job.running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, job):
+        await self.acquire(job)
+        try:
+            yield
+        finally:
+            self.release(job)
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "active_jobs": len(self.active),
+            "queued_jobs": len(self.pending),
+            "waiting": sum(len(job.waiters) for job in self.active),
+        }
+
+    def _admit(self, job):
+        self.active.append(job)
+        job.admitted.set()
+
+    def _grant(self, job):
+        self.in_use += 1
+        job.running += 1
+
+    def _dispatch(self):
+        while self.in_use < self.capacity:
+            job = self._next_job()
+            if job is None:
+                return
+            waiter = job.waiters.popleft()
+            if waiter.done():
+                continue
+            self._grant(job)
+            waiter.set_result(None)
+
+    def _next_job(self):
+        """ Smooth weighted round-robin over jobs that have tasks waiting. """
+        candidates = [job for job in self.active if job.waiters]
+        if not candidates:
+            return None
+        total = 0
+        for job in candidates:
+            job.current_weight += job.weight
+            total += job.weight
+        best = max(candidates, key=lambda job: job.current_weight)
+        best.current_weight -= total
+        return best
@@ -0,0 +1,91 @@
+""" Coalescing of duplicate work: concurrent calls for the same thing share one result. """
+from collections import OrderedDict
+from scripts.common import metrics
+import asyncio
+
+SHARED = metrics.counter("scraper_shared_results_total", "Sites answered with the work of another site, by key",
+                         ["key"])
+
+
+class SingleFlight:
+    """ Runs one call per key at a time; calls arriving with a matching key wait for it and share its result.
+
+    Keys are (kind, value) tuples, and a call may carry several, matched in
+    order: a scrape keyed by its final URL and then by its content hash
+    joins whichever call shares either. The results of the last `remember`
+    finished calls keep being shared after they finish, unless `keep`,
+    given to `do`, turns them down. When the call doing the work is
+    cancelled, one of the calls waiting on it takes over.
+    """
+
+    def __init__(self, remember=0):
+        self.remember = remember
+        self._flights = {}
+        self._recent = OrderedDict()
+
+    async def do(self, keys, fn, *args, fresh=False, keep=None):
+        """ (result, key) of `fn(*args)`, key being the matching key when the result was shared, else None.
+
+        With `fresh` only a call still in flight is joined, never a remembered
+        result. A result for which `keep(result)` is false is shared with the
+        calls waiting on it but not remembered.
+        """
+        keys = [key for key in keys if key[1]]
+        while True:
+            key, flight, result = self._find(keys, fresh)
+            if key is None:
+                break
+            if flight is None:
+                SHARED.inc(key=key[0])
+                return result, key
+            try:
+                result = await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if flight.cancelled():
+                    # The call doing the work was cancelled, not this one; try again
+                    continue
+                raise
+            SHARED.inc(key=key[0])
+            return result, key
+
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._flights[key] = future
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters see the error; without any, it must not be reported as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if keep is None or keep(result):
+                self._keep(keys, result)
+            return result, None
+        finally:
+            for key in keys:
+                if self._flights.get(key) is future:
+                    del self._flights[key]
+
+    def _find(self, keys, fresh=False):
+        """ The first key of `keys` in flight or remembered, with its flight or its result. """
+        for key in keys:
+            if key in self._recent and not fresh:
+                self._recent.move_to_end(key)
+                return key, None, self._recent[key]
+            if key in self._flights:
+                return key, self._flights[key], None
+        return None, None, None
+
+    def _keep(self, keys, result):
+        if not self.remember:
+            return
+        for key in keys:
+            self._recent[key] = result
+            self._recent.move_to_end(key)
+        while len(self._recent) > self.remember:
+            self._recent.popitem(last=False)
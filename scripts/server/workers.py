@@ -0,0 +1,304 @@
+""" Scrape worker processes, so page extraction is spread over every core instead of one GIL.
+
+The server process coordinates: it keeps the scheduler, classification and
+storage, and hands each site to one of `size` worker processes started as
+
+    python -m scripts.server.workers
+
+Each worker owns a browser pool, HTTP fetcher, WHOIS resolver and language
+detector built from the `settings` the pool is given, and scrapes the sites
+it is sent concurrently. Sites are partitioned by a hash of their
+registrable domain, so every host is always scraped, rate limited and
+cached by the same worker.
+
+Requests and results are single JSON lines on the worker's stdin and a
+dedicated stdout; logs go to stderr. A worker about to render a page in
+its browser first asks for a tab ("acquire") and waits until the
+coordinator has taken one of the scheduler's slots for it ("granted"), and
+gives it back when the page is read ("release"). When a worker dies, only the sites it
+had in flight fail, and they are sent again to its replacement.
+"""
+from scripts.common import metrics
+from scripts.common.log import get_logger, setup_logging
+from scripts.common.metrics import collect_timings
+from scripts.scraping.browser_pool import BrowserPool
+from scripts.common.urls import domain_key
+from scripts.scraping.check_domain_country import CountryResolver
+from scripts.scraping.http_fetcher import HttpFetcher
+from scripts.scraping.language_detector import make_detector
+from scripts.scraping.readiness import PageReadiness
+from scripts.scraping.scrape import scrape_website
+from contextlib import asynccontextmanager, nullcontext
+import asyncio
+import itertools
+import json
+import os
+import sys
+import zlib
+
+# Longest message line, enough for the text of a huge page
+MESSAGE_LIMIT = 256 * 1024 * 1024
+
+WORKER_RESTARTS = metrics.counter("scraper_worker_restarts_total", "Scrape worker processes restarted after dying")
+
+log = get_logger(__name__)
+
+
+class WorkerCrashedError(Exception):
+    pass
+
+
+class WorkerProcess:
+    """ One worker process and the requests waiting on it. """
+
+    def __init__(self, index, settings):
+        self.index = index
+        self.settings = settings
+        self.process = None
+        self.pending = {}
+        # request id -> the slot factory of the request, and the task holding its slot
+        self._slots = {}
+        self._holders = {}
+        self._ids = itertools.count()
+        self._reader = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None and not self._reader.done()
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "scripts.server.workers",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=MESSAGE_LIMIT,
+            env={**os.environ, "SCRAPER_WORKER_INDEX": str(self.index)},
+        )
+        self._reader = asyncio.create_task(self._read())
+        await self._send({"settings": self.settings})
+
+    async def close(self, timeout=30):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            # A closed stdin tells the worker to finish and shut its browsers down
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        await self._reader
+
+    async def scrape(self, site, slot=None):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self._slots[request_id] = slot
+        try:
+            await self._send({"id": request_id, "site": site})
+            return await future
+        except asyncio.CancelledError:
+            if self.alive:
+                await asyncio.shield(self._send({"cancel": request_id}))
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+            self._slots.pop(request_id, None)
+            await self._release(request_id)
+
+    async def _hold_slot(self, request_id, slot, released):
+        """ Take a slot for a page the worker is about to render, until it says it is done. """
+        async with slot() if slot else nullcontext():
+            await self._send({"granted": request_id})
+            await released.wait()
+
+    async def _release(self, request_id):
+        holder = self._holders.pop(request_id, None)
+        if holder:
+            holder[0].cancel()
+            await asyncio.gather(holder[0], return_exceptions=True)
+
+    async def _send(self, message):
+        try:
+            self.process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise WorkerCrashedError(f"Scrape worker {self.index} is gone: {e}") from e
+
+    async def _read(self):
+        try:
+            while line := await self.process.stdout.readline():
+                message = json.loads(line)
+                if "acquire" in message:
+                    request_id = message["acquire"]
+                    if request_id in self.pending:
+                        released = asyncio.Event()
+                        task = asyncio.create_task(self._hold_slot(request_id, self._slots[request_id], released))
+                        self._holders[request_id] = (task, released)
+                elif "release" in message:
+                    holder = self._holders.get(message["release"])
+                    if holder:
+                        holder[1].set()
+                else:
+                    future = self.pending.get(message["id"])
+                    if future and not future.done():
+                        future.set_result(message["result"])
+        except (ValueError, asyncio.LimitOverrunError) as e:
+            log.error("unreadable worker message", worker=self.index, error=e)
+            self.process.kill()
+        finally:
+            code = await self.process.wait()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(WorkerCrashedError(f"Scrape worker {self.index} exited with {code}"))
+
+
+class WorkerPool:
+    """ Scrapes sites in `size` worker processes partitioned by registrable domain.
+
+    `settings` configures every worker: "log_level", keyword arguments for
+    its "browser_pool", "http_fetcher" (None to always use the browser) and
+    "country_resolver", the "language_detector" backend and the
+    PageReadiness keyword arguments of "readiness". A site whose
+    worker dies while scraping it is sent again, to the replacement worker,
+    up to `max_attempts` times in all.
+    """
+
+    def __init__(self, size, settings, max_attempts=2):
+        self.size = size
+        self.settings = settings
+        self.max_attempts = max_attempts
+        self._workers = [WorkerProcess(index, settings) for index in range(size)]
+        self._locks = [asyncio.Lock() for _ in range(size)]
+
+    @property
+    def in_flight(self):
+        return sum(len(worker.pending) for worker in self._workers)
+
+    async def start(self):
+        for worker in self._workers:
+            await worker.start()
+
+    async def close(self):
+        await asyncio.gather(*(worker.close() for worker in self._workers))
+
+    def partition(self, site):
+        return zlib.crc32(domain_key(site).encode("utf-8")) % self.size
+
+    async def scrape(self, site, slot=None):
+        """ The result of scrape_website for `site`, scraped by its worker, with the worker's stage timings.
+
+        `slot` is held while the worker renders the page in its browser, as in scrape_website.
+        """
+        index = self.partition(site)
+        for attempt in range(1, self.max_attempts + 1):
+            worker = await self._worker(index)
+            try:
+                result = await worker.scrape(site, slot)
+                break
+            except WorkerCrashedError as e:
+                log.warning("worker died while scraping", site=site, worker=index, attempt=attempt, error=e)
+                if attempt == self.max_attempts:
+                    raise
+        # Stage timings measured in the worker are recorded here, where /metrics is served
+        for stage, seconds in (result or {}).get("timings", {}).items():
+            metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+        return result
+
+    async def _worker(self, index):
+        """ The worker for a partition, replaced first if it died. """
+        async with self._locks[index]:
+            worker = self._workers[index]
+            if not worker.alive:
+                await worker.close()
+                WORKER_RESTARTS.inc()
+                log.warning("restarting scrape worker", worker=index, exit_code=worker.process.returncode)
+                worker = self._workers[index] = WorkerProcess(index, self.settings)
+                await worker.start()
+            return worker
+
+
+async def serve_worker():
+    """ Worker process: scrape the sites read from stdin until it is closed. """
+    loop = asyncio.get_running_loop()
+    # Results get their own descriptor; anything printed by a library goes to stderr instead
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    reader = asyncio.StreamReader(limit=MESSAGE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, out)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    # The first line carries the settings the coordinator was given
+    settings = json.loads(await reader.readline())["settings"]
+    setup_logging(settings.get("log_level", "INFO"))
+    pool = BrowserPool(**settings.get("browser_pool", {}))
+    fetcher = HttpFetcher(**settings["http_fetcher"]) if settings.get("http_fetcher") is not None else None
+    resolver = CountryResolver(**settings.get("country_resolver", {}))
+    detector = make_detector(settings.get("language_detector", "fasttext"))
+    readiness = PageReadiness(**settings.get("readiness", {}))
+    tasks = {}
+    grants = {}
+
+    async def send(message):
+        writer.write(json.dumps(message).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    @asynccontextmanager
+    async def tab(request_id):
+        """ One of the coordinator's tabs, held while a page is rendered. """
+        grants[request_id] = loop.create_future()
+        try:
+            await send({"acquire": request_id})
+            await grants[request_id]
+            yield
+        finally:
+            grants.pop(request_id, None)
+            await send({"release": request_id})
+
+    async def scrape(request_id, site):
+        try:
+            with collect_timings() as timings:
+                result = await scrape_website(pool, site, resolver, fetcher, detector, readiness,
+                                              lambda: tab(request_id))
+            result["timings"] = timings
+        except Exception as e:
+            log.error("scrape error", site=site, error=e)
+            result = None
+        finally:
+            tasks.pop(request_id, None)
+        await send({"id": request_id, "result": result})
+
+    await pool.start()
+    if fetcher:
+        await fetcher.start()
+    await loop.run_in_executor(None, detector.load)
+    log.info("scrape worker ready", worker=os.environ.get("SCRAPER_WORKER_INDEX"), pid=os.getpid())
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            if "cancel" in message:
+                task = tasks.get(message["cancel"])
+                if task:
+                    task.cancel()
+            elif "granted" in message:
+                grant = grants.get(message["granted"])
+                if grant and not grant.done():
+                    grant.set_result(None)
+            else:
+                tasks[message["id"]] = asyncio.create_task(scrape(message["id"], message["site"]))
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        await pool.close()
+        if fetcher:
+            await fetcher.close()
+        resolver.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_worker())
@@ -0,0 +1,286 @@
+""" Append-only packed storage for scraped page content.
+
+Records are zlib-compressed and appended to one segment file per 1k range of
+record ids, laid out like the old one-file-per-record tree:
+
+    <base_dir>/<100k>/<10k>/<1k>.seg   compressed records
+    <base_dir>/<100k>/<10k>/<1k>.idx   record id -> offset, length
+
+Command line:
+    python -m scripts.storage.content_store get RECORD_ID
+    python -m scripts.storage.content_store stats
+    python -m scripts.storage.content_store migrate [OLD_DATA_DIR]
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from scripts.common import metrics
+from scripts.common.log import get_logger
+import argparse
+import asyncio
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Segment record header: magic, record id, compressed length, CRC32 of the compressed bytes
+RECORD_HEADER = struct.Struct("<4sQII")
+RECORD_MAGIC = b"CSR1"
+
+# Index entry: record id, offset of the compressed bytes, compressed length
+INDEX_ENTRY = struct.Struct("<QQI")
+
+OPEN_SEGMENTS = 64
+
+WRITE_SECONDS = metrics.histogram("scraper_content_write_seconds", "Duration of content store batch writes")
+
+log = get_logger(__name__)
+
+
+def coerce_record_id(value):
+    """ `value` as a record id: an integer, or a string of digits, that fits the segment headers.
+
+    Raises ValueError for anything else, so a bad id is refused where it
+    comes in instead of failing a write batch shared with other requests.
+    """
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < 2 ** 64:
+        raise ValueError(f"record_id must be a non-negative integer, got {value!r}")
+    return value
+
+
+def segment_path(base_dir, record_id):
+    """ Segment path without extension, sharded by the same 100k/10k/1k ranges as before. """
+    folder_100k = os.path.join(base_dir, str((record_id // 100000) * 100000))
+    folder_10k = os.path.join(folder_100k, str((record_id // 10000) * 10000))
+    return os.path.join(folder_10k, str((record_id // 1000) * 1000))
+
+
+class ContentStore:
+    """ Packed content store with a background, batching writer.
+
+    `put` queues a record for the writer task, which compresses and appends
+    up to `batch_size` queued records per segment in one write on its own
+    thread. `get` finds a record in O(1) through the in-memory index of its
+    segment, loaded on first use.
+    """
+
+    def __init__(self, base_dir="data/store", batch_size=256, queue_size=4096, compression_level=1):
+        self.base_dir = base_dir
+        self.batch_size = batch_size
+        self.compression_level = compression_level
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._unflushed = {}
+        self._indexes = OrderedDict()
+        self._read_fds = OrderedDict()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-writer")
+        self._writer = None
+
+    async def start(self):
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def put(self, record_id, content):
+        """ Queue a record for writing; waits only when the writer is far behind. """
+        record_id = coerce_record_id(record_id)
+        await self.start()
+        self._unflushed[record_id] = content
+        await self._queue.put((record_id, content))
+
+    @property
+    def pending(self):
+        """ Records queued and not yet written. """
+        return self._queue.qsize()
+
+    async def flush(self):
+        await self._queue.join()
+
+    async def close(self):
+        if self._writer is not None:
+            await self.flush()
+            self._writer.cancel()
+            self._writer = None
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for fd in self._read_fds.values():
+                os.close(fd)
+            self._read_fds.clear()
+
+    async def aget(self, record_id):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, record_id)
+
+    def get(self, record_id):
+        """ Content of a record, or None if it was never stored. """
+        if record_id in self._unflushed:
+            return self._unflushed[record_id]
+        path = segment_path(self.base_dir, record_id)
+        with self._lock:
+            location = self._index(path).get(record_id)
+            if location is None:
+                return None
+            fd = self._read_fd(path)
+        offset, length = location
+        data = os.pread(fd, length, offset)
+        return zlib.decompress(data).decode("utf-8")
+
+    def write_batch(self, records):
+        """ Compress and append (record_id, content) pairs, one write per segment.
+
+        A record that can't be encoded, or a segment that can't be written,
+        is logged and skipped without losing the rest of the batch. Returns
+        the number of records written.
+        """
+        by_segment = {}
+        for record_id, content in records:
+            try:
+                compressed = zlib.compress(content.encode("utf-8"), self.compression_level)
+                header = RECORD_HEADER.pack(RECORD_MAGIC, record_id, len(compressed), zlib.crc32(compressed))
+                path = segment_path(self.base_dir, record_id)
+            except (TypeError, ValueError, AttributeError, struct.error) as e:
+                log.error("content record skipped", record_id=repr(record_id), error=e)
+                continue
+            by_segment.setdefault(path, []).append((record_id, header, compressed))
+
+        written = 0
+        for path, segment_records in by_segment.items():
+            try:
+                self._append(path, segment_records)
+                written += len(segment_records)
+            except OSError as e:
+                log.error("content segment write failed", segment=path, records=len(segment_records), error=e)
+        return written
+
+    def _append(self, path, segment_records):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.seg", "ab") as segment:
+            offset = segment.tell()
+            data, entries = [], []
+            for record_id, header, compressed in segment_records:
+                entries.append((record_id, offset + len(header), len(compressed)))
+                data += [header, compressed]
+                offset += len(header) + len(compressed)
+            segment.write(b"".join(data))
+
+        # The index is appended only once the data it points at is written
+        with open(f"{path}.idx", "ab") as index_file:
+            index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+
+        with self._lock:
+            if path in self._indexes:
+                index = self._indexes[path]
+                for record_id, entry_offset, length in entries:
+                    index[record_id] = (entry_offset, length)
+
+    def stats(self):
+        segments = records = stored_bytes = 0
+        for root, _, files in os.walk(self.base_dir):
+            for name in files:
+                if name.endswith(".seg"):
+                    path = os.path.join(root, name[:-4])
+                    segments += 1
+                    records += len(self._index(path))
+                    stored_bytes += os.path.getsize(f"{path}.seg")
+        return {"segments": segments, "records": records, "bytes": stored_bytes}
+
+    def _index(self, path):
+        """ record_id -> (offset, length) for one segment, cached in memory. """
+        index = self._indexes.get(path)
+        if index is not None:
+            self._indexes.move_to_end(path)
+            return index
+
+        index = {}
+        try:
+            segment_size = os.path.getsize(f"{path}.seg")
+            with open(f"{path}.idx", "rb") as index_file:
+                raw = index_file.read()
+        except FileNotFoundError:
+            raw = b""
+        usable = len(raw) - len(raw) % INDEX_ENTRY.size
+        for record_id, offset, length in INDEX_ENTRY.iter_unpack(raw[:usable]):
+            if offset + length <= segment_size:
+                index[record_id] = (offset, length)  # Later entries win
+
+        self._indexes[path] = index
+        if len(self._indexes) > OPEN_SEGMENTS * 4:
+            self._indexes.popitem(last=False)
+        return index
+
+    def _read_fd(self, path):
+        fd = self._read_fds.get(path)
+        if fd is None:
+            fd = os.open(f"{path}.seg", os.O_RDONLY)
+            self._read_fds[path] = fd
+            if len(self._read_fds) > OPEN_SEGMENTS:
+                os.close(self._read_fds.popitem(last=False)[1])
+        else:
+            self._read_fds.move_to_end(path)
+        return fd
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self.write_batch, batch)
+                WRITE_SECONDS.observe(time.perf_counter() - start)
+            except Exception as e:
+                log.error("content write failed", records=len(batch), error=e)
+            finally:
+                for record_id, content in batch:
+                    if self._unflushed.get(record_id) is content:
+                        del self._unflushed[record_id]
+                    self._queue.task_done()
+
+
+def migrate(store, old_dir, batch_size=1000):
+    """ Copy an old one-file-per-record tree (<id>.txt files) into the packed store. """
+    batch, migrated = [], 0
+    for root, _, files in os.walk(old_dir):
+        if os.path.abspath(root).startswith(os.path.abspath(store.base_dir)):
+            continue
+        for name in sorted(files):
+            stem, extension = os.path.splitext(name)
+            if extension != ".txt" or not stem.isdigit():
+                continue
+            with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                batch.append((int(stem), f.read()))
+            if len(batch) >= batch_size:
+                migrated += store.write_batch(batch)
+                batch = []
+                print(f"Migrated {migrated} records")
+    if batch:
+        migrated += store.write_batch(batch)
+    print(f"Migrated {migrated} records from {old_dir} into {store.base_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-dir", default="data/store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get_command = commands.add_parser("get", help="print the content of a record")
+    get_command.add_argument("record_id", type=int)
+    commands.add_parser("stats", help="count segments, records and bytes")
+    migrate_command = commands.add_parser("migrate", help="import an old one-file-per-record data tree")
+    migrate_command.add_argument("old_dir", nargs="?", default="data")
+    args = parser.parse_args()
+
+    store = ContentStore(args.base_dir)
+    if args.command == "get":
+        content = store.get(args.record_id)
+        if content is None:
+            raise SystemExit(f"Record {args.record_id} not found")
+        print(content)
+    elif args.command == "stats":
+        print(store.stats())
+    elif args.command == "migrate":
+        migrate(store, args.old_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from scripts.common.urls import normalize_url
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+# SQLite allows a limited number of parameters per statement
+LOOKUP_CHUNK = 500
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """ Latest result per normalized domain, kept in SQLite across requests.
+
+    Each field group has its own lifetime: a record's scraped content and
+    category are fresh for `content_ttl` seconds, and its country for
+    `country_ttl` seconds. All database work runs on one dedicated thread.
+    """
+
+    def __init__(self, path="cache/results.sqlite3", content_ttl=7 * 86400, country_ttl=90 * 86400):
+        self.path = path
+        self.content_ttl = content_ttl
+        self.country_ttl = country_ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-store")
+        self._db = None
+
+    async def get_many(self, sites):
+        """ Stored metadata for each site that has a record, keyed by the site as given.
+
+        Records carry the stored "response", its "content_hash", and
+        "content_fresh" / "country_fresh" flags. Content is fetched
+        separately with get_content.
+        """
+        return await self._run(self._get_many, list(sites))
+
+    async def get_content(self, site):
+        return await self._run(self._get_content, normalize_url(site))
+
+    async def put(self, site, response, content):
+        await self._run(self._put, normalize_url(site), response, content)
+
+    async def update_country(self, site, country):
+        await self._run(self._update_country, normalize_url(site), country)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, content BLOB NOT NULL, "
+                "content_hash TEXT NOT NULL, content_at REAL NOT NULL, country_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _get_many(self, sites):
+        db = self._connect()
+        keys = {}
+        for site in sites:
+            keys.setdefault(normalize_url(site), []).append(site)
+
+        now = time.time()
+        records = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), LOOKUP_CHUNK):
+            chunk = key_list[start:start + LOOKUP_CHUNK]
+            rows = db.execute(
+                f"SELECT key, response, content_hash, content_at, country_at FROM results "
+                f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, response, stored_hash, content_at, country_at in rows:
+                record = {
+                    "response": json.loads(response),
+                    "content_hash": stored_hash,
+                    "content_fresh": now - content_at < self.content_ttl,
+                    "country_fresh": now - country_at < self.country_ttl,
+                }
+                for site in keys[key]:
+                    records[site] = record
+        return records
+
+    def _get_content(self, key):
+        row = self._connect().execute("SELECT content FROM results WHERE key = ?", (key,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def _put(self, key, response, content):
+        now = time.time()
+        db = self._connect()
+        db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (key, json.dumps(response), zlib.compress(content.encode("utf-8")), content_hash(content), now, now),
+        )
+        db.commit()
+
+    def _update_country(self, key, country):
+        db = self._connect()
+        row = db.execute("SELECT response FROM results WHERE key = ?", (key,)).fetchone()
+        if row:
+            response = json.loads(row[0])
+            response["country"] = country
+            db.execute(
+                "UPDATE results SET response = ?, country_at = ? WHERE key = ?",
+                (json.dumps(response), time.time(), key),
+            )
+            db.commit()
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("psutil")
+
+from scripts.benchmarks.e2e_benchmark import regressions
+
+
+def numbers(sites_per_sec=10.0, peak_rss_mb=500.0, p50=1.0, p99=2.0):
+    return {"sites_per_sec": sites_per_sec, "peak_rss_mb": peak_rss_mb, "stages": {"goto": {"p50": p50, "p99": p99}}}
+
+
+def test_numbers_within_the_tolerance_pass():
+    assert regressions({"5": numbers(sites_per_sec=9.0, p99=2.3)}, {"5": numbers()}, 0.2) == []
+
+
+def test_slower_levels_fail():
+    found = regressions({"5": numbers(sites_per_sec=7.0, peak_rss_mb=700.0, p50=3.0)}, {"5": numbers()}, 0.2)
+    assert len(found) == 3
+
+
+def test_a_level_without_a_baseline_fails():
+    assert regressions({"5": numbers(), "10": numbers()}, {"5": numbers()}, 0.2) == ["concurrency 10: no baseline"]
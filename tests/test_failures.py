@@ -0,0 +1,60 @@
+import asyncio
+import errno
+import socket
+import ssl
+from types import SimpleNamespace
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+playwright = pytest.importorskip("playwright.async_api")
+
+from scripts.scraping.http_fetcher import classify_fetch_error
+from scripts.scraping.readiness import PageFailure, check_response, classify_error
+
+KEY = SimpleNamespace(host="example.test", port=443, ssl=True)
+
+
+def connector_error(os_error):
+    return aiohttp.ClientConnectorError(KEY, os_error)
+
+
+@pytest.mark.parametrize("error, reason, permanent", [
+    (connector_error(socket.gaierror(socket.EAI_NONAME, "Name or service not known")), "dns", True),
+    (connector_error(socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")), "dns", False),
+    (connector_error(ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")), "connection_refused", True),
+    (connector_error(OSError(errno.EHOSTUNREACH, "No route to host")), "unreachable", True),
+    (aiohttp.ClientConnectorCertificateError(KEY, ssl.SSLCertVerificationError("certificate has expired")), "tls", True),
+    (aiohttp.TooManyRedirects(SimpleNamespace(real_url="http://example.test"), ()), "too_many_redirects", True),
+    (aiohttp.InvalidURL("http://exa mple.test"), "invalid_url", True),
+    (connector_error(ConnectionResetError(errno.ECONNRESET, "Connection reset by peer")), "network", False),
+    (aiohttp.ServerDisconnectedError(), "network", False),
+    (asyncio.TimeoutError(), "timeout", False),
+])
+def test_fetch_errors_are_classified(error, reason, permanent):
+    failure = classify_fetch_error(error)
+    assert (failure.reason, failure.permanent) == (reason, permanent)
+
+
+@pytest.mark.parametrize("message, reason, permanent", [
+    ("net::ERR_NAME_NOT_RESOLVED at http://example.test/", "dns", True),
+    ("net::ERR_CERT_DATE_INVALID at https://example.test/", "tls", True),
+    ("net::ERR_CONNECTION_RESET at http://example.test/", "connection_reset", False),
+    ("net::ERR_SOMETHING_NEW at http://example.test/", "network", False),
+    ("Target page, context or browser has been closed", "browser_error", False),
+])
+def test_browser_errors_are_classified(message, reason, permanent):
+    failure = classify_error(playwright.Error(message))
+    assert (failure.reason, failure.permanent) == (reason, permanent)
+
+
+@pytest.mark.parametrize("status, permanent", [(404, True), (410, True), (429, False), (503, False)])
+def test_http_error_statuses(status, permanent):
+    with pytest.raises(PageFailure) as raised:
+        check_response(SimpleNamespace(status=status))
+    assert raised.value.reason == f"http_{status}"
+    assert raised.value.permanent is permanent
+
+
+def test_successful_responses_pass():
+    check_response(SimpleNamespace(status=200))
+    check_response(None)
@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("playwright")
+
+from scripts.scraping.http_fetcher import read_body
+
+
+class ChunkedContent:
+    """ A response StreamReader handing out the body a few bytes at a time. """
+
+    def __init__(self, body, chunk_size):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def iter_chunked(self, n):
+        for start in range(0, len(self.body), min(n, self.chunk_size)):
+            yield self.body[start:start + min(n, self.chunk_size)]
+
+
+def test_read_body_reads_past_the_first_chunk():
+    body = b"x" * 1_028_916
+    assert asyncio.run(read_body(ChunkedContent(body, 8192), 5 * 1024 * 1024)) == body
+
+
+def test_read_body_stops_at_the_cap():
+    body = b"0123456789" * 1000
+    assert asyncio.run(read_body(ChunkedContent(body, 7), 25)) == body[:25]
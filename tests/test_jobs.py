@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+
+pytest.importorskip("tldextract")
+
+from scripts.server.jobs import BatchJobManager, parse_entry
+
+
+class Scheduler:
+    """ Admits every job at once. """
+
+    def submit(self, priority):
+        return object()
+
+    async def wait_admitted(self, job):
+        pass
+
+    def finish(self, job):
+        pass
+
+
+async def upload(data):
+    yield data
+
+
+async def wait_for_status(manager, job_id, *statuses):
+    for _ in range(200):
+        status = await manager.status(job_id)
+        if status["status"] in statuses:
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job never reached {statuses}: {status}")
+
+
+def lines(count):
+    return "".join(f'{{"site": "site{number}.com", "record_id": {number}}}\n' for number in range(count)).encode()
+
+
+def test_parse_entry_forms():
+    assert parse_entry('{"site": "a.com", "record_id": "7"}') == ("a.com", 7)
+    assert parse_entry('{"a.com": 7}') == ("a.com", 7)
+    with pytest.raises(ValueError):
+        parse_entry('{"a.com": -1}')
+
+
+def test_job_answers_every_line(tmp_path):
+    async def process(domains, job, refresh):
+        for site in domains:
+            if site != "drop.com":
+                yield {"site": site}
+
+    async def main():
+        manager = BatchJobManager(str(tmp_path), process, Scheduler(), chunk_size=2)
+        await manager.start()
+        created = await manager.create(upload(b'{"a.com": 1}\n{"b.com": "2"}\nbad\n{"drop.com": 3}\n{"a.com": 4}'))
+        status = await wait_for_status(manager, created["id"], "completed")
+        results = await manager.results(created["id"])
+        await manager.close()
+        return status, results
+
+    status, results = asyncio.run(main())
+    assert status["total"] == status["processed"] == 5
+    assert [result["line"] for result in results] == [0, 1, 2, 3, 4]
+    assert [result["record_id"] for result in results] == [1, 2, None, 3, 4]
+    assert "error" in results[2]
+    assert results[3]["data"]["message"] == "Unable to scrape URL: drop.com"
+
+
+def test_runner_never_overwrites_a_cancel(tmp_path):
+    async def main():
+        resume = asyncio.Event()
+
+        async def process(domains, job, refresh):
+            await resume.wait()
+            for site in domains:
+                yield {"site": site}
+
+        manager = BatchJobManager(str(tmp_path), process, Scheduler(), chunk_size=1)
+        await manager.start()
+        created = await manager.create(upload(lines(5)))
+        await wait_for_status(manager, created["id"], "running")
+        # The cancel lands on disk while the runner still holds its own copy of the state
+        await manager._io(manager._cancel, created["id"])
+        resume.set()
+        await asyncio.sleep(0.2)
+        status = await manager.status(created["id"])
+        await manager.close()
+        return status
+
+    status = asyncio.run(main())
+    assert status["status"] == "cancelled"
+    assert status["processed"] <= 1
+
+
+def test_cancel_stops_a_running_job(tmp_path):
+    async def process(domains, job, refresh):
+        for site in domains:
+            await asyncio.sleep(0.001)
+            yield {"site": site}
+
+    async def main():
+        manager = BatchJobManager(str(tmp_path), process, Scheduler(), chunk_size=1)
+        await manager.start()
+        statuses = []
+        for _ in range(20):
+            created = await manager.create(upload(lines(50)))
+            await wait_for_status(manager, created["id"], "running")
+            await manager.cancel(created["id"])
+            await asyncio.sleep(0.02)
+            statuses.append((await manager.status(created["id"]))["status"])
+        await manager.close()
+        return statuses
+
+    assert set(asyncio.run(main())) == {"cancelled"}
+
+
+def test_unfinished_job_resumes_without_repeating_lines(tmp_path):
+    async def main():
+        stop = asyncio.Event()
+
+        async def stalling(domains, job, refresh):
+            for site in domains:
+                if site == "site3.com":
+                    stop.set()
+                    await asyncio.Event().wait()
+                yield {"site": site}
+
+        async def process(domains, job, refresh):
+            for site in domains:
+                yield {"site": site}
+
+        manager = BatchJobManager(str(tmp_path), stalling, Scheduler(), chunk_size=2)
+        await manager.start()
+        created = await manager.create(upload(lines(6)))
+        await stop.wait()
+        await manager.close()
+
+        manager = BatchJobManager(str(tmp_path), process, Scheduler(), chunk_size=2)
+        await manager.start()
+        await wait_for_status(manager, created["id"], "completed")
+        results = await manager.results(created["id"])
+        await manager.close()
+        return results
+
+    results = asyncio.run(main())
+    assert [result["line"] for result in results] == [0, 1, 2, 3, 4, 5]
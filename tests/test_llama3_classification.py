@@ -0,0 +1,52 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("tldextract")
+
+from scripts.categorizing.llama3_classification import categorize
+from scripts.server.singleflight import SingleFlight
+
+
+class NoRules:
+    def match(self, url):
+        return None
+
+
+class BrokenRules:
+    def match(self, url):
+        raise RuntimeError("rules unavailable")
+
+
+class FailingLlm:
+    """ Never gets a usable label out of the model. """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def classify(self, site, content, tokens):
+        self.calls += 1
+        return None, {"llm_batch": 1}
+
+
+def test_a_failed_categorization_is_marked():
+    category, details = asyncio.run(categorize("a.com", "text", url_rules=BrokenRules()))
+    assert json.loads(category)["Category"] == "Uncategorized"
+    assert details["llm_failed"]
+
+
+def test_a_failed_llm_label_is_not_remembered():
+    llm = FailingLlm()
+    flights = SingleFlight(remember=8)
+
+    async def main():
+        keys = [("content", "same page")]
+        first = await categorize("a.com", "text", url_rules=NoRules(), llm=llm, flights=flights, flight_keys=keys)
+        second = await categorize("b.com", "text", url_rules=NoRules(), llm=llm, flights=flights, flight_keys=keys)
+        return first, second
+
+    (_, first), (_, second) = asyncio.run(main())
+    assert first["llm_failed"] and second["llm_failed"]
+    assert "shared" not in second
+    assert llm.calls == 2
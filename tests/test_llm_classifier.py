@@ -0,0 +1,61 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("tldextract")
+
+from scripts.categorizing.llm_classifier import BATCH_SYSTEM, LlmClassifier, parse_batch, parse_label
+
+
+def label(site, category):
+    return {"site": site, "Category": category, "Alternate Category": ""}
+
+
+def test_parse_label_rejects_answers_without_a_category():
+    assert parse_label('{"Category": " News ", "Alternate Category": null}') == {
+        "Category": "News", "Alternate Category": ""}
+    assert parse_label('{"Category": ""}') is None
+    assert parse_label("not json") is None
+
+
+def test_parse_batch_matches_sites_by_normalized_url():
+    answer = json.dumps({"results": [label("https://www.a.com/", "News"), label("b.com", "Shopping"),
+                                     label("unknown.com", "Games")]})
+    assert parse_batch(answer, ["a.com", "b.com", "c.com"]) == {
+        "a.com": {"Category": "News", "Alternate Category": ""},
+        "b.com": {"Category": "Shopping", "Alternate Category": ""},
+    }
+
+
+def test_parse_batch_drops_only_malformed_items():
+    answer = json.dumps({"results": [label("a.com:abc", "News"), label("[::1", "News"), label("b.com", "Shopping"),
+                                     "not an object"]})
+    assert parse_batch(answer, ["a.com", "b.com"]) == {"b.com": {"Category": "Shopping", "Alternate Category": ""}}
+
+
+class Client:
+    """ Answers batches for every site but one, and single prompts with one label. """
+
+    def __init__(self):
+        self.payloads = []
+
+    async def generate(self, payload):
+        self.payloads.append(payload)
+        if "system" in payload:
+            return json.dumps({"results": [label("a.com", "News")]})
+        return json.dumps({"Category": "Shopping", "Alternate Category": ""})
+
+
+def test_batches_get_their_own_system_prompt_and_fall_back_per_site():
+    client = Client()
+    classifier = LlmClassifier(client, batch_size=4, num_ctx=4096)
+
+    async def main():
+        return await asyncio.gather(classifier.classify("a.com", "news", 10), classifier.classify("b.com", "shop", 10))
+
+    (a_label, a_details), (b_label, b_details) = asyncio.run(main())
+    assert a_label["Category"] == "News" and a_details == {"llm_batch": 2}
+    assert b_label["Category"] == "Shopping" and b_details == {"llm_batch": 2, "llm_fallback": True}
+    batch, single = client.payloads
+    assert batch["system"] == BATCH_SYSTEM and "system" not in single
+    assert batch["options"] == single["options"] == {"num_ctx": 4096}
@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+
+from scripts.server.scheduler import JobScheduler, QueueFullError, coerce_priority
+
+
+@pytest.mark.parametrize("value, priority", [(1, 1), (5, 5), ("3", 3), (" 2 ", 2)])
+def test_coerce_priority_accepts_positive_integers(value, priority):
+    assert coerce_priority(value) == priority
+
+
+@pytest.mark.parametrize("value", [0, -1, "abc", "-2", 1.5, True, None, [1]])
+def test_coerce_priority_refuses_anything_else(value):
+    with pytest.raises(ValueError):
+        coerce_priority(value)
+
+
+def test_jobs_beyond_the_queue_are_refused():
+    async def main():
+        scheduler = JobScheduler(capacity=2, max_active_jobs=1, max_queued_jobs=1)
+        scheduler.submit()
+        scheduler.submit()
+        with pytest.raises(QueueFullError):
+            scheduler.submit()
+
+    asyncio.run(main())
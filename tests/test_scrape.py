@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("playwright")
+pytest.importorskip("tldextract")
+
+from scripts.scraping import scrape
+from scripts.server.singleflight import SingleFlight
+
+
+class Workers:
+    """ Scrapes every site into a page of its own. """
+
+    async def scrape(self, site, slot=None):
+        await asyncio.sleep(0.01)
+        return {"site": site, "content": f"about {site}", "tier": "http", "timings": {}}
+
+
+async def collect(results):
+    return [result async for result in results]
+
+
+def test_a_site_without_a_dedup_key_is_still_scraped(monkeypatch):
+    def normalize_url(site):
+        if site == "bad":
+            raise ValueError("malformed site")
+        return site
+
+    monkeypatch.setattr(scrape, "normalize_url", normalize_url)
+    results = asyncio.run(collect(scrape.scrape_all_websites(["a.com", "bad", "b.com"], 2, workers=Workers(),
+                                                             flights=SingleFlight())))
+    assert sorted(result["site"] for result in results) == ["a.com", "b.com", "bad"]
+    assert all(result["content"] for result in results)
+
+
+def test_duplicate_sites_share_one_scrape():
+    results = asyncio.run(collect(scrape.scrape_all_websites(["a.com", "www.a.com"], 2, workers=Workers(),
+                                                             flights=SingleFlight())))
+    assert sorted(result.get("shared") or "" for result in results) == ["", "input"]
+
+
+def test_dispatch_errors_are_not_swallowed():
+    async def domains():
+        yield "a.com"
+        raise RuntimeError("input failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(scrape.scrape_all_websites(domains(), 2, workers=Workers())))
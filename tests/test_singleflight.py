@@ -0,0 +1,91 @@
+import asyncio
+
+from scripts.server.singleflight import SingleFlight
+
+
+class Work:
+    """ Records its calls, each taking `delay` seconds. """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, value):
+        self.calls.append(value)
+        await asyncio.sleep(self.delay)
+        return {"value": value}
+
+
+def test_concurrent_calls_with_a_matching_key_share_one_result():
+    work = Work()
+    flights = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(flights.do([("final_url", "x"), ("content", "h1")], work, 1),
+                                    flights.do([("final_url", "y"), ("content", "h1")], work, 2),
+                                    flights.do([("final_url", "z"), ("content", "h2")], work, 3))
+
+    results = asyncio.run(main())
+    assert results == [({"value": 1}, None), ({"value": 1}, ("content", "h1")), ({"value": 3}, None)]
+    assert work.calls == [1, 3]
+
+
+def test_a_waiter_takes_over_when_the_leader_is_cancelled():
+    flights = SingleFlight()
+
+    async def main():
+        leader = asyncio.create_task(flights.do([("input", "a")], Work(0.3), "leader"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(flights.do([("input", "a")], Work(), "waiter"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == ({"value": "waiter"}, None)
+
+
+def test_errors_are_shared_but_not_remembered():
+    flights = SingleFlight(remember=4)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("no label")
+
+    async def main():
+        shared = await asyncio.gather(flights.do([("k", "a")], fail), flights.do([("k", "a")], fail),
+                                      return_exceptions=True)
+        return shared, await flights.do([("k", "a")], Work(), "retried")
+
+    shared, retried = asyncio.run(main())
+    assert [type(error) for error in shared] == [ValueError, ValueError]
+    assert retried == ({"value": "retried"}, None)
+
+
+def test_remembered_results_respect_fresh_and_keep():
+    work = Work(0)
+    flights = SingleFlight(remember=2)
+
+    async def main():
+        await flights.do([("k", "a")], work, "first")
+        remembered = await flights.do([("k", "a")], work, "second")
+        fresh = await flights.do([("k", "a")], work, "third", fresh=True)
+        await flights.do([("k", "b")], work, "failed", keep=lambda result: result["value"] != "failed")
+        not_kept = await flights.do([("k", "b")], work, "again")
+        return remembered, fresh, not_kept
+
+    remembered, fresh, not_kept = asyncio.run(main())
+    assert remembered == ({"value": "first"}, ("k", "a"))
+    assert fresh == ({"value": "third"}, None)
+    assert not_kept == ({"value": "again"}, None)
+
+
+def test_only_the_last_results_are_remembered():
+    work = Work(0)
+    flights = SingleFlight(remember=2)
+
+    async def main():
+        for value in "abc":
+            await flights.do([("k", value)], work, value)
+        return await flights.do([("k", "a")], work, "a again")
+
+    assert asyncio.run(main()) == ({"value": "a again"}, None)
@@ -0,0 +1,26 @@
+import pytest
+
+from scripts.scraping.text_extractor import extract_page, extract_text
+
+
+@pytest.mark.parametrize("html, text", [
+    ("<div><span hidden>foo</div>bar", "bar"),
+    ("<div><i style=display:none aria-hidden=true>foo</div>bar", "bar"),
+    ("<ul><li hidden>secret<li>shown</ul>after", "shown after"),
+    ("<p hidden>secret<p>visible<svg><text>icon</text></svg> after svg", "visible after svg"),
+    ("<table><tr><td hidden>secret<td>cell</table>after", "cell after"),
+    ("<div hidden><p>one<p>two</div>after", "after"),
+    ("<div hidden>a<span>b</p>c</div>d", "d"),
+])
+def test_hidden_subtrees_end_where_the_browser_ends_them(html, text):
+    assert extract_text(html) == text
+
+
+def test_skipped_elements_and_boilerplate():
+    html = ("<html><head><title>Shop</title><script>var x = '<p>';</script></head><body>"
+            "<nav>Home About</nav><div class='cookie-banner'>We use cookies</div>"
+            "<h1>Fresh bread</h1><p>Baked daily.</p></body></html>")
+    page = extract_page(html)
+    assert page["title"] == "Shop"
+    assert page["headings"] == ["Fresh bread"]
+    assert page["text"] == "Fresh bread Baked daily."
@@ -0,0 +1,54 @@
+import json
+import os
+import pytest
+
+pytest.importorskip("tldextract")
+
+from scripts.categorizing.url_type import RULE_HITS, UrlRuleEngine
+
+SHIPPED_RULES = os.path.join(os.path.dirname(__file__), os.pardir, "scripts", "categorizing", "url_rules.json")
+
+RULES = {
+    "allow": {"mail.example.com": "Web e-mail"},
+    "deny": ["newsmail.com"],
+    "rules": [
+        {"name": "government-suffix", "category": "Government", "suffix": ["gov", "ac.*"]},
+        {"name": "webmail-host", "category": "Web e-mail", "subdomain": ["mail"]},
+        {"name": "news-domain", "category": "News", "domain_contains": ["news"]},
+    ],
+}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES))
+    return UrlRuleEngine(str(path))
+
+
+@pytest.mark.parametrize("url, match", [
+    ("https://mail.example.com/inbox", ("Web e-mail", "allow:mail.example.com")),
+    ("www.tax.gov", ("Government", "government-suffix")),
+    ("www.gov.uk", ("Government", "government-suffix")),
+    ("cs.ox.ac.uk", ("Government", "government-suffix")),
+    ("webmail.mail.other.com", ("Web e-mail", "webmail-host")),
+    ("dailynews.com", ("News", "news-domain")),
+    ("mailchimp.com", None),
+    ("newsmail.com", None),
+])
+def test_rules_match_parts_of_the_host(engine, url, match):
+    assert engine.match(url) == match
+
+
+def test_hits_are_counted_and_exported(engine):
+    engine.check_urls(["dailynews.com", "morenews.com", "plain.com"])
+    assert engine.stats()["checked"] == 3
+    assert engine.stats()["rules"] == [{"rule": "news-domain", "hits": 2, "hit_rate": 0.6667}]
+    exported = {key: value for _, key, _, value in RULE_HITS.samples()}
+    assert exported[("news-domain",)] >= 2
+
+
+def test_shipped_rules_only_allow_yandex_mail():
+    engine = UrlRuleEngine(SHIPPED_RULES)
+    assert engine.match("mail.yandex.ru") == ("Web e-mail", "allow:mail.yandex.ru")
+    assert engine.match("yandex.ru") is None
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("tldextract")
+
+from scripts.common.urls import normalize_url
+
+
+@pytest.mark.parametrize("site", ["http://www.Example.com/", "https://example.com", "example.com", "example.com:443"])
+def test_normalize_url_drops_scheme_www_and_default_port(site):
+    assert normalize_url(site) == "example.com"
+
+
+def test_normalize_url_keeps_path_query_and_other_ports():
+    assert normalize_url("https://example.com:8080/shop/?q=1") == "example.com:8080/shop?q=1"
+
+
+@pytest.mark.parametrize("site, key", [
+    ("example.com:abc", "example.com:abc"),
+    ("http://user@www.Example.com:99999/", "example.com:99999"),
+    ("[::1", "[::1"),
+])
+def test_normalize_url_tolerates_malformed_sites(site, key):
+    assert normalize_url(site) == key